@@ -2,7 +2,6 @@
 
 from __future__ import annotations
 
-import copy
 import json
 import os
 import threading
@@ -52,40 +51,27 @@ def person_snapshot(tree, person_id: str) -> dict[str, Any] | None:
         )
     relationships.sort(key=lambda item: (item["source"], item["target"]))
     return {
-        "attributes": _json_value(dict(tree.graph.nodes[person_id])),
+        "attributes": _json_value(dict(tree.get_person(person_id))),
         "relationships": relationships,
     }
 
 
-def relationship_snapshot(
-    tree,
-    source: str,
-    target: str,
-    *,
-    include_reverse: bool = False,
-) -> dict[str, Any] | None:
-    if not tree.graph.has_edge(source, target):
+def relationship_snapshot(tree, source: str, target: str) -> dict[str, Any] | None:
+    # A symmetric relationship is stored once and found from either person
+    pair = tree.find_relationship(source, target)
+    if pair is None:
         return None
-    relationship_type = tree.graph[source][target].get("type")
-    edges = []
-    edge_pairs = [(source, target)]
-    if include_reverse:
-        edge_pairs.append((target, source))
-    for edge_source, edge_target in edge_pairs:
-        if not tree.graph.has_edge(edge_source, edge_target):
-            continue
-        attributes = dict(tree.graph[edge_source][edge_target])
-        if attributes.get("type") != relationship_type:
-            continue
-        edges.append(
+    edge_source, edge_target = pair
+    attributes = dict(tree.graph[edge_source][edge_target])
+    return {
+        "edges": [
             {
                 "source": edge_source,
                 "target": edge_target,
                 "attributes": _json_value(attributes),
             }
-        )
-    edges.sort(key=lambda item: (item["source"], item["target"]))
-    return {"edges": edges}
+        ]
+    }
 
 
 def entity_snapshot(
@@ -95,17 +81,11 @@ def entity_snapshot(
     *,
     source: str | None = None,
     target: str | None = None,
-    include_reverse: bool = False,
 ) -> dict[str, Any] | None:
     if entity_type == "person":
         return person_snapshot(tree, entity_id)
     if entity_type == "relationship" and source and target:
-        return relationship_snapshot(
-            tree,
-            source,
-            target,
-            include_reverse=include_reverse,
-        )
+        return relationship_snapshot(tree, source, target)
     raise ValueError(f"Unsupported history entity type: {entity_type}")
 
 
@@ -189,6 +169,23 @@ class ChangeHistoryStore:
                 records.append(json.loads(line))
         return records
 
+    def truncate(self) -> None:
+        """Discard every stored record, e.g. once a checkpoint has absorbed them."""
+        with self._lock:
+            if self.backend == "local":
+                if not self.local_file:
+                    raise ValueError("Local history file is not configured")
+                path = Path(self.local_file)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with path.open("w", encoding="utf-8") as handle:
+                    handle.flush()
+                    os.fsync(handle.fileno())
+            elif self.backend == "azstorage":
+                # Creating an append blob replaces any existing content
+                self._append_blob_client().create_append_blob()
+            else:
+                raise ValueError(f"Unsupported history backend: {self.backend}")
+
     def get(self, revision_id: str) -> dict[str, Any]:
         for record in self.list():
             if record["id"] == revision_id:
@@ -230,10 +227,8 @@ def apply_audited_change(
     mutation: Callable[[], Any],
     source: str | None = None,
     target: str | None = None,
-    include_reverse: bool = False,
     metadata: dict[str, Any] | None = None,
 ) -> tuple[Any, dict[str, Any]]:
-    original_graph = copy.deepcopy(tree.graph)
     previous_autosave = tree.autosave
     before = entity_snapshot(
         tree,
@@ -241,51 +236,56 @@ def apply_audited_change(
         entity_id,
         source=source,
         target=target,
-        include_reverse=include_reverse,
     )
     try:
         tree.autosave = False
-        result = mutation()
-        after = entity_snapshot(
-            tree,
-            entity_type,
-            entity_id,
-            source=source,
-            target=target,
-            include_reverse=include_reverse,
-        )
+        # Only the mutation and its snapshot hold the tree lock; the mutation is undone if either fails
+        with tree.transaction() as change:
+            result = mutation()
+            after = entity_snapshot(
+                tree,
+                entity_type,
+                entity_id,
+                source=source,
+                target=target,
+            )
+    finally:
+        tree.autosave = previous_autosave
+    record = new_record(
+        actor=actor,
+        operation=operation,
+        entity_type=entity_type,
+        entity_id=entity_id,
+        before=before,
+        after=after,
+        metadata=metadata,
+    )
+    # Saving and appending the history record can be slow, so readers are not kept waiting for them
+    saved = False
+    try:
         if previous_autosave:
             tree.save()
-        record = new_record(
-            actor=actor,
-            operation=operation,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            before=before,
-            after=after,
-            metadata=metadata,
-        )
-        try:
-            store.append(record)
-        except Exception:
-            tree.graph = original_graph
-            if previous_autosave:
-                tree.save()
-            raise
-        return result, record
+            saved = True
+        store.append(record)
     except Exception:
-        tree.graph = original_graph
+        # Undo the change, unless the entity was changed again meanwhile and that change builds on this one
+        undone = change.undo(
+            unless_changed=lambda: entity_snapshot(tree, entity_type, entity_id, source=source, target=target) != after
+        )
+        if undone and saved:
+            # The change was already saved, so save the rolled back state as well
+            tree.save()
         raise
-    finally:
-        tree.autosave = previous_autosave
+    return result, record
 
 
 def _restore_person(tree, person_id: str, state: dict[str, Any] | None) -> None:
+    # Mutations go through the tree's record primitive so journals and row stores see them
     if person_id in tree.graph:
-        tree.graph.remove_node(person_id)
+        tree._apply({"op": "remove_node", "id": person_id})
     if state is None:
         return
-    tree.graph.add_node(person_id, **copy.deepcopy(state["attributes"]))
+    tree._apply({"op": "add_node", "id": person_id, "attrs": state["attributes"]})
     for relationship in state["relationships"]:
         source = relationship["source"]
         target = relationship["target"]
@@ -293,10 +293,8 @@ def _restore_person(tree, person_id: str, state: dict[str, Any] | None) -> None:
             raise HistoryConflictError(
                 "A related person changed or was deleted after this revision"
             )
-        tree.graph.add_edge(
-            source,
-            target,
-            **copy.deepcopy(relationship["attributes"]),
+        tree._apply(
+            {"op": "add_edge", "source": source, "target": target, "attrs": relationship["attributes"]}
         )
 
 
@@ -305,32 +303,20 @@ def _restore_relationship(
     source: str,
     target: str,
     state: dict[str, Any] | None,
-    *,
-    include_reverse: bool,
 ) -> None:
-    relationship_type = None
-    if tree.graph.has_edge(source, target):
-        relationship_type = tree.graph[source][target].get("type")
-    edge_pairs = [(source, target)]
-    if include_reverse:
-        edge_pairs.append((target, source))
-    for edge_source, edge_target in edge_pairs:
-        if not tree.graph.has_edge(edge_source, edge_target):
-            continue
-        if (
-            relationship_type is None
-            or tree.graph[edge_source][edge_target].get("type") == relationship_type
-        ):
-            tree.graph.remove_edge(edge_source, edge_target)
+    pair = tree.find_relationship(source, target)
+    if pair is not None:
+        tree._apply({"op": "remove_edge", "source": pair[0], "target": pair[1]})
     if state is None:
         return
     for edge in state["edges"]:
         if edge["source"] not in tree.graph or edge["target"] not in tree.graph:
             raise HistoryConflictError("A related person was deleted after this revision")
-        tree.graph.add_edge(
-            edge["source"],
-            edge["target"],
-            **copy.deepcopy(edge["attributes"]),
+        # Revisions from before symmetric relationships were stored once hold both directions
+        if tree.find_relationship(edge["source"], edge["target"]) is not None:
+            continue
+        tree._apply(
+            {"op": "add_edge", "source": edge["source"], "target": edge["target"], "attrs": edge["attributes"]}
         )
 
 
@@ -355,14 +341,12 @@ def rollback_revision(
     metadata = revision.get("metadata", {})
     source = metadata.get("source")
     target = metadata.get("target")
-    include_reverse = bool(metadata.get("include_reverse"))
     current = entity_snapshot(
         tree,
         revision["entity_type"],
         revision["entity_id"],
         source=source,
         target=target,
-        include_reverse=include_reverse,
     )
     if current != revision["after"]:
         raise HistoryConflictError(
@@ -373,13 +357,7 @@ def rollback_revision(
         if revision["entity_type"] == "person":
             _restore_person(tree, revision["entity_id"], revision["before"])
         elif revision["entity_type"] == "relationship" and source and target:
-            _restore_relationship(
-                tree,
-                source,
-                target,
-                revision["before"],
-                include_reverse=include_reverse,
-            )
+            _restore_relationship(tree, source, target, revision["before"])
         else:
             raise ValueError("Revision does not contain rollback metadata")
 
@@ -393,12 +371,10 @@ def rollback_revision(
         mutation=restore,
         source=source,
         target=target,
-        include_reverse=include_reverse,
         metadata={
             "rollback_of": revision["id"],
             "source": source,
             "target": target,
-            "include_reverse": include_reverse,
         },
     )
     return compensation
@@ -31,12 +31,41 @@ _tree_instance: FamilyTree | None = None
 _history_instance: ChangeHistoryStore | None = None
 
 
+def get_journal_store() -> ChangeHistoryStore | None:
+    """Return the write-ahead journal for the tree, or None when TREE_JOURNAL is disabled."""
+    if os.getenv("TREE_JOURNAL", "").lower() not in ("true", "1", "yes"):
+        return None
+    backend = os.getenv("TREE_BACKEND", "local")
+    if backend == "azstorage":
+        graph_blob = os.getenv("AZURE_STORAGE_BLOB", "familytree.gml")
+        return ChangeHistoryStore(
+            backend="azstorage",
+            account=os.getenv("AZURE_STORAGE_ACCOUNT"),
+            key=os.getenv("AZURE_STORAGE_KEY"),
+            container=os.getenv("AZURE_STORAGE_CONTAINER", "familytreejson"),
+            blob=os.getenv("AZURE_JOURNAL_BLOB", f"{graph_blob}.journal.jsonl"),
+        )
+    graph_file = os.getenv("TREE_LOCAL_FILE", "familytree.gml")
+    return ChangeHistoryStore(
+        backend="local",
+        local_file=os.getenv("TREE_JOURNAL_FILE", f"{graph_file}.journal.jsonl"),
+    )
+
+
 def get_tree() -> FamilyTree:
     """Return the singleton FamilyTree instance, creating it on first call."""
     global _tree_instance
-    if _tree_instance is None:
+    if _tree_instance is not None:
+        # Pick up changes other instances made to the shared blob (throttled inside revalidate)
+        _tree_instance.revalidate()
+    else:
         backend = os.getenv("TREE_BACKEND", "local")
         schema = get_relationship_schema()
+        journal = get_journal_store()
+        checkpoint_interval = int(os.getenv("TREE_CHECKPOINT_INTERVAL", "500"))
+        write_behind = os.getenv("TREE_WRITE_BEHIND", "").lower() in ("true", "1", "yes")
+        flush_interval = float(os.getenv("TREE_FLUSH_INTERVAL", "5"))
+        lazy_attributes = os.getenv("TREE_LAZY_ATTRIBUTES", "").lower() in ("true", "1", "yes")
         if backend == "azstorage":
             _tree_instance = FamilyTree(
                 backend="azstorage",
@@ -45,6 +74,21 @@ def get_tree() -> FamilyTree:
                 azstorage_container=os.getenv("AZURE_STORAGE_CONTAINER", "familytreejson"),
                 azstorage_blob=os.getenv("AZURE_STORAGE_BLOB", "familytree.gml"),
                 relationship_schema=schema,
+                journal=journal,
+                checkpoint_interval=checkpoint_interval,
+                write_behind=write_behind,
+                flush_interval=flush_interval,
+                cache_dir=os.getenv("TREE_CACHE_DIR") or None,
+                revalidate_interval=float(os.getenv("TREE_REVALIDATE_INTERVAL", "60")),
+                content_encoding=os.getenv("TREE_CONTENT_ENCODING") or None,
+                lazy_attributes=lazy_attributes,
+            )
+        elif backend == "sqlite":
+            # Every mutation is written to its own rows, so no journal is needed
+            _tree_instance = FamilyTree(
+                backend="sqlite",
+                sqlite_file=os.getenv("TREE_SQLITE_FILE", "familytree.db"),
+                relationship_schema=schema,
             )
         else:
             local_path = os.getenv("TREE_LOCAL_FILE", "familytree.gml")
@@ -52,10 +96,23 @@ def get_tree() -> FamilyTree:
                 backend="local",
                 localfile=local_path,
                 relationship_schema=schema,
+                journal=journal,
+                checkpoint_interval=checkpoint_interval,
+                write_behind=write_behind,
+                flush_interval=flush_interval,
+                lazy_attributes=lazy_attributes,
             )
     return _tree_instance
 
 
+def close_tree() -> None:
+    """Write pending changes of the singleton tree and stop its background flusher."""
+    global _tree_instance
+    if _tree_instance is not None:
+        _tree_instance.close()
+        _tree_instance = None
+
+
 def get_history_store() -> ChangeHistoryStore:
     """Return the append-only change history store for the configured backend."""
     global _history_instance
@@ -1,27 +1,45 @@
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
+from backend.app.dependencies import close_tree
 from backend.app.routers import persons, relationships, graph, auth_router, geni, history
+from familytree import StorageConflictError
 
 APP_VERSION = "0.7.0"
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Flush changes still held by the write-behind saver before the process exits
+    close_tree()
+
+
 app = FastAPI(
     title="Family Tree API",
     description="API for creating and browsing family trees",
     version=APP_VERSION,
+    lifespan=lifespan,
 )
 
 # Rate limiting
 app.state.limiter = auth_router.limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+
+@app.exception_handler(StorageConflictError)
+async def _storage_conflict_handler(request: Request, exc: StorageConflictError):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=os.getenv("CORS_ORIGINS", "http://localhost:3000").split(","),
@@ -80,6 +80,13 @@ class RelationshipResponse(BaseModel):
 class GraphResponse(BaseModel):
     nodes: list[dict[str, Any]]
     edges: list[dict[str, Any]]
+    truncated: bool = False
+
+
+class PathsResponse(GraphResponse):
+    distance: int | None
+    paths: int
+    truncated: bool
 
 
 class ImportGmlRequest(BaseModel):
@@ -12,7 +12,6 @@ from __future__ import annotations
 import io
 import math
 import random
-import sys
 from typing import Any
 
 import networkx as nx
@@ -20,6 +19,8 @@ from PIL import Image, ImageDraw, ImageFilter, ImageFont
 
 from backend.app.renderers.base import ImageRenderer
 from backend.app.renderers.registry import RendererRegistry
+from tree_indexes import TypedAdjacency
+from tree_traversal import generation_offsets, preorder
 
 # ---------------------------------------------------------------------------
 # Colour palettes  (sepia / antique tones)
@@ -252,83 +253,52 @@ def _draw_portrait_frame(
 # Level assignment helpers (ported from FamilyTree.generate_image)
 # ---------------------------------------------------------------------------
 
-def _assign_vlevels(graph: nx.DiGraph) -> tuple[nx.DiGraph, list[int] | None]:
-    """Assign vertical (generation) levels via recursive traversal."""
-
-    def _walk(node_id: str, vlevel: int) -> None:
-        graph.nodes[node_id]["vlevel"] = vlevel
-        for neighbor in graph.successors(node_id):
-            edge_type = graph[node_id][neighbor].get("type")
-            if "vlevel" in graph.nodes[neighbor]:
-                continue
-            if edge_type == "isChildOf":
-                _walk(neighbor, vlevel - 1)
-            elif edge_type == "isSpouseOf":
-                _walk(neighbor, vlevel)
-        for neighbor in graph.predecessors(node_id):
-            edge_type = graph[neighbor][node_id].get("type")
-            if "vlevel" in graph.nodes[neighbor]:
-                continue
-            if edge_type == "isChildOf":
-                _walk(neighbor, vlevel + 1)
-            elif edge_type == "isSpouseOf":
-                _walk(neighbor, vlevel)
-
+def _assign_vlevels(
+    graph: nx.DiGraph, adjacency: TypedAdjacency | None = None
+) -> tuple[nx.DiGraph, list[int] | None]:
+    """Assign vertical (generation) levels with a breadth-first walk."""
     if len(graph) == 0:
         return graph, None
 
-    old_limit = sys.getrecursionlimit()
-    sys.setrecursionlimit(max(old_limit, len(graph) * 4 + 1000))
-    try:
-        _walk(list(graph.nodes)[0], 0)
-    finally:
-        sys.setrecursionlimit(old_limit)
-
-    vlevels_vals = [d["vlevel"] for _, d in graph.nodes(data=True) if "vlevel" in d]
-    min_v = min(vlevels_vals)
-    if min_v != 0:
-        for n in graph.nodes():
-            if "vlevel" in graph.nodes[n]:
-                graph.nodes[n]["vlevel"] -= min_v
-    min_v = min(d["vlevel"] for _, d in graph.nodes(data=True) if "vlevel" in d)
-    max_v = max(d["vlevel"] for _, d in graph.nodes(data=True) if "vlevel" in d)
-    return graph, [min_v, max_v]
+    offsets = generation_offsets(graph, next(iter(graph.nodes)), adjacency=adjacency)
+    min_v = min(offsets.values())
+    for node_id, offset in offsets.items():
+        graph.nodes[node_id]["vlevel"] = offset - min_v
+    return graph, [0, max(offsets.values()) - min_v]
 
 
 def _assign_hlevels(
-    graph: nx.DiGraph, vlevels: list[int]
+    graph: nx.DiGraph, vlevels: list[int], adjacency: TypedAdjacency | None = None
 ) -> tuple[nx.DiGraph, list[int]]:
     """Assign horizontal positions within each generation level."""
+    if adjacency is None:
+        adjacency = TypedAdjacency(graph)
 
-    def _walk(node_id: str, hlevels: list[int]) -> list[int]:
+    def _place(node_id: str, hlevels: list[int]) -> None:
         if "hlevel" not in graph.nodes[node_id]:
             vl = graph.nodes[node_id]["vlevel"]
             graph.nodes[node_id]["hlevel"] = hlevels[vl]
             hlevels[vl] += 1
-        for neighbor in graph.successors(node_id):
-            if graph[node_id][neighbor].get("type") == "isSpouseOf":
-                if "hlevel" not in graph.nodes[neighbor]:
-                    vl = graph.nodes[neighbor]["vlevel"]
-                    graph.nodes[neighbor]["hlevel"] = hlevels[vl]
-                    hlevels[vl] += 1
-        for neighbor in graph.predecessors(node_id):
-            if graph[neighbor][node_id].get("type") == "isChildOf":
-                if "hlevel" not in graph.nodes[neighbor]:
-                    hlevels = _walk(neighbor, hlevels)
-        return hlevels
+        for neighbor in adjacency.spouses(node_id):
+            if "hlevel" not in graph.nodes[neighbor]:
+                vl = graph.nodes[neighbor]["vlevel"]
+                graph.nodes[neighbor]["hlevel"] = hlevels[vl]
+                hlevels[vl] += 1
+
+    def _unplaced_children(node_id: str):
+        # Checked lazily: an older sibling's family may already have placed a child
+        for child in adjacency.children(node_id):
+            if "hlevel" not in graph.nodes[child]:
+                yield child
 
     num_levels = vlevels[1] - vlevels[0] + 1
     hlevels = [0] * num_levels
 
-    old_limit = sys.getrecursionlimit()
-    sys.setrecursionlimit(max(old_limit, len(graph) * 4 + 1000))
-    try:
-        for vl in range(vlevels[0], vlevels[1] + 1):
-            persons = [n for n, d in graph.nodes(data=True) if d.get("vlevel") == vl]
-            for p in persons:
-                hlevels = _walk(p, hlevels)
-    finally:
-        sys.setrecursionlimit(old_limit)
+    for vl in range(vlevels[0], vlevels[1] + 1):
+        persons = [n for n, d in graph.nodes(data=True) if d.get("vlevel") == vl]
+        for p in persons:
+            for node_id in preorder(p, _unplaced_children):
+                _place(node_id, hlevels)
 
     hlevels = [max(h - 1, 0) for h in hlevels]
     return graph, hlevels
@@ -367,12 +337,14 @@ class ClassicalTreeRenderer(ImageRenderer):
             )
 
         # --- level assignment ---
-        G, vlevels = _assign_vlevels(G)
+        # Parents, children and spouses are listed once; the layout only changes person attributes
+        adjacency = TypedAdjacency(G)
+        G, vlevels = _assign_vlevels(G, adjacency)
         if vlevels is None:
             return self._to_png_bytes(
                 _make_parchment(canvas_w, canvas_h, palette)
             )
-        G, hlevels = _assign_hlevels(G, vlevels)
+        G, hlevels = _assign_hlevels(G, vlevels, adjacency)
 
         # --- dynamic sizing based on density ---
         border = 0.07
@@ -415,7 +387,7 @@ class ClassicalTreeRenderer(ImageRenderer):
             G.nodes[pid]["cy"] = cy
             G.nodes[pid]["slot_w"] = hlevel_w
 
-        self._adjust_spouses(G, node_radius)
+        self._adjust_spouses(G, node_radius, adjacency)
 
         # --- spouse-aware hlevel for line colouring ---
         for vl in range(vlevels[0], vlevels[1] + 1):
@@ -427,9 +399,8 @@ class ClassicalTreeRenderer(ImageRenderer):
             for p in persons:
                 G.nodes[p]["hlevel_spouse"] = sp_idx
                 is_left_spouse = any(
-                    G[p][nb].get("type") == "isSpouseOf"
-                    and G.nodes[nb].get("hlevel", 0) > G.nodes[p].get("hlevel", 0)
-                    for nb in G.successors(p)
+                    G.nodes[nb].get("hlevel", 0) > G.nodes[p].get("hlevel", 0)
+                    for nb in adjacency.spouses(p)
                 )
                 if not is_left_spouse:
                     sp_idx += 1
@@ -455,14 +426,14 @@ class ClassicalTreeRenderer(ImageRenderer):
         return buf.read()
 
     @staticmethod
-    def _adjust_spouses(G: nx.DiGraph, radius: int) -> None:
+    def _adjust_spouses(G: nx.DiGraph, radius: int, adjacency: TypedAdjacency) -> None:
         """Move spouses closer together so they appear as a couple."""
         seen: set[str] = set()
         for pid in list(G.nodes):
             if pid in seen:
                 continue
-            for nb in G.successors(pid):
-                if G[pid][nb].get("type") != "isSpouseOf" or nb in seen:
+            for nb in adjacency.spouses(pid):
+                if nb in seen:
                     continue
                 cx1 = G.nodes[pid]["cx"]
                 cx2 = G.nodes[nb]["cx"]
@@ -16,6 +16,8 @@ from PIL import Image, ImageDraw, ImageFont
 
 from backend.app.renderers.base import ImageRenderer
 from backend.app.renderers.registry import RendererRegistry
+from tree_indexes import TypedAdjacency
+from tree_traversal import preorder
 
 # ── colours ─────────────────────────────────────────────────────────────────
 _BRANCH_HUES = [270, 315, 178, 152]
@@ -47,24 +49,16 @@ def _display_name(nd: dict) -> str:
 
 # ── graph helpers ───────────────────────────────────────────────────────────
 
-def _get_parents(graph: nx.DiGraph, person: Any) -> list[Any]:
-    return [s for s in graph.successors(person)
-            if graph[person][s].get("type") == "isChildOf"]
+def _get_parents(adjacency: TypedAdjacency, person: Any) -> list[Any]:
+    return adjacency.parents(person)
 
 
-def _get_children(graph: nx.DiGraph, person: Any) -> list[Any]:
-    return [p for p in graph.predecessors(person)
-            if graph[p][person].get("type") == "isChildOf"]
+def _get_children(adjacency: TypedAdjacency, person: Any) -> list[Any]:
+    return adjacency.children(person)
 
 
-def _get_spouse(graph: nx.DiGraph, person: Any) -> Any | None:
-    for u, v, d in graph.edges(data=True):
-        if d.get("type") == "isSpouseOf":
-            if u == person:
-                return v
-            if v == person:
-                return u
-    return None
+def _get_spouse(adjacency: TypedAdjacency, person: Any) -> Any | None:
+    return next(iter(adjacency.spouses(person)), None)
 
 
 # ── geometry ────────────────────────────────────────────────────────────────
@@ -113,34 +107,71 @@ def _compute_level_fonts(
 
 # ── fan builders ────────────────────────────────────────────────────────────
 
-def _build_ancestor_fan(graph, person, level, a0, a1, branch, out, max_lvl=10):
-    if level > max_lvl:
-        return
-    parents = _get_parents(graph, person)
-    if not parents:
-        return
+def _ancestor_segments(adjacency, segment, max_lvl):
+    person, level, a0, a1, branch = segment
+    if level >= max_lvl:
+        return []
     mid = (a0 + a1) / 2
-    out.append((parents[0], level, a0, mid, branch))
-    _build_ancestor_fan(graph, parents[0], level + 1, a0, mid, branch, out, max_lvl)
-    if len(parents) >= 2:
-        out.append((parents[1], level, mid, a1, branch))
-        _build_ancestor_fan(graph, parents[1], level + 1, mid, a1, branch, out, max_lvl)
+    spans = ((a0, mid), (mid, a1))
+    return [(parent, level + 1, s0, s1, branch)
+            for parent, (s0, s1) in zip(_get_parents(adjacency, person), spans)]
+
+
+def _split_arc(a0, a1, child_ids, descendant_counts=None):
+    """Split the arc from *a0* to *a1* between children, in proportion to their descendants if counts are given."""
+    counts = descendant_counts or {}
+    weights = [1 + counts.get(child, 0) for child in child_ids]
+    total = sum(weights)
+    spans = []
+    start = a0
+    for weight in weights:
+        end = start + (a1 - a0) * weight / total
+        spans.append((start, end))
+        start = end
+    return spans
+
+
+def _descendant_segments(adjacency, segment, max_lvl, descendant_counts=None):
+    person, level, a0, a1, branch = segment
+    if level >= max_lvl:
+        return []
+    child_ids = _get_children(adjacency, person)
+    if not child_ids:
+        return []
+    segments = []
+    for i, (child, (c0, c1)) in enumerate(zip(child_ids, _split_arc(a0, a1, child_ids, descendant_counts))):
+        # Assign branch index from the root-level child
+        br = branch if level + 1 > 1 else i % len(_BRANCH_HUES)
+        segments.append((child, level + 1, c0, c1, br))
+    return segments
 
 
-def _build_descendant_fan(graph, person, level, a0, a1, branch, out, max_lvl=10):
-    if level > max_lvl:
-        return
-    children = _get_children(graph, person)
-    if not children:
-        return
-    arc_each = (a1 - a0) / len(children)
-    for i, child in enumerate(children):
-        c0 = a0 + i * arc_each
-        c1 = c0 + arc_each
-        # Assign branch index from the root-level child
-        br = branch if level > 1 else i % len(_BRANCH_HUES)
-        out.append((child, level, c0, c1, br))
-        _build_descendant_fan(graph, child, level + 1, c0, c1, br, out, max_lvl)
+def _build_ancestor_fan(graph, person, level, a0, a1, branch, out, max_lvl=10, adjacency=None):
+    """Append the wedges of *person*'s ancestors from *level* outwards to *out*.
+
+    *adjacency* is a ``TypedAdjacency`` of *graph* shared between fans, built here if not given.
+    """
+    if adjacency is None:
+        adjacency = TypedAdjacency(graph)
+    walk = preorder((person, level - 1, a0, a1, branch),
+                    lambda segment: _ancestor_segments(adjacency, segment, max_lvl))
+    next(walk)  # *person* itself is drawn by the caller
+    out.extend(walk)
+
+
+def _build_descendant_fan(graph, person, level, a0, a1, branch, out, max_lvl=10, descendant_counts=None, adjacency=None):
+    """Append the wedges of *person*'s descendants from *level* outwards to *out*.
+
+    With *descendant_counts* (person id to number of descendants), each
+    child's wedge is proportional to their line rather than an equal share.
+    *adjacency* is as for :func:`_build_ancestor_fan`.
+    """
+    if adjacency is None:
+        adjacency = TypedAdjacency(graph)
+    walk = preorder((person, level - 1, a0, a1, branch),
+                    lambda segment: _descendant_segments(adjacency, segment, max_lvl, descendant_counts))
+    next(walk)
+    out.extend(walk)
 
 
 # ── text rendering ──────────────────────────────────────────────────────────
@@ -330,43 +361,44 @@ class RadialAncestorRenderer(ImageRenderer):
         opts = options or {}
         size = int(opts.get("canvas_width", 1800))
 
-        root = self._resolve_root(subgraph, opts)
-        spouse = _get_spouse(subgraph, root)
+        adjacency = TypedAdjacency(subgraph)
+        root = self._resolve_root(subgraph, opts, adjacency)
+        spouse = _get_spouse(adjacency, root)
 
         segments: list[tuple] = []
         if spouse and spouse in subgraph.nodes:
-            rp = _get_parents(subgraph, root)
-            sp = _get_parents(subgraph, spouse)
+            rp = _get_parents(adjacency, root)
+            sp = _get_parents(adjacency, spouse)
             if len(rp) >= 1:
                 segments.append((rp[0], 1, math.pi / 2, math.pi, 0))
-                _build_ancestor_fan(subgraph, rp[0], 2, math.pi / 2, math.pi, 0, segments)
+                _build_ancestor_fan(subgraph, rp[0], 2, math.pi / 2, math.pi, 0, segments, adjacency=adjacency)
             if len(rp) >= 2:
                 segments.append((rp[1], 1, 0, math.pi / 2, 1))
-                _build_ancestor_fan(subgraph, rp[1], 2, 0, math.pi / 2, 1, segments)
+                _build_ancestor_fan(subgraph, rp[1], 2, 0, math.pi / 2, 1, segments, adjacency=adjacency)
             if len(sp) >= 1:
                 segments.append((sp[0], 1, -math.pi / 2, 0, 2))
-                _build_ancestor_fan(subgraph, sp[0], 2, -math.pi / 2, 0, 2, segments)
+                _build_ancestor_fan(subgraph, sp[0], 2, -math.pi / 2, 0, 2, segments, adjacency=adjacency)
             if len(sp) >= 2:
                 segments.append((sp[1], 1, -math.pi, -math.pi / 2, 3))
-                _build_ancestor_fan(subgraph, sp[1], 2, -math.pi, -math.pi / 2, 3, segments)
+                _build_ancestor_fan(subgraph, sp[1], 2, -math.pi, -math.pi / 2, 3, segments, adjacency=adjacency)
         else:
-            rp = _get_parents(subgraph, root)
+            rp = _get_parents(adjacency, root)
             if len(rp) >= 1:
                 segments.append((rp[0], 1, 0, math.pi, 0))
-                _build_ancestor_fan(subgraph, rp[0], 2, 0, math.pi, 0, segments)
+                _build_ancestor_fan(subgraph, rp[0], 2, 0, math.pi, 0, segments, adjacency=adjacency)
             if len(rp) >= 2:
                 segments.append((rp[1], 1, -math.pi, 0, 1))
-                _build_ancestor_fan(subgraph, rp[1], 2, -math.pi, 0, 1, segments)
+                _build_ancestor_fan(subgraph, rp[1], 2, -math.pi, 0, 1, segments, adjacency=adjacency)
 
         return _render_fan_chart(subgraph, segments, root, spouse, size, size)
 
     @staticmethod
-    def _resolve_root(subgraph, opts):
+    def _resolve_root(subgraph, opts, adjacency):
         root_id = opts.get("root_id")
         if root_id and root_id in subgraph.nodes:
             return root_id
         for n in subgraph.nodes:
-            if not _get_parents(subgraph, n):
+            if not _get_parents(adjacency, n):
                 return n
         return next(iter(subgraph.nodes))
 
@@ -380,33 +412,34 @@ class RadialDescendantRenderer(ImageRenderer):
     def render(self, subgraph: nx.DiGraph, options: dict[str, Any] | None = None) -> bytes:
         opts = options or {}
         size = int(opts.get("canvas_width", 1800))
+        descendant_counts = opts.get("descendant_counts")
 
-        root = self._resolve_root(subgraph, opts)
-        spouse = _get_spouse(subgraph, root)
+        adjacency = TypedAdjacency(subgraph)
+        root = self._resolve_root(subgraph, opts, adjacency)
+        spouse = _get_spouse(adjacency, root)
 
         segments: list[tuple] = []
-        children = _get_children(subgraph, root)
+        children = _get_children(adjacency, root)
         if not children and spouse and spouse in subgraph.nodes:
-            children = _get_children(subgraph, spouse)
+            children = _get_children(adjacency, spouse)
 
         if children:
-            arc_each = 2 * math.pi / len(children)
-            for i, child in enumerate(children):
-                a0 = -math.pi + i * arc_each
-                a1 = a0 + arc_each
+            spans = _split_arc(-math.pi, math.pi, children, descendant_counts)
+            for i, (child, (a0, a1)) in enumerate(zip(children, spans)):
                 br = i % len(_BRANCH_HUES)
                 segments.append((child, 1, a0, a1, br))
-                _build_descendant_fan(subgraph, child, 2, a0, a1, br, segments)
+                _build_descendant_fan(subgraph, child, 2, a0, a1, br, segments,
+                                      descendant_counts=descendant_counts, adjacency=adjacency)
 
         return _render_fan_chart(subgraph, segments, root, spouse, size, size)
 
     @staticmethod
-    def _resolve_root(subgraph, opts):
+    def _resolve_root(subgraph, opts, adjacency):
         root_id = opts.get("root_id")
         if root_id and root_id in subgraph.nodes:
             return root_id
         for n in subgraph.nodes:
-            if not _get_parents(subgraph, n):
+            if not _get_parents(adjacency, n):
                 return n
         return next(iter(subgraph.nodes))
 
@@ -4,9 +4,9 @@ import os
 import re
 from urllib.parse import urlparse
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.responses import Response
-from backend.app.models import GraphResponse, ImportGmlRequest
+from backend.app.models import GraphResponse, ImportGmlRequest, PathsResponse
 from backend.app.dependencies import get_tree, get_person_schema, get_relationship_schema
 from backend.app.renderers import RendererRegistry
 from backend.app.auth import require_auth
@@ -49,12 +49,54 @@ def get_graph(
     root_id: str | None = None,
     degree: int | None = None,
     include_inactive: bool = False,
+    max_nodes: int | None = Query(default=None, ge=1),
     tree=Depends(get_tree),
 ):
-    """Get graph data (nodes + edges), optionally filtered to a subgraph."""
+    """Get graph data (nodes + edges), optionally filtered to a subgraph.
+
+    With max_nodes, at most that many persons around root_id are returned: blood relatives first, then their
+    spouses, then in-laws, nearest first. Persons with relatives left out are marked ``truncated``.
+    """
     if root_id and not tree.get_person(root_id):
         raise HTTPException(status_code=404, detail=f"Person '{root_id}' not found")
-    return tree.format_for_api(root_id=root_id, degree=degree, include_inactive=include_inactive)
+    return tree.format_for_api(root_id=root_id, degree=degree, include_inactive=include_inactive, max_nodes=max_nodes)
+
+
+@router.get("/graph/between", response_model=PathsResponse)
+def get_graph_between(
+    a: str = Query(...),
+    b: str = Query(...),
+    blood_only: bool = False,
+    types: list[str] | None = Query(default=None),
+    include_inactive: bool = False,
+    max_paths: int = Query(default=100, ge=1, le=10000),
+    max_nodes: int = Query(default=100000, ge=1),
+    tree=Depends(get_tree),
+):
+    """Get the persons and relationships on the shortest paths between persons a and b."""
+    for person_id in (a, b):
+        if not tree.get_person(person_id):
+            raise HTTPException(status_code=404, detail=f"Person '{person_id}' not found")
+    if blood_only:
+        types = ["isChildOf"]
+    subgraph = tree.get_subgraph_between(
+        a, b, types=types, active_only=not include_inactive, max_paths=max_paths, max_nodes=max_nodes
+    )
+    return {
+        **tree.format_graph_for_api(subgraph, include_inactive=include_inactive),
+        "distance": subgraph.graph["distance"],
+        "paths": subgraph.graph["paths"],
+        "truncated": subgraph.graph["truncated"],
+    }
+
+
+@router.get("/relationship")
+def get_relationship(a: str = Query(...), b: str = Query(...), tree=Depends(get_tree)):
+    """How person b is related to person a by blood, with their nearest common ancestors and a path through one."""
+    for person_id in (a, b):
+        if not tree.get_person(person_id):
+            raise HTTPException(status_code=404, detail=f"Person '{person_id}' not found")
+    return {"a": a, "b": b, **tree.get_relationship_between(a, b)}
 
 
 @router.get("/schema/person")
@@ -128,19 +170,21 @@ def import_gml(body: ImportGmlRequest, tree=Depends(get_tree)):
         raise HTTPException(status_code=400, detail=f"Failed to load GML: {e}")
 
     # Merge the imported graph into the current tree
-    imported_count = 0
-    for node_id, data in source.graph.nodes(data=True):
-        if node_id not in tree.graph:
-            tree.graph.add_node(node_id, **data)
-            imported_count += 1
-    for src, tgt, data in source.graph.edges(data=True):
-        if not tree.graph.has_edge(src, tgt):
-            tree.graph.add_edge(src, tgt, **data)
-    tree.save()
+    imported_count = tree.merge_graph(source.graph)
 
     return {"imported_persons": imported_count, "total_persons": tree.graph.number_of_nodes()}
 
 
+@router.post("/tree/flush")
+def flush_tree(timeout: float = 30.0, tree=Depends(get_tree)):
+    """Wait until every accepted change has been written to storage."""
+    try:
+        tree.wait_until_durable(timeout=timeout)
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return {"durable": True}
+
+
 @router.get("/renderers")
 def list_renderers():
     """Return list of available image renderer names + descriptions."""
@@ -166,7 +210,8 @@ def generate_image(
         raise HTTPException(status_code=400, detail=f"Unknown renderer '{renderer}'. Available: {available}")
     if not tree.get_person(root_id):
         raise HTTPException(status_code=404, detail=f"Person '{root_id}' not found")
-    subgraph = tree.get_subgraph_degrees(root_id, degree=degree)
+    # Rendering takes a while and writes layout attributes, so it works on a copy detached from the live tree
+    subgraph = tree.detach_subgraph(tree.get_subgraph_degrees(root_id, degree=degree))
     sas = _get_sas_token()
     opts: dict = {
         "root_id": root_id,
@@ -178,5 +223,8 @@ def generate_image(
     }
     if sas:
         opts["azure_storage_sas"] = sas
+    if renderer == "radial_descendants":
+        # Wedges in proportion to the whole line below each child, not just the part in the subgraph
+        opts["descendant_counts"] = {node: tree.get_lineage_counts(node)["descendant_count"] for node in subgraph}
     image_bytes = r.render(subgraph, options=opts)
     return Response(content=image_bytes, media_type="image/png")
@@ -1,12 +1,15 @@
 """Person CRUD endpoints."""
 
+import json
 import os
 import uuid
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
 from backend.app.models import PersonCreate, PersonUpdate, PersonResponse
 from backend.app.change_history import ChangeHistoryStore, apply_audited_change
 from backend.app.dependencies import get_history_store, get_tree
 from backend.app.auth import require_auth
+from familytree import TreeChangedError
 from tree_validation import (
     TreeValidationError,
     enforce_issues,
@@ -84,9 +87,76 @@ def get_person(person_id: str, tree=Depends(get_tree)):
     data["fullname"] = (data.get("firstname", "") + " " + data.get("lastname", "")).strip()
     data["relationships"] = tree.get_relationships(person_id, include_inactive=True)
     data["siblings"] = tree.get_siblings(person_id)
+    data.update(tree.get_lineage_counts(person_id))
     return data
 
 
+def _lineage_page(tree, person_id: str, members: list, offset: int, limit: int) -> dict:
+    items = []
+    for node_id, generation, number in members[offset:offset + limit]:
+        data = tree.graph.nodes[node_id]
+        items.append({
+            "id": node_id,
+            "fullname": (data.get("firstname", "") + " " + data.get("lastname", "")).strip(),
+            "generation": generation,
+            "number": number,
+        })
+    return {"person_id": person_id, "total": len(members), "offset": offset, "limit": limit, "items": items}
+
+
+@router.get("/{person_id}/ancestors")
+def get_ancestors(
+    person_id: str,
+    max_generations: int | None = Query(default=None, ge=1),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=500),
+    tree=Depends(get_tree),
+):
+    """Ancestors by generation with Ahnentafel numbers (the person is 1, the father of n is 2n, the mother 2n+1)."""
+    if person_id not in tree.graph:
+        raise HTTPException(status_code=404, detail="Person not found")
+    members = tree.get_numbered_ancestors(person_id, max_generations)
+    return _lineage_page(tree, person_id, members, offset, limit)
+
+
+@router.get("/{person_id}/descendants")
+def get_descendants(
+    person_id: str,
+    max_generations: int | None = Query(default=None, ge=1),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=500),
+    tree=Depends(get_tree),
+):
+    """Descendants by generation with d'Aboville numbers (the children of 1.2 are 1.2.1, 1.2.2, ... by birth)."""
+    if person_id not in tree.graph:
+        raise HTTPException(status_code=404, detail="Person not found")
+    members = tree.get_numbered_descendants(person_id, max_generations)
+    return _lineage_page(tree, person_id, members, offset, limit)
+
+
+@router.get("/{person_id}/kinship")
+def get_kinship(person_id: str, tree=Depends(get_tree)):
+    """Everyone related to the person with their kinship label and generation offset, nearest first, as JSON lines.
+
+    A tree edited while the lines are being streamed ends them with a {"truncated": true} line.
+    """
+    if person_id not in tree.graph:
+        raise HTTPException(status_code=404, detail="Person not found")
+    entries = tree.iter_kinship(person_id)
+
+    def lines():
+        try:
+            for node_id, label, generation in entries:
+                data = tree.graph.nodes.get(node_id, {})
+                fullname = (data.get("firstname", "") + " " + data.get("lastname", "")).strip()
+                row = {"id": node_id, "fullname": fullname, "relationship": label, "generation": generation}
+                yield json.dumps(row) + "\n"
+        except TreeChangedError:
+            yield json.dumps({"truncated": True}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @router.post("", response_model=dict, status_code=201)
 def create_person(
     body: PersonCreate,
@@ -112,10 +182,9 @@ def create_person(
         person_id = str(uuid.uuid4())
 
     try:
-        staged_graph = tree.graph.copy()
+        staged_graph = tree.stage()
         staged_graph.add_node(person_id, **attrs)
         issues = validate_person_dates(attrs, person_id)
-        staged_relationships = []
         for relationship in body.relationships or []:
             if relationship.new_person_role == "source":
                 source, target = person_id, relationship.related_person_id
@@ -136,26 +205,8 @@ def create_person(
                     type=relationship.type,
                     start_date=relationship.start_date,
                 )
-            staged_relationships.append(
-                (source, target, relationship.type, relationship.start_date)
-            )
         enforce_issues(issues, override_warnings=body.override_warnings)
 
-        def add_person_and_relationships():
-            tree.add_person(
-                id=person_id,
-                override_warnings=True,
-                **attrs,
-            )
-            for source, target, relationship_type, start_date in staged_relationships:
-                tree.add_relationship(
-                    source,
-                    target,
-                    type=relationship_type,
-                    start_date=start_date,
-                    override_warnings=True,
-                )
-
         _, revision = apply_audited_change(
             tree=tree,
             store=history,
@@ -163,7 +214,7 @@ def create_person(
             operation="create",
             entity_type="person",
             entity_id=person_id,
-            mutation=add_person_and_relationships,
+            mutation=lambda: staged_graph.commit(tree),
         )
     except TreeValidationError as exc:
         raise HTTPException(status_code=422, detail=exc.to_detail()) from exc
@@ -432,7 +483,7 @@ class _NoteDelete(_BaseModel):
 
 def _get_notes(tree, person_id: str) -> list[dict]:
     """Parse the notes JSON string from a person node."""
-    raw = tree.graph.nodes[person_id].get("notes_json", "[]")
+    raw = tree.get_person(person_id).get("notes_json", "[]")
     try:
         return _json.loads(raw) if isinstance(raw, str) else []
     except (ValueError, TypeError):
@@ -441,9 +492,7 @@ def _get_notes(tree, person_id: str) -> list[dict]:
 
 def _save_notes(tree, person_id: str, notes: list[dict]) -> None:
     """Serialize notes back to the person node."""
-    tree.graph.nodes[person_id]["notes_json"] = _json.dumps(notes)
-    if tree.autosave:
-        tree.save()
+    tree.update_person(person_id, notes_json=_json.dumps(notes))
 
 
 @router.get("/{person_id}/notes")
@@ -76,11 +76,9 @@ def deactivate_relationship(
             entity_id=f"{source_id}:{target_id}",
             source=source_id,
             target=target_id,
-            include_reverse=True,
             metadata={
                 "source": source_id,
                 "target": target_id,
-                "include_reverse": True,
             },
             mutation=lambda: tree.deactivate_relationship(
                 source_id,
@@ -120,11 +118,9 @@ def reactivate_relationship(
             entity_id=f"{source_id}:{target_id}",
             source=source_id,
             target=target_id,
-            include_reverse=True,
             metadata={
                 "source": source_id,
                 "target": target_id,
-                "include_reverse": True,
             },
             mutation=lambda: tree.reactivate_relationship(source_id, target_id),
         )
@@ -151,13 +147,7 @@ def activate_all_relationships(
         if data.get("is_active") is False
     ]
     revisions = []
-    processed: set[tuple[str, str]] = set()
     for source, target in inactive:
-        if (source, target) in processed:
-            continue
-        reverse = (target, source)
-        processed.add((source, target))
-        processed.add(reverse)
         _, revision = apply_audited_change(
             tree=tree,
             store=history,
@@ -167,11 +157,9 @@ def activate_all_relationships(
             entity_id=f"{source}:{target}",
             source=source,
             target=target,
-            include_reverse=True,
             metadata={
                 "source": source,
                 "target": target,
-                "include_reverse": True,
             },
             mutation=lambda source=source, target=target: tree.reactivate_relationship(
                 source, target
@@ -200,11 +188,9 @@ def delete_relationship(
             entity_id=f"{source_id}:{target_id}",
             source=source_id,
             target=target_id,
-            include_reverse=True,
             metadata={
                 "source": source_id,
                 "target": target_id,
-                "include_reverse": True,
             },
             mutation=lambda: tree.delete_relationship(source_id, target_id),
         )
@@ -38,6 +38,12 @@ class RelationshipSchema:
             raise ValueError(f"Unknown relationship type: {name}")
         return rel.permanent
 
+    def is_directed(self, name: str) -> bool:
+        rel = self._types.get(name)
+        if rel is None:
+            raise ValueError(f"Unknown relationship type: {name}")
+        return rel.directed
+
     def to_dict(self) -> dict[str, Any]:
         return {name: cfg.model_dump() for name, cfg in self._types.items()}
 
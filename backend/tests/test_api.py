@@ -1,5 +1,6 @@
 """Integration tests for FastAPI endpoints."""
 
+import json
 import os
 import sys
 import tempfile
@@ -94,6 +95,78 @@ def test_get_person_not_found(client):
     assert resp.status_code == 404
 
 
+def test_person_ancestors_and_descendants(client):
+    ids = {}
+    for name, gender in [("Kid", "female"), ("Dad", "male"), ("Mum", "female"), ("Granny", "female")]:
+        ids[name] = client.post("/api/persons", json={"firstname": name, "gender": gender}).json()["id"]
+    for child, parent in [("Kid", "Mum"), ("Kid", "Dad"), ("Mum", "Granny")]:
+        resp = client.post("/api/relationships", json={"source": ids[child], "target": ids[parent], "type": "isChildOf"})
+        assert resp.status_code == 201
+
+    resp = client.get(f"/api/persons/{ids['Kid']}/ancestors")
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["total"] == 3
+    assert [(item["fullname"], item["generation"], item["number"]) for item in data["items"]] == [
+        ("Dad", 1, 2), ("Mum", 1, 3), ("Granny", 2, 7),
+    ]
+    page = client.get(f"/api/persons/{ids['Kid']}/ancestors", params={"offset": 1, "limit": 1}).json()
+    assert [item["fullname"] for item in page["items"]] == ["Mum"]
+    limited = client.get(f"/api/persons/{ids['Kid']}/ancestors", params={"max_generations": 1}).json()
+    assert limited["total"] == 2
+
+    descendants = client.get(f"/api/persons/{ids['Granny']}/descendants").json()
+    assert [(item["id"], item["number"]) for item in descendants["items"]] == [(ids["Mum"], "1.1"), (ids["Kid"], "1.1.1")]
+    assert client.get("/api/persons/nonexistent-id/descendants").status_code == 404
+
+
+def test_person_and_graph_nodes_have_lineage_counts(client):
+    ids = {}
+    for name in ("Kid", "Mum", "Granny"):
+        ids[name] = client.post("/api/persons", json={"firstname": name}).json()["id"]
+    for child, parent in [("Kid", "Mum"), ("Mum", "Granny")]:
+        client.post("/api/relationships", json={"source": ids[child], "target": ids[parent], "type": "isChildOf"})
+
+    data = client.get(f"/api/persons/{ids['Mum']}").json()
+    assert (data["ancestor_count"], data["descendant_count"], data["generations_below"]) == (1, 1, 1)
+    nodes = {node["id"]: node for node in client.get("/api/graph").json()["nodes"]}
+    assert (nodes[ids["Granny"]]["descendant_count"], nodes[ids["Granny"]]["generations_below"]) == (2, 2)
+    assert nodes[ids["Kid"]]["ancestor_count"] == 2
+
+
+def test_person_kinship_is_streamed_as_json_lines(client):
+    parent = client.post("/api/persons", json={"firstname": "Parent", "gender": "female"}).json()["id"]
+    child = client.post("/api/persons", json={"firstname": "Child"}).json()["id"]
+    client.post("/api/relationships", json={"source": child, "target": parent, "type": "isChildOf"})
+
+    resp = client.get(f"/api/persons/{child}/kinship")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in resp.text.splitlines()]
+    assert [(row["fullname"], row["relationship"], row["generation"]) for row in rows] == [
+        ("Child", "self", 0), ("Parent", "mother", -1),
+    ]
+    assert client.get("/api/persons/nonexistent-id/kinship").status_code == 404
+
+
+def test_person_kinship_stream_says_when_it_was_cut_short(client, _override_tree, monkeypatch):
+    parent = client.post("/api/persons", json={"firstname": "Parent"}).json()["id"]
+    child = client.post("/api/persons", json={"firstname": "Child"}).json()["id"]
+    client.post("/api/relationships", json={"source": child, "target": parent, "type": "isChildOf"})
+    iter_kinship = _override_tree.iter_kinship
+
+    def edited_after_the_first_entry(person_id):
+        entries = iter_kinship(person_id)
+        yield next(entries)
+        _override_tree.add_person(firstname="Newcomer")
+        yield from entries
+
+    monkeypatch.setattr(_override_tree, "iter_kinship", edited_after_the_first_entry)
+    rows = [json.loads(line) for line in client.get(f"/api/persons/{child}/kinship").text.splitlines()]
+    assert [row.get("fullname") for row in rows] == ["Child", None]
+    assert rows[-1] == {"truncated": True}
+
+
 def test_update_person(client):
     create_resp = client.post("/api/persons", json={"firstname": "Old", "lastname": "Name"})
     pid = create_resp.json()["id"]
@@ -286,7 +359,7 @@ def test_create_relationship(client):
     assert resp.json()["created"] is True
 
 
-def test_created_reverse_relationships_can_be_undone_independently(client):
+def test_symmetric_relationships_are_stored_once(client):
     p1, p2 = _create_two_persons(client)
     first = client.post(
         "/api/relationships",
@@ -297,10 +370,15 @@ def test_created_reverse_relationships_can_be_undone_independently(client):
         json={"source": p2, "target": p1, "type": "isSpouseOf"},
     )
     assert first.status_code == 201
-    assert second.status_code == 201
+    assert second.status_code == 422
+    assert second.json()["detail"]["issues"][0]["code"] == "duplicate_relationship"
 
+    # The relationship is found from either person and its rollback restores the stored orientation
+    deleted = client.delete(f"/api/relationships/{p2}/{p1}")
+    assert deleted.status_code == 200
+    assert client.get("/api/relationships").json() == []
     rollback = client.post(
-        f"/api/history/{second.json()['revision_id']}/rollback"
+        f"/api/history/{deleted.json()['revision_id']}/rollback"
     )
     assert rollback.status_code == 200
     relationships = client.get("/api/relationships").json()
@@ -423,6 +501,57 @@ def test_get_graph(client):
     assert len(data["nodes"]) >= 2
 
 
+def test_graph_node_budget(client):
+    root = client.post("/api/persons", json={"firstname": "Root"}).json()["id"]
+    parent = client.post("/api/persons", json={"firstname": "Parent"}).json()["id"]
+    spouse = client.post("/api/persons", json={"firstname": "Spouse"}).json()["id"]
+    in_law = client.post("/api/persons", json={"firstname": "InLaw"}).json()["id"]
+    client.post("/api/relationships", json={"source": root, "target": spouse, "type": "isSpouseOf"})
+    client.post("/api/relationships", json={"source": spouse, "target": in_law, "type": "isChildOf"})
+    client.post("/api/relationships", json={"source": root, "target": parent, "type": "isChildOf"})
+
+    data = client.get("/api/graph", params={"root_id": root, "degree": 2, "max_nodes": 2}).json()
+    assert {node["id"] for node in data["nodes"]} == {root, parent}
+    assert data["truncated"]
+    assert {node["id"] for node in data["nodes"] if node.get("truncated")} == {root}
+    full = client.get("/api/graph", params={"root_id": root, "degree": 2, "max_nodes": 10}).json()
+    assert {node["id"] for node in full["nodes"]} == {root, parent, spouse, in_law}
+    assert not full["truncated"] and not any(node.get("truncated") for node in full["nodes"])
+    assert client.get("/api/graph", params={"root_id": root, "max_nodes": 0}).status_code == 422
+
+
+def test_relationship_between_two_persons(client):
+    parent = client.post("/api/persons", json={"firstname": "Parent"}).json()["id"]
+    first = client.post("/api/persons", json={"firstname": "First", "gender": "male"}).json()["id"]
+    second = client.post("/api/persons", json={"firstname": "Second", "gender": "female"}).json()["id"]
+    for child in (first, second):
+        client.post("/api/relationships", json={"source": child, "target": parent, "type": "isChildOf"})
+
+    resp = client.get("/api/relationship", params={"a": first, "b": second})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["relationship"] == "sister"
+    assert data["common_ancestors"] == [parent]
+    assert data["path"] == [first, parent, second]
+    assert client.get("/api/relationship", params={"a": first, "b": "missing"}).status_code == 404
+
+
+def test_graph_between(client):
+    p1, p2 = _create_two_persons(client)
+    child = client.post("/api/persons", json={"firstname": "Child"}).json()["id"]
+    client.post("/api/relationships", json={"source": p1, "target": p2, "type": "isSpouseOf"})
+    for parent in (p1, p2):
+        client.post("/api/relationships", json={"source": child, "target": parent, "type": "isChildOf"})
+
+    data = client.get("/api/graph/between", params={"a": p1, "b": p2}).json()
+    assert {node["id"] for node in data["nodes"]} == {p1, p2}
+    assert data["distance"] == 1 and data["paths"] == 1 and not data["truncated"]
+    blood = client.get("/api/graph/between", params={"a": p1, "b": p2, "blood_only": True}).json()
+    assert {node["id"] for node in blood["nodes"]} == {p1, p2, child}
+    assert blood["distance"] == 2
+    assert client.get("/api/graph/between", params={"a": p1, "b": "missing"}).status_code == 404
+
+
 # ------------------------------------------------------------------
 # Schema endpoints
 # ------------------------------------------------------------------
@@ -1,6 +1,7 @@
 """Unit tests for durable history and transactional journaling."""
 
 import os
+import threading
 
 import pytest
 
@@ -83,3 +84,78 @@ def test_journal_failure_restores_graph_state(tree, tmp_path):
         )
 
     assert tree.get_person(person_id)["firstname"] == "Before"
+
+
+def test_journal_failure_restores_saved_tree(tmp_path):
+    path = str(tmp_path / "saved_tree.gml")
+    tree = FamilyTree(backend="local", localfile=path)
+    parent = tree.add_person(firstname="Parent")
+    child = tree.add_person(firstname="Child")
+    tree.add_relationship(child, parent, type="isChildOf")
+
+    class FailingStore(ChangeHistoryStore):
+        def append(self, record):
+            raise OSError("history unavailable")
+
+    with pytest.raises(OSError, match="history unavailable"):
+        apply_audited_change(
+            tree=tree,
+            store=FailingStore(backend="local", local_file=str(tmp_path / "unwritten.jsonl")),
+            actor="editor@example.com",
+            operation="delete",
+            entity_type="person",
+            entity_id=parent,
+            mutation=lambda: tree.delete_person(parent),
+        )
+
+    assert tree.graph[child][parent]["type"] == "isChildOf"
+    reloaded = FamilyTree(backend="local", localfile=path)
+    assert reloaded.get_person(parent)["firstname"] == "Parent"
+    assert reloaded.graph.has_edge(child, parent)
+
+
+def test_history_append_runs_outside_the_tree_lock(tree, tmp_path):
+    person_id = tree.add_person(firstname="Before")
+    seen = []
+
+    class ObservingStore(ChangeHistoryStore):
+        def append(self, record):
+            # Another thread can read the tree while the record is written
+            reader = threading.Thread(target=lambda: seen.append(tree._lock.acquire(timeout=1) and tree._lock.release() is None))
+            reader.start()
+            reader.join()
+            super().append(record)
+
+    apply_audited_change(
+        tree=tree,
+        store=ObservingStore(backend="local", local_file=str(tmp_path / "history.jsonl")),
+        actor="editor@example.com",
+        operation="update",
+        entity_type="person",
+        entity_id=person_id,
+        mutation=lambda: tree.update_person(person_id, firstname="After"),
+    )
+    assert seen == [True]
+    assert tree.get_person(person_id)["firstname"] == "After"
+
+
+def test_failed_append_keeps_later_changes(tree, tmp_path):
+    person_id = tree.add_person(firstname="Before")
+
+    class RacingStore(ChangeHistoryStore):
+        def append(self, record):
+            # Another request changes the same person before the history write fails
+            tree.update_person(person_id, firstname="Concurrent")
+            raise OSError("history unavailable")
+
+    with pytest.raises(OSError, match="history unavailable"):
+        apply_audited_change(
+            tree=tree,
+            store=RacingStore(backend="local", local_file=str(tmp_path / "unwritten.jsonl")),
+            actor="editor@example.com",
+            operation="update",
+            entity_type="person",
+            entity_id=person_id,
+            mutation=lambda: tree.update_person(person_id, firstname="After"),
+        )
+    assert tree.get_person(person_id)["firstname"] == "Concurrent"
@@ -1,13 +1,24 @@
 """Unit tests for the FamilyTree class."""
 
 import os
+import sys
 import tempfile
 
+import networkx as nx
 import pytest
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError, ResourceNotModifiedError
 
-from familytree import FamilyTree
+import tree_attributes
+import tree_csr
+import tree_kinship
+import tree_snapshot
+import tree_sqlite
+import tree_stream
+import tree_traversal
+from familytree import FamilyTree, StorageConflictError, TreeChangedError
+from backend.app.change_history import ChangeHistoryStore
 from backend.app.schemas.relationship_schema import load_relationship_schema
-from tree_validation import TreeValidationError
+from tree_validation import TreeValidationError, validate_person_relationships, validate_relationship
 
 
 @pytest.fixture()
@@ -242,6 +253,61 @@ class TestDeactivateRelationship:
             tree.deactivate_relationship(child, parent)
 
 
+class TestSymmetricRelationships:
+    def test_spouses_are_stored_once_and_found_either_way(self, tree):
+        p1 = tree.add_person(firstname="A", lastname="A")
+        p2 = tree.add_spouse(p1, firstname="B", lastname="B")
+        assert tree.graph.number_of_edges() == 1
+        assert tree.find_relationship(p2, p1) == (p1, p2)
+        assert tree.get_spouses(p2) == [p1]
+        with pytest.raises(TreeValidationError):
+            tree.add_relationship(p2, p1, type="isSpouseOf")
+
+        tree.deactivate_relationship(p2, p1, end_date="2024-01-01")
+        assert tree.graph[p1][p2]["is_active"] is False
+        tree.reactivate_relationship(p2, p1)
+        assert tree.graph[p1][p2]["is_active"] is True
+        tree.delete_relationship(p2, p1)
+        assert tree.graph.number_of_edges() == 0
+
+    def test_directed_relationships_are_not_found_in_reverse(self, tree):
+        parent = tree.add_person(firstname="P", lastname="P")
+        child = tree.add_person(firstname="C", lastname="C")
+        tree.add_relationship(child, parent, type="isChildOf")
+        assert tree.find_relationship(parent, child) is None
+        with pytest.raises(ValueError, match="No relationship exists"):
+            tree.delete_relationship(parent, child)
+
+    def test_trees_stored_both_ways_are_merged_on_load(self, tmp_path, schema):
+        legacy = nx.DiGraph()
+        legacy.add_node("a", firstname="A")
+        legacy.add_node("b", firstname="B")
+        legacy.add_edge("a", "b", type="isSpouseOf", is_active=True)
+        legacy.add_edge("b", "a", type="isSpouseOf", is_active=True)
+        path = str(tmp_path / "legacy.gml")
+        nx.write_gml(legacy, path)
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema, autosave=False)
+        assert list(tree.graph.edges()) == [("a", "b")]
+        assert tree.get_spouses("b") == ["a"]
+
+    def test_merged_relationship_stays_deleted_after_reload(self, tmp_path, schema):
+        legacy = nx.DiGraph()
+        legacy.add_node("a", firstname="A")
+        legacy.add_node("b", firstname="B")
+        legacy.add_edge("a", "b", type="isSpouseOf", is_active=True)
+        legacy.add_edge("b", "a", type="isSpouseOf", is_active=True)
+        path = str(tmp_path / "legacy.gml")
+        nx.write_gml(legacy, path)
+        journal = ChangeHistoryStore(backend="local", local_file=str(tmp_path / "legacy.journal.jsonl"))
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema, journal=journal)
+        tree.delete_relationship("a", "b")
+        # The checkpoint still holds both directions, the journal removes them one after the other
+        assert nx.read_gml(path).number_of_edges() == 2
+        reloaded = FamilyTree(backend="local", localfile=path, relationship_schema=schema, journal=journal)
+        assert reloaded.graph.number_of_edges() == 0
+        assert reloaded.get_spouses("a") == []
+
+
 # ------------------------------------------------------------------
 # get_siblings
 # ------------------------------------------------------------------
@@ -298,3 +364,1410 @@ class TestFormatForApi:
         assert all("level" in node for node in nodes.values())
         assert nodes[parent1]["level"] < nodes[child1]["level"]
         assert nodes[parent2]["level"] < nodes[child2]["level"]
+
+
+# ------------------------------------------------------------------
+# Generation levels
+# ------------------------------------------------------------------
+
+class TestGenerationLevels:
+    def _levels(self, tree):
+        return {node: data["level"] for node, data in tree.graph.nodes(data=True)}
+
+    def test_levels_follow_relationship_changes(self, tree):
+        grandparent = tree.add_person(firstname="Grand")
+        parent = tree.add_person(firstname="Parent")
+        spouse = tree.add_person(firstname="Spouse")
+        child = tree.add_person(firstname="Child")
+        assert set(self._levels(tree).values()) == {0}
+
+        tree.add_relationship(child, parent, type="isChildOf")
+        tree.add_relationship(parent, spouse, type="isSpouseOf")
+        tree.add_relationship(parent, grandparent, type="isChildOf")
+        assert self._levels(tree) == {grandparent: 0, parent: 1, spouse: 1, child: 2}
+
+        tree.delete_relationship(parent, grandparent)
+        assert self._levels(tree) == {grandparent: 0, parent: 0, spouse: 0, child: 1}
+        tree.delete_person(parent)
+        assert self._levels(tree) == {grandparent: 0, spouse: 0, child: 0}
+
+    def test_incremental_levels_match_a_full_recompute(self, tree):
+        import random
+
+        rng = random.Random(3)
+        people = [tree.add_person(firstname=f"P{i}") for i in range(30)]
+        for _ in range(120):
+            source, target = rng.sample(people, 2)
+            if tree.graph.has_edge(source, target) or tree.graph.has_edge(target, source):
+                if rng.random() < 0.3:
+                    tree._apply({"op": "remove_edge", "source": source, "target": target})
+                continue
+            # Only consistent relationships, as in a real tree
+            rel_type = rng.choice(["isChildOf", "isSpouseOf"])
+            levels = tree_traversal.generation_offsets(tree.graph, source)
+            if target in levels and levels[target] != levels[source] + (-1 if rel_type == "isChildOf" else 0):
+                continue
+            tree._apply({"op": "add_edge", "source": source, "target": target, "attrs": {"type": rel_type}})
+            incremental = self._levels(tree)
+            tree.assign_generation_levels()
+            assert self._levels(tree) == incremental
+
+    def test_reads_do_not_recompute_levels(self, tree, monkeypatch):
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+        monkeypatch.setattr(FamilyTree, "assign_generation_levels", lambda self, debug=False: pytest.fail("recomputed"))
+        monkeypatch.setattr(FamilyTree, "_level_component", lambda self, start: pytest.fail("recomputed"))
+
+        nodes = {node["id"]: node for node in tree.format_for_api(root_id=child, degree=1)["nodes"]}
+        assert (nodes[parent]["level"], nodes[child]["level"]) == (0, 1)
+
+    def test_levels_are_stored_with_the_tree(self, tmp_path, schema):
+        path = str(tmp_path / "tree.ftsnap")
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema)
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+
+        assert tree_snapshot.read_snapshot(path).nodes[child]["level"] == 1
+        legacy = nx.DiGraph(tree.graph)
+        for node in legacy:
+            del legacy.nodes[node]["level"]
+        legacy_path = str(tmp_path / "legacy.gml")
+        nx.write_gml(legacy, legacy_path)
+        assert self._levels(FamilyTree(backend="local", localfile=legacy_path)) == {parent: 0, child: 1}
+
+    def test_long_chains_are_walked_iteratively(self, tree):
+        depth = sys.getrecursionlimit() * 2
+        for generation in range(depth - 1):
+            tree.graph.add_edge(f"p{generation + 1}", f"p{generation}", type="isChildOf")
+        tree.assign_generation_levels()
+        assert tree.graph.nodes[f"p{depth - 1}"]["level"] == depth - 1
+        assert tree.get_longest_ancestor_chain() == depth
+
+    def test_longest_chain_with_pedigree_collapse(self, tree):
+        # Every generation descends from both persons of the one above: 2^20 paths, 21 generations
+        for generation in range(20):
+            for child in (f"a{generation + 1}", f"b{generation + 1}"):
+                tree.graph.add_edge(child, f"a{generation}", type="isChildOf")
+                tree.graph.add_edge(child, f"b{generation}", type="isChildOf")
+        assert tree.get_longest_ancestor_chain() == 21
+
+
+# ------------------------------------------------------------------
+# Lineage depths
+# ------------------------------------------------------------------
+
+class TestLineageDepths:
+    def test_depths_and_longest_chain(self, tree):
+        grandparent = tree.add_person(firstname="Grand")
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        other = tree.add_person(firstname="Other")
+        tree.add_relationship(parent, grandparent, type="isChildOf")
+        tree.add_relationship(child, parent, type="isChildOf")
+        tree.add_relationship(child, other, type="isChildOf")
+
+        assert tree.get_ancestor_depth(child) == 2
+        assert tree.get_descendant_depth(grandparent) == 2
+        assert (tree.get_ancestor_depth(other), tree.get_descendant_depth(other)) == (0, 1)
+        assert tree.get_longest_ancestor_chain() == 3
+
+    def test_depths_are_cached_until_relationships_change(self, tree, monkeypatch):
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+        calls = []
+        compute = tree_csr.CSRSnapshot.lineage_depths
+        monkeypatch.setattr(
+            tree_csr.CSRSnapshot, "lineage_depths", lambda snapshot, active_only=False: calls.append(1) or compute(snapshot, active_only)
+        )
+
+        assert tree.get_longest_ancestor_chain() == 2
+        tree.update_person(child, firstname="Renamed")
+        assert tree.get_ancestor_depth(child) == 1
+        assert len(calls) == 1
+
+        grandchild = tree.add_person(firstname="Grandchild")
+        tree.add_relationship(grandchild, child, type="isChildOf")
+        assert tree.get_descendant_depth(parent) == 2
+        assert len(calls) == 2
+
+
+# ------------------------------------------------------------------
+# CSR snapshot
+# ------------------------------------------------------------------
+
+class TestCSRSnapshot:
+    def _random_tree(self, tree, seed):
+        import random
+
+        rng = random.Random(seed)
+        people = [tree.add_person(firstname=f"P{i}") for i in range(30)]
+        for _ in range(60):
+            source, target = rng.sample(people, 2)
+            if not tree.graph.has_edge(source, target):
+                rel_type = rng.choice(["isChildOf", "isChildOf", "isSpouseOf"])
+                tree._apply({"op": "add_edge", "source": source, "target": target, "attrs": {"type": rel_type, "is_active": rng.random() < 0.8}})
+        # Freed ids are reused, so rows no longer follow the order of the graph
+        for person in rng.sample(people, 5):
+            tree.delete_person(person)
+        for i in range(3):
+            tree.add_person(firstname=f"New{i}")
+        return rng
+
+    def test_analytics_match_networkx(self, tree):
+        for seed in range(5):
+            tree._apply({"op": "clear"})
+            rng = self._random_tree(tree, seed)
+            snapshot = tree.get_csr_snapshot()
+            for active_only in (False, True):
+                assert snapshot.lineage_depths(active_only) == tree_traversal.lineage_depths(tree.graph, active_only)
+            start = rng.choice(list(tree.graph))
+            for hops in (1, 2, None):
+                expected = nx.single_source_shortest_path_length(tree.graph.to_undirected(), start, cutoff=hops)
+                assert snapshot.within_hops(start, hops) == expected
+                assert tree_traversal.within_hops(tree.graph, start, hops) == expected
+            assert tree.get_component_count() == nx.number_weakly_connected_components(tree.graph)
+
+    def test_snapshot_is_rebuilt_after_changes_only(self, tree):
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        snapshot = tree.get_csr_snapshot()
+        assert not snapshot.types or not snapshot.types["isChildOf"].indptr.flags.writeable
+        tree.update_person(child, firstname="Renamed")
+        assert tree.get_csr_snapshot() is snapshot
+        tree.add_relationship(child, parent, type="isChildOf")
+        assert tree.get_csr_snapshot() is not snapshot
+        assert tree.get_csr_snapshot().types["isChildOf"].indptr.flags.writeable is False
+        assert set(tree.get_subgraph_degrees(parent, degree=1)) == {parent, child}
+
+    def test_subgraphs_search_the_live_graph_until_a_snapshot_exists(self, tree):
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+        assert set(tree.get_subgraph_degrees(child, degree=1)) == {parent, child}
+        assert "csr" not in tree._derived_cache
+
+
+# ------------------------------------------------------------------
+# Subgraph views
+# ------------------------------------------------------------------
+
+class TestNodeBudget:
+    def _family(self, tree):
+        people = {name: tree.add_person(firstname=name) for name in ("Root", "Father", "Grandfather", "Wife", "WifeFather", "Son")}
+        tree.add_relationship(people["Root"], people["Father"], type="isChildOf")
+        tree.add_relationship(people["Father"], people["Grandfather"], type="isChildOf")
+        tree.add_relationship(people["Root"], people["Wife"], type="isSpouseOf")
+        tree.add_relationship(people["Wife"], people["WifeFather"], type="isChildOf")
+        tree.add_relationship(people["Son"], people["Root"], type="isChildOf")
+        return people
+
+    def test_takes_blood_relatives_then_spouses_then_in_laws(self, tree):
+        people = self._family(tree)
+        search = tree_traversal.nearest_relatives(tree.graph, people["Root"], hops=2)
+        names = {person: name for name, person in people.items()}
+        assert [names[person] for person in search.distances] == ["Root", "Father", "Son", "Grandfather", "Wife", "WifeFather"]
+        assert not search.truncated and not search.frontier
+
+    def test_going_up_after_going_down_leaves_the_blood_line(self, tree):
+        people = {name: tree.add_person(firstname=name) for name in ("A", "P", "C", "X", "B", "F", "Y")}
+        tree.add_relationship(people["A"], people["P"], type="isChildOf")
+        tree.add_relationship(people["B"], people["P"], type="isChildOf")
+        tree.add_relationship(people["B"], people["Y"], type="isSpouseOf")
+        tree.add_relationship(people["A"], people["X"], type="isSpouseOf")
+        tree.add_relationship(people["C"], people["A"], type="isChildOf")
+        tree.add_relationship(people["C"], people["X"], type="isChildOf")
+        tree.add_relationship(people["X"], people["F"], type="isChildOf")
+        names = {person: name for name, person in people.items()}
+
+        # The spouse is also reached through the child they had together, the sibling's spouse competes with
+        # the spouse's father for the last place
+        search = tree_traversal.nearest_relatives(tree.graph, people["A"], max_nodes=6)
+        assert [names[person] for person in search.distances] == ["A", "P", "C", "B", "X", "Y"]
+        assert search.truncated and search.frontier == {people["X"]}
+        search = tree_traversal.nearest_relatives(tree.graph, people["A"])
+        assert [names[person] for person in search.distances] == ["A", "P", "C", "B", "X", "Y", "F"]
+
+    def test_budget_marks_the_frontier(self, tree):
+        people = self._family(tree)
+        subgraph = tree.get_subgraph_degrees(people["Root"], degree=2, max_nodes=4)
+        assert set(subgraph) == {people["Root"], people["Father"], people["Son"], people["Grandfather"]}
+        assert subgraph.graph["truncated"]
+        assert subgraph.graph["frontier"] == {people["Root"]}
+        # Persons at the hop limit have no relatives within reach left out
+        subgraph = tree.get_subgraph_degrees(people["Root"], degree=1, max_nodes=3)
+        assert set(subgraph) == {people["Root"], people["Father"], people["Son"]}
+        assert subgraph.graph["frontier"] == {people["Root"]}
+
+    def test_matches_the_unbudgeted_search(self, tree):
+        import random
+
+        rng = random.Random(3)
+        people = [tree.add_person(firstname=f"P{i}") for i in range(40)]
+        for _ in range(70):
+            source, target = rng.sample(people, 2)
+            if not tree.graph.has_edge(source, target) and not tree.graph.has_edge(target, source):
+                kind = rng.choice(["isChildOf", "isChildOf", "isSpouseOf"])
+                tree._apply({"op": "add_edge", "source": source, "target": target, "attrs": {"type": kind}})
+        for hops in (1, 3, None):
+            expected = tree_traversal.within_hops(tree.graph, people[0], hops)
+            assert set(tree.get_subgraph_degrees(people[0], degree=hops, max_nodes=len(expected))) == set(expected)
+            for budget in (1, 5):
+                subgraph = tree.get_subgraph_degrees(people[0], degree=hops, max_nodes=budget)
+                assert len(subgraph) == min(budget, len(expected)) and set(subgraph) <= set(expected)
+                assert subgraph.graph["truncated"] == (len(expected) > budget)
+
+
+class TestSubgraphViews:
+    def test_subgraphs_are_views_of_the_tree(self, tree):
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        other = tree.add_person(firstname="Other")
+        tree.add_relationship(child, parent, type="isChildOf")
+        subgraph = tree.get_subgraph_degrees(child, degree=1)
+        assert set(subgraph) == {parent, child} and other not in subgraph
+        assert nx.is_frozen(subgraph)
+        assert subgraph.nodes[child] is tree.graph.nodes[child]
+        assert subgraph[child][parent] is tree.graph[child][parent]
+        tree.update_person(child, firstname="Renamed")
+        assert subgraph.nodes[child]["firstname"] == "Renamed"
+        copy = tree.detach_subgraph(subgraph)
+        copy.nodes[child]["vlevel"] = 0
+        assert "vlevel" not in tree.graph.nodes[child]
+        tree.delete_person(parent)
+        assert set(subgraph) == {child}
+        assert set(copy) == {parent, child} and copy.nodes[child]["firstname"] == "Renamed"
+
+    def test_graph_attributes_are_not_shared(self, tree):
+        a = tree.add_person(firstname="A")
+        b = tree.add_person(firstname="B")
+        tree.add_relationship(a, b, type="isSpouseOf")
+        subgraph = tree.get_subgraph_between(a, b)
+        assert subgraph.graph == {"distance": 1, "paths": 1, "truncated": False}
+        assert "distance" not in tree.graph.graph
+        assert subgraph.copy().graph["distance"] == 1
+
+    def test_formatting_leaves_the_tree_unchanged(self, tree):
+        parent = tree.add_person(firstname="Parent", lastname="Smith")
+        child = tree.add_person(firstname="Child", lastname="Smith")
+        tree.add_relationship(child, parent, type="isChildOf")
+        before = dict(tree.graph.nodes[child])
+        data = tree.format_for_st_link_analysis(root_id=child, degree=1)
+        assert {node["data"]["id"] for node in data["nodes"]} == {parent, child}
+        api = tree.format_for_api(root_id=child, degree=1)
+        assert [edge["id"] for edge in api["edges"]] == [f"{child}_to_{parent}"]
+        assert tree.graph.nodes[child] == before
+
+
+# ------------------------------------------------------------------
+# Typed adjacency
+# ------------------------------------------------------------------
+
+class TestTypedAdjacency:
+    def test_index_matches_graph_as_relationships_change(self, tree):
+        import random
+
+        rng = random.Random(5)
+        people = [tree.add_person(firstname=f"P{i}") for i in range(20)]
+        index = tree._adjacency_index()
+        for step in range(400):
+            source, target = rng.sample(people, 2)
+            if not tree.graph.has_edge(source, target):
+                rel_type = rng.choice(["isChildOf", "isSpouseOf", "isFriendOf"])
+                tree._apply({"op": "add_edge", "source": source, "target": target, "attrs": {"type": rel_type}})
+            elif rng.random() < 0.3:
+                tree._apply({"op": "remove_edge", "source": source, "target": target})
+            elif rng.random() < 0.5:
+                active = tree.graph[source][target].get("is_active", True)
+                tree._apply({"op": "update_edge", "source": source, "target": target, "attrs": {"is_active": not active}})
+            else:
+                rel_type = rng.choice(["isChildOf", "isSpouseOf"])
+                tree._apply({"op": "update_edge", "source": source, "target": target, "attrs": {"type": rel_type}})
+            if step == 200:
+                tree.delete_person(people.pop())
+            for person in people:
+                for active_only in (False, True):
+                    assert set(index.parents(person, active_only)) == set(tree_traversal.parents(tree.graph, person, active_only))
+                    assert set(index.children(person, active_only)) == set(tree_traversal.children(tree.graph, person, active_only))
+                    assert set(index.spouses(person, active_only)) == set(tree_traversal.spouses(tree.graph, person, active_only))
+        assert tree._adjacency_index() is index
+
+    def test_siblings_and_spouses_stored_one_way(self, tree):
+        mother = tree.add_person(firstname="Mother")
+        father = tree.add_person(firstname="Father")
+        first = tree.add_person(firstname="First")
+        second = tree.add_person(firstname="Second")
+        tree._apply({"op": "add_edge", "source": father, "target": mother, "attrs": {"type": "isSpouseOf"}})
+        for child in (first, second):
+            tree.add_relationship(child, mother, type="isChildOf")
+        tree.add_relationship(first, father, type="isChildOf")
+
+        assert tree.get_spouses(mother) == [father]
+        assert tree._adjacency_index().siblings_by_parent(first) == {mother: [second], father: []}
+        assert tree.get_siblings(first) == [second]
+        tree.delete_relationship(second, mother)
+        assert tree.get_siblings(first) == []
+
+    def test_person_checks_read_relationships_from_the_index(self, tree):
+        parent = tree.add_person(firstname="Parent", birthdate="1950")
+        child = tree.add_person(firstname="Child", birthdate="2000")
+        spouse = tree.add_person(firstname="Spouse")
+        tree.add_relationship(child, parent, type="isChildOf")
+        tree._apply({"op": "add_edge", "source": spouse, "target": parent, "attrs": {"type": "isSpouseOf", "start_date": "1980"}})
+        prospective = {"firstname": "Parent", "birthdate": "1995"}
+
+        indexed = validate_person_relationships(tree.graph, parent, prospective, tree._adjacency_index())
+        assert {issue.code for issue in indexed} == {"parent_too_young", "event_before_birth"}
+        assert indexed == validate_person_relationships(tree.graph, parent, prospective)
+
+
+# ------------------------------------------------------------------
+# Node ids
+# ------------------------------------------------------------------
+
+class TestNodeIds:
+    def test_ids_stay_dense_as_persons_come_and_go(self, tree):
+        import random
+
+        rng = random.Random(11)
+        people = [tree.add_person(firstname=f"P{i}") for i in range(10)]
+        index = tree._node_id_index()
+        peak = len(people)
+        for _ in range(200):
+            if people and rng.random() < 0.4:
+                tree.delete_person(people.pop(rng.randrange(len(people))))
+            else:
+                people.append(tree.add_person(firstname="New"))
+                peak = max(peak, len(people))
+            assert sorted(index.ids) == sorted(tree.graph)
+            assert all(index.node(index.id(person)) == person for person in people)
+            # Freed ids are reused, so there are never more ids than persons at the busiest moment
+            assert index.capacity == peak
+        assert tree._node_id_index() is index
+
+    def test_records_share_the_keys_of_the_graph(self, tree):
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        # Ids as they arrive from a request body or a journal line are equal but separate strings
+        tree.add_relationship("".join(child), "".join(parent), type="isChildOf")
+        stored_child = next(iter(tree.graph.pred[parent]))
+        stored_parent = next(iter(tree.graph.adj[child]))
+        assert stored_child is child and stored_parent is parent
+
+    def test_sqlite_trees_load_with_shared_keys(self, tmp_path, schema):
+        path = str(tmp_path / "tree.db")
+        tree = FamilyTree(backend="sqlite", sqlite_file=path, relationship_schema=schema)
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+        reloaded = FamilyTree(backend="sqlite", sqlite_file=path, relationship_schema=schema)
+        keys = {id(node) for node in reloaded.graph}
+        assert all(id(target) in keys for source in reloaded.graph for target in reloaded.graph.adj[source])
+        assert all(id(source) in keys for target in reloaded.graph for source in reloaded.graph.pred[target])
+
+
+# ------------------------------------------------------------------
+# Shared attribute strings
+# ------------------------------------------------------------------
+
+class TestAttributePool:
+    def test_pooled_fields_come_from_the_person_schema(self):
+        fields = tree_attributes.person_fields()
+        assert {"firstname", "lastname", "birthplace", "pictures", "gender"} <= set(fields)
+        assert "isAlive" not in fields
+
+    def test_persons_share_repeated_values(self, tree):
+        # Values as they arrive from requests are equal but separate strings
+        first = tree.add_person(firstname="Ana", lastname="".join("Garcia"), pictures=["".join("a.jpg")])
+        second = tree.add_person(firstname="Luis", lastname="".join("Garcia"), pictures=["".join("a.jpg")])
+        tree.update_person(second, notes_json="".join("[]"))
+        tree.update_person(first, notes_json="".join("[]"))
+        first_attrs, second_attrs = tree.graph.nodes[first], tree.graph.nodes[second]
+        assert type(first_attrs) is dict
+        assert first_attrs["lastname"] is second_attrs["lastname"]
+        assert first_attrs["pictures"][0] is second_attrs["pictures"][0]
+        # Free text is kept as it is
+        assert first_attrs["notes_json"] is not second_attrs["notes_json"]
+
+    def test_loaded_trees_share_repeated_values(self, tmp_path, schema):
+        graph = nx.DiGraph()
+        for person in ("a", "b"):
+            graph.add_node(person, lastname="".join("Puig"), birthplace="".join("Girona"))
+        path = str(tmp_path / "tree.ftsnap")
+        tree_snapshot.write_snapshot(graph, path)
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema, autosave=False)
+        assert tree.graph.nodes["a"]["lastname"] is tree.graph.nodes["b"]["lastname"]
+        assert tree.graph.nodes["a"]["birthplace"] is tree.graph.nodes["b"]["birthplace"]
+
+
+# ------------------------------------------------------------------
+# Ancestry index
+# ------------------------------------------------------------------
+
+class TestAncestryIndex:
+    def test_index_matches_full_search_as_relationships_change(self, tree):
+        import random
+
+        rng = random.Random(1)
+        people = [tree.add_person(firstname=f"P{i}") for i in range(40)]
+        index = tree._ancestry_index()
+        for _ in range(300):
+            child, parent = rng.sample(people, 2)
+            if tree.graph.has_edge(child, parent) or tree.graph.has_edge(parent, child):
+                if rng.random() < 0.5:
+                    tree._apply({"op": "remove_edge", "source": child, "target": parent})
+                elif tree.graph.has_edge(child, parent):
+                    active = tree.graph[child][parent].get("is_active", True)
+                    tree._apply({"op": "update_edge", "source": child, "target": parent, "attrs": {"is_active": not active}})
+                continue
+            ancestry = nx.DiGraph(
+                (c, p) for c, p, d in tree.graph.edges(data=True) if d.get("is_active", True)
+            )
+            expected = parent in ancestry and child in ancestry and nx.has_path(ancestry, parent, child)
+            assert index.would_create_cycle(child, parent) == expected
+            if not expected:
+                tree._apply({"op": "add_edge", "source": child, "target": parent, "attrs": {"type": "isChildOf"}})
+        assert tree._ancestry_index() is index
+        assert not index.cyclic
+
+    def test_cycle_check_does_not_walk_the_tree(self, tree, monkeypatch):
+        grandparent = tree.add_person(firstname="Grand")
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(parent, grandparent, type="isChildOf")
+        tree.add_relationship(child, parent, type="isChildOf")
+        monkeypatch.setattr(nx, "has_path", lambda *args: pytest.fail("walked the tree"))
+
+        with pytest.raises(TreeValidationError) as exc:
+            tree.add_relationship(grandparent, child, type="isChildOf")
+        assert exc.value.issues[0].code == "parent_child_cycle"
+        newcomer = tree.add_person(firstname="Newcomer")
+        tree.add_relationship(grandparent, newcomer, type="isChildOf")
+        assert tree.get_ancestors(child) == {parent: 1, grandparent: 2, newcomer: 3}
+
+
+# ------------------------------------------------------------------
+# Numbered ancestors and descendants
+# ------------------------------------------------------------------
+
+class TestLineageIndex:
+    def _family(self, tree):
+        people = {}
+        for name, gender, birthdate in [
+            ("child", "female", "1990-01-01"), ("father", "male", "1960-01-01"), ("mother", "female", "1962-01-01"),
+            ("grandpa", "male", "1930-01-01"), ("grandma", "female", "1932-01-01"), ("sibling", "male", "1985-01-01"),
+        ]:
+            people[name] = tree.add_person(firstname=name, gender=gender, birthdate=birthdate)
+        tree.add_relationship(people["child"], people["mother"], type="isChildOf")
+        tree.add_relationship(people["child"], people["father"], type="isChildOf")
+        tree.add_relationship(people["sibling"], people["father"], type="isChildOf")
+        tree.add_relationship(people["mother"], people["grandma"], type="isChildOf")
+        tree.add_relationship(people["mother"], people["grandpa"], type="isChildOf")
+        return people
+
+    def test_ahnentafel_numbers_fathers_before_mothers(self, tree):
+        p = self._family(tree)
+        assert tree.get_numbered_ancestors(p["child"]) == [
+            (p["father"], 1, 2), (p["mother"], 1, 3), (p["grandpa"], 2, 6), (p["grandma"], 2, 7),
+        ]
+        assert tree.get_numbered_ancestors(p["child"], max_generations=1) == [(p["father"], 1, 2), (p["mother"], 1, 3)]
+
+    def test_daboville_numbers_children_by_birth(self, tree):
+        p = self._family(tree)
+        assert tree.get_numbered_descendants(p["father"]) == [(p["sibling"], 1, "1.1"), (p["child"], 1, "1.2")]
+        assert tree.get_numbered_descendants(p["grandma"]) == [(p["mother"], 1, "1.1"), (p["child"], 2, "1.1.1")]
+
+    def test_mutations_only_drop_the_closures_they_affect(self, tree):
+        p = self._family(tree)
+        tree.get_numbered_ancestors(p["child"])
+        tree.get_numbered_ancestors(p["sibling"])
+        tree.get_numbered_descendants(p["grandma"])
+        index = tree._lineage_index()
+        assert len(index) == 3
+
+        great = tree.add_person(firstname="great", gender="male")
+        tree.add_relationship(p["grandma"], great, type="isChildOf")
+        assert len(index) == 2
+        assert tree.get_numbered_ancestors(p["child"])[-1] == (great, 3, 14)
+
+        tree.update_person(p["child"], birthdate="1980-01-01")
+        assert tree.get_numbered_descendants(p["father"]) == [(p["child"], 1, "1.1"), (p["sibling"], 1, "1.2")]
+        tree.delete_relationship(p["mother"], p["grandpa"])
+        assert [number for _, _, number in tree.get_numbered_ancestors(p["child"])] == [2, 3, 7, 14]
+
+    def test_pedigree_collapse_keeps_the_lowest_number(self, tree):
+        father = tree.add_person(firstname="father", gender="male")
+        mother = tree.add_person(firstname="mother", gender="female")
+        shared = tree.add_person(firstname="shared", gender="male")
+        child = tree.add_person(firstname="child")
+        for parent in (father, mother):
+            tree.add_relationship(child, parent, type="isChildOf")
+            tree.add_relationship(parent, shared, type="isChildOf")
+        assert tree.get_numbered_ancestors(child) == [(father, 1, 2), (mother, 1, 3), (shared, 2, 4)]
+
+
+# ------------------------------------------------------------------
+# Ancestor and descendant counts
+# ------------------------------------------------------------------
+
+class TestLineageCounts:
+    def test_counts_match_full_search_as_relationships_change(self, tree):
+        import random
+
+        rng = random.Random(3)
+        people = [tree.add_person(firstname=f"P{i}") for i in range(30)]
+        tree.get_lineage_counts(people[0])
+        index = tree._lineage_counts()
+        for step in range(300):
+            child, parent = rng.sample(people, 2)
+            if tree.graph.has_edge(child, parent):
+                if rng.random() < 0.5:
+                    tree._apply({"op": "remove_edge", "source": child, "target": parent})
+                else:
+                    active = tree.graph[child][parent].get("is_active", True)
+                    tree._apply({"op": "update_edge", "source": child, "target": parent, "attrs": {"is_active": not active}})
+            elif not tree.graph.has_edge(parent, child) and not tree._ancestry_index().would_create_cycle(child, parent):
+                tree._apply({"op": "add_edge", "source": child, "target": parent, "attrs": {"type": "isChildOf"}})
+            if step % 10:
+                continue
+            lineage = nx.DiGraph((c, p) for c, p, d in tree.graph.edges(data=True) if d.get("is_active", True))
+            lineage.add_nodes_from(tree.graph)
+            _, below = tree_traversal.lineage_depths(tree.graph, active_only=True)
+            for person in people:
+                assert tree.get_lineage_counts(person) == {
+                    "ancestor_count": len(nx.descendants(lineage, person)),
+                    "descendant_count": len(nx.ancestors(lineage, person)),
+                    "generations_below": below[person],
+                }
+        assert tree._lineage_counts() is index
+        assert not index.stale
+
+    def test_relatives_through_another_line_are_counted_once(self, tree):
+        shared = tree.add_person(firstname="shared")
+        father = tree.add_person(firstname="father")
+        mother = tree.add_person(firstname="mother")
+        child = tree.add_person(firstname="child")
+        for parent in (father, mother):
+            tree.add_relationship(parent, shared, type="isChildOf")
+            tree.add_relationship(child, parent, type="isChildOf")
+        assert tree.get_lineage_counts(shared) == {"ancestor_count": 0, "descendant_count": 3, "generations_below": 2}
+        tree.delete_relationship(child, father)
+        assert tree.get_lineage_counts(shared)["descendant_count"] == 3
+        assert tree.get_lineage_counts(father) == {"ancestor_count": 1, "descendant_count": 0, "generations_below": 0}
+        tree.delete_person(mother)
+        assert tree.get_lineage_counts(shared)["descendant_count"] == 1
+        with pytest.raises(ValueError):
+            tree.get_lineage_counts(mother)
+
+    def test_searching_other_lines_counts_against_the_budget(self, tree):
+        child = tree.add_person(firstname="Child")
+        father = tree.add_person(firstname="Father")
+        mother = tree.add_person(firstname="Mother")
+        tree.add_relationship(child, mother, type="isChildOf")
+        line = mother
+        for generation in range(20):
+            ancestor = tree.add_person(firstname=f"Ancestor {generation}")
+            tree.add_relationship(line, ancestor, type="isChildOf")
+            line = ancestor
+        tree.get_lineage_counts(child)
+        index = tree._lineage_counts()
+        index.max_pairs = 10
+        # A single new pair, but ruling it out searches the child's other line of 21 ancestors
+        tree.add_relationship(child, father, type="isChildOf")
+        assert index.stale
+        assert tree.get_lineage_counts(child)["ancestor_count"] == 22
+        assert tree.get_lineage_counts(father)["descendant_count"] == 1
+
+
+# ------------------------------------------------------------------
+# Kinship
+# ------------------------------------------------------------------
+
+class TestKinship:
+    @pytest.mark.parametrize("up, down, gender, half, label", [
+        (0, 0, None, False, "self"),
+        (1, 0, "male", False, "father"),
+        (3, 0, None, False, "great-grandparent"),
+        (5, 0, "female", False, "3rd great-grandmother"),
+        (0, 2, "female", False, "granddaughter"),
+        (1, 1, "male", True, "half-brother"),
+        (1, 2, None, False, "niece or nephew"),
+        (3, 1, "female", False, "great-aunt"),
+        (1, 4, "male", False, "2nd great-nephew"),
+        (2, 2, None, False, "first cousin"),
+        (2, 3, None, False, "first cousin once removed"),
+        (5, 3, None, True, "half-second cousin twice removed"),
+    ])
+    def test_labels(self, up, down, gender, half, label):
+        assert tree_kinship.kinship_label(up, down, gender, half) == label
+
+    def _couple_with_children(self, tree, father, mother, *names):
+        children = []
+        for name in names:
+            child = tree.add_person(firstname=name, gender="female")
+            for parent in (father, mother):
+                if parent is not None:
+                    tree.add_relationship(child, parent, type="isChildOf")
+            children.append(child)
+        return children
+
+    def test_relationship_between(self, tree):
+        grandpa = tree.add_person(firstname="Grandpa", gender="male")
+        grandma = tree.add_person(firstname="Grandma", gender="female")
+        aunt, mother = self._couple_with_children(tree, grandpa, grandma, "Aunt", "Mother")
+        cousin, = self._couple_with_children(tree, aunt, None, "Cousin")
+        me, = self._couple_with_children(tree, mother, None, "Me")
+        cousins_child, = self._couple_with_children(tree, cousin, None, "Cousin's child")
+
+        result = tree.get_relationship_between(me, cousins_child)
+        assert result["relationship"] == "first cousin once removed"
+        assert result["generations"] == [2, 3]
+        assert set(result["common_ancestors"]) == {grandpa, grandma}
+        path = result["path"]
+        assert path[0] == me and path[-1] == cousins_child and path[2] == result["common_ancestors"][0]
+        assert tree.get_relationship_between(cousins_child, grandma)["relationship"] == "great-grandmother"
+        assert tree.get_relationship_between(me, aunt)["relationship"] == "aunt"
+
+        stranger = tree.add_person(firstname="Stranger")
+        assert tree.get_relationship_between(me, stranger)["relationship"] is None
+        tree.add_relationship(me, stranger, type="isSpouseOf")
+        assert tree.get_relationship_between(me, stranger)["relationship"] == "spouse"
+
+    def test_kinship_table_labels_every_relative(self, tree):
+        grandpa = tree.add_person(firstname="Grandpa", gender="male")
+        grandma = tree.add_person(firstname="Grandma", gender="female")
+        aunt, mother = self._couple_with_children(tree, grandpa, grandma, "Aunt", "Mother")
+        cousin, = self._couple_with_children(tree, aunt, None, "Cousin")
+        me, = self._couple_with_children(tree, mother, None, "Me")
+        wife = tree.add_person(firstname="Wife", gender="female")
+        father_in_law = tree.add_person(firstname="Father-in-law", gender="male")
+        tree.add_relationship(me, wife, type="isSpouseOf")
+        tree.add_relationship(wife, father_in_law, type="isChildOf")
+        stepchild, = self._couple_with_children(tree, wife, None, "Stepchild")
+        uncle = tree.add_person(firstname="Uncle", gender="male")
+        tree.add_relationship(aunt, uncle, type="isSpouseOf")
+
+        table = {person: (label, generation) for person, label, generation in tree.iter_kinship(me)}
+        assert table == {
+            me: ("self", 0),
+            mother: ("mother", -1),
+            grandpa: ("grandfather", -2),
+            grandma: ("grandmother", -2),
+            aunt: ("aunt", -1),
+            cousin: ("first cousin", 0),
+            wife: ("wife", 0),
+            uncle: ("aunt's husband", -1),
+            father_in_law: ("father-in-law", -1),
+            stepchild: ("stepdaughter", 1),
+        }
+
+    def test_kinship_tables_are_cached_until_the_next_mutation(self, tree, monkeypatch):
+        parent = tree.add_person(firstname="Parent")
+        child, = self._couple_with_children(tree, parent, None, "Child")
+        first = list(tree.iter_kinship(child))
+        monkeypatch.setattr(tree_kinship, "kinship_table", lambda *args: pytest.fail("walked the tree again"))
+        assert list(tree.iter_kinship(child)) == first
+
+        monkeypatch.undo()
+        tree.update_person(parent, gender="male")
+        assert (parent, "father", -1) in list(tree.iter_kinship(child))
+
+    def test_a_mutation_during_the_walk_ends_it(self, tree):
+        grandparent = tree.add_person(firstname="Grandparent")
+        parent = tree.add_person(firstname="Parent")
+        tree.add_relationship(parent, grandparent, type="isChildOf")
+        child, sibling = self._couple_with_children(tree, parent, None, "Child", "Sibling")
+        entries = tree.iter_kinship(child)
+        assert next(entries)[0] == child
+        tree.delete_person(grandparent)
+        tree.delete_person(sibling)
+        with pytest.raises(TreeChangedError):
+            next(entries)
+        assert {person for person, _, _ in tree.iter_kinship(child)} == {child, parent}
+
+    def test_half_siblings(self, tree):
+        father = tree.add_person(firstname="Father", gender="male")
+        first_wife = tree.add_person(firstname="First", gender="female")
+        second_wife = tree.add_person(firstname="Second", gender="female")
+        elder, = self._couple_with_children(tree, father, first_wife, "Elder")
+        younger, = self._couple_with_children(tree, father, second_wife, "Younger")
+        result = tree.get_relationship_between(elder, younger)
+        assert result["relationship"] == "half-sister"
+        assert result["common_ancestors"] == [father]
+
+    def test_search_stops_at_the_nearest_common_ancestors(self, tree, monkeypatch):
+        top = tree.add_person(firstname="Top")
+        for generation in range(200):
+            person = tree.add_person(firstname=f"G{generation}")
+            tree.add_relationship(person, top, type="isChildOf")
+            top = person
+        first, second = self._couple_with_children(tree, top, None, "First", "Second")
+        parents = tree_traversal.parents
+        calls = []
+        monkeypatch.setattr(tree_traversal, "parents", lambda *args, **kwargs: calls.append(args[1]) or parents(*args, **kwargs))
+        assert tree.get_relationship_between(first, second)["relationship"] == "sister"
+        assert len(calls) < 10
+
+
+# ------------------------------------------------------------------
+# Paths between persons
+# ------------------------------------------------------------------
+
+class TestSubgraphBetween:
+    def _diamonds(self, tree, count):
+        """Each person has two children who have one child together, so the paths double at every step."""
+        ends = [tree.add_person(firstname="Start")]
+        for i in range(count):
+            left = tree.add_person(firstname=f"L{i}")
+            right = tree.add_person(firstname=f"R{i}")
+            below = tree.add_person(firstname=f"E{i}")
+            for middle in (left, right):
+                tree._apply({"op": "add_edge", "source": middle, "target": ends[-1], "attrs": {"type": "isChildOf"}})
+                tree._apply({"op": "add_edge", "source": below, "target": middle, "attrs": {"type": "isChildOf"}})
+            ends.append(below)
+        return ends
+
+    def test_counts_paths_without_enumerating_them(self, tree):
+        ends = self._diamonds(tree, 40)
+        subgraph = tree.get_subgraph_between(ends[0], ends[-1])
+        assert subgraph.number_of_nodes() == tree.graph.number_of_nodes()
+        assert subgraph.graph["distance"] == 80
+        assert subgraph.graph["paths"] == 2 ** 40
+        assert not subgraph.graph["truncated"]
+
+    def test_caps_paths_and_nodes(self, tree):
+        ends = self._diamonds(tree, 5)
+        capped = tree.get_subgraph_between(ends[0], ends[-1], max_paths=1)
+        assert capped.number_of_nodes() == 11
+        assert capped.graph["truncated"]
+        budget = tree.get_subgraph_between(ends[0], ends[-1], max_nodes=4)
+        assert budget.number_of_nodes() == 0
+        assert budget.graph["distance"] is None and budget.graph["truncated"]
+
+    def test_node_budget_is_checked_within_a_generation(self, tree, monkeypatch):
+        hub = tree.add_person(firstname="Hub")
+        far = tree.add_person(firstname="Far")
+        for i in range(100):
+            child = tree.add_person(firstname=f"Child {i}")
+            tree._apply({"op": "add_edge", "source": child, "target": hub, "attrs": {"type": "isChildOf"}})
+        tree._apply({"op": "add_edge", "source": far, "target": child, "attrs": {"type": "isChildOf"}})
+        neighbors = tree_traversal.undirected_neighbors
+        reached = []
+        monkeypatch.setattr(
+            tree_traversal, "undirected_neighbors", lambda *args: (reached.append(n) or n for n in neighbors(*args))
+        )
+        search = tree_traversal.shortest_paths_between(tree.graph, hub, far, max_nodes=10)
+        assert search.truncated and search.distance is None
+        assert len(reached) <= 10
+
+    def test_relationship_type_filter(self, tree):
+        a = tree.add_person(firstname="A")
+        b = tree.add_person(firstname="B")
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(a, b, type="isSpouseOf")
+        tree.add_relationship(child, a, type="isChildOf")
+        tree.add_relationship(child, b, type="isChildOf")
+        assert set(tree.get_subgraph_between(a, b).nodes) == {a, b}
+        blood = tree.get_subgraph_between(a, b, types=["isChildOf"])
+        assert set(blood.nodes) == {a, b, child}
+        assert blood.graph["distance"] == 2
+
+    def test_matches_all_shortest_paths(self, tree):
+        import random
+
+        rng = random.Random(5)
+        people = [tree.add_person(firstname=f"P{i}") for i in range(30)]
+        for _ in range(60):
+            source, target = rng.sample(people, 2)
+            kind = rng.choice(["isChildOf", "isSpouseOf"])
+            tree._apply({"op": "add_edge", "source": source, "target": target, "attrs": {"type": kind}})
+        undirected = tree.graph.to_undirected()
+        for _ in range(30):
+            a, b = rng.sample(people, 2)
+            subgraph = tree.get_subgraph_between(a, b)
+            if nx.has_path(undirected, a, b):
+                paths = list(nx.all_shortest_paths(undirected, a, b))
+                assert set(subgraph.nodes) == set().union(*paths)
+                assert subgraph.graph["paths"] == len(paths)
+            else:
+                assert subgraph.number_of_nodes() == 0
+
+
+# ------------------------------------------------------------------
+# Write-ahead journal
+# ------------------------------------------------------------------
+
+class TestJournal:
+    @pytest.fixture()
+    def journal(self, tmp_path):
+        return ChangeHistoryStore(backend="local", local_file=str(tmp_path / "tree.journal.jsonl"))
+
+    def _tree(self, tmp_path, schema, journal, **kwargs):
+        return FamilyTree(
+            backend="local",
+            localfile=str(tmp_path / "journaled.gml"),
+            relationship_schema=schema,
+            journal=journal,
+            **kwargs,
+        )
+
+    def test_mutations_append_records_without_rewriting_checkpoint(self, tmp_path, schema, journal):
+        tree = self._tree(tmp_path, schema, journal)
+        checkpoint = (tmp_path / "journaled.gml").read_text()
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+        tree.update_person(child, lastname="Smith")
+
+        assert (tmp_path / "journaled.gml").read_text() == checkpoint
+        records = journal.list()
+        assert [record["op"] for record in records] == ["add_node", "add_node", "add_edge", "update_node"]
+        assert [record["seq"] for record in records] == [1, 2, 3, 4]
+
+    def test_load_replays_journal_over_checkpoint(self, tmp_path, schema, journal):
+        tree = self._tree(tmp_path, schema, journal)
+        parent = tree.add_person(firstname="Parent")
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+        tree.add_picture(child, "https://example.com/a.jpg")
+        tree.delete_person(parent)
+
+        reloaded = self._tree(tmp_path, schema, journal)
+        assert parent not in reloaded.graph
+        assert reloaded.get_person(child)["pictures"] == ["https://example.com/a.jpg"]
+
+    def test_checkpoint_truncates_journal(self, tmp_path, schema, journal):
+        tree = self._tree(tmp_path, schema, journal, checkpoint_interval=2)
+        first = tree.add_person(firstname="First")
+        tree.add_person(firstname="Second")
+        assert len(journal.list()) == 2
+        tree.add_person(firstname="Third")
+        assert journal.list() == []
+
+        reloaded = self._tree(tmp_path, schema, journal)
+        assert reloaded.graph.number_of_nodes() == 3
+        assert reloaded.get_person(first)["firstname"] == "First"
+        # Records already absorbed by the checkpoint are skipped on replay
+        reloaded.update_person(first, firstname="Renamed")
+        again = self._tree(tmp_path, schema, journal)
+        assert again.get_person(first)["firstname"] == "Renamed"
+
+
+# ------------------------------------------------------------------
+# Transactions
+# ------------------------------------------------------------------
+
+class TestTransaction:
+    def test_rollback_restores_touched_entities(self, tree):
+        parent = tree.add_person(firstname="Parent", pictures=["a.jpg"])
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+        before = nx.DiGraph(tree.graph)
+
+        with pytest.raises(RuntimeError):
+            with tree.transaction():
+                tree.update_person(child, firstname="Renamed", birthplace="Girona")
+                tree.add_picture(parent, "b.jpg")
+                tree.delete_person(parent)
+                tree.add_person(firstname="Extra")
+                raise RuntimeError("abort")
+
+        assert nx.utils.graphs_equal(tree.graph, before)
+        assert tree.get_person(child) == {"firstname": "Child", "level": 1}
+        assert tree.get_person(parent)["pictures"] == ["a.jpg"]
+        assert tree.graph[child][parent]["type"] == "isChildOf"
+
+    def test_rollback_after_clear(self, tree):
+        person = tree.add_person(firstname="Kept")
+        tree.graph.graph["note"] = "kept"
+        with pytest.raises(RuntimeError):
+            with tree.transaction():
+                tree.delete_all()
+                raise RuntimeError("abort")
+        assert tree.get_person(person)["firstname"] == "Kept"
+        assert tree.graph.graph["note"] == "kept"
+
+    def test_rollback_drops_unflushed_journal_records(self, tmp_path, schema):
+        journal = ChangeHistoryStore(backend="local", local_file=str(tmp_path / "tree.journal.jsonl"))
+        tree = FamilyTree(backend="local", localfile=str(tmp_path / "tree.gml"), relationship_schema=schema, journal=journal)
+        kept = tree.add_person(firstname="Kept")
+        tree.autosave = False
+        with pytest.raises(RuntimeError):
+            with tree.transaction():
+                tree.update_person(kept, firstname="Lost")
+                with tree.transaction():
+                    tree.add_person(firstname="Nested")
+                raise RuntimeError("abort")
+
+        assert tree._journal_pending == []
+        assert [record["op"] for record in journal.list()] == ["add_node"]
+        reloaded = FamilyTree(backend="local", localfile=str(tmp_path / "tree.gml"), relationship_schema=schema, journal=journal)
+        assert reloaded.graph.number_of_nodes() == 1
+        assert reloaded.get_person(kept)["firstname"] == "Kept"
+
+
+# ------------------------------------------------------------------
+# Staging overlay
+# ------------------------------------------------------------------
+
+class TestStaging:
+    def test_overlay_leaves_base_graph_untouched(self, tree):
+        parent = tree.add_person(firstname="Parent")
+        staged = tree.stage()
+        staged.add_node("new", firstname="New")
+        staged.add_edge("new", parent, type="isChildOf")
+
+        assert "new" in staged and "new" not in tree.graph
+        assert staged.has_edge("new", parent) and not tree.graph.has_edge("new", parent)
+        assert staged[parent] == {} and list(staged.predecessors(parent)) == ["new"]
+        assert staged.nodes["new"]["firstname"] == "New"
+        assert len(staged) == 2 and tree.graph.number_of_nodes() == 1
+
+    def test_validators_see_staged_changes(self, tree):
+        grandparent = tree.add_person(firstname="Grand")
+        parent = tree.add_person(firstname="Parent", birthdate="1950")
+        tree.add_relationship(parent, grandparent, type="isChildOf")
+        staged = tree.stage()
+        staged.add_node("child", firstname="Child", birthdate="1980")
+        staged.add_edge("child", parent, type="isChildOf")
+
+        issues = validate_relationship(staged, grandparent, "child", "isChildOf")
+        assert "parent_child_cycle" in {issue.code for issue in issues}
+        assert validate_relationship(tree.graph, grandparent, "child", "isChildOf")[0].code == "person_not_found"
+        issues = validate_person_relationships(staged, parent, {"firstname": "Parent", "birthdate": "1975"})
+        assert "parent_too_young" in {issue.code for issue in issues}
+
+    def test_commit_applies_all_or_nothing(self, tree):
+        parent = tree.add_person(firstname="Parent")
+        staged = tree.stage()
+        staged.add_node("child", firstname="Child")
+        staged.add_edge("child", parent, type="isChildOf")
+        staged.commit(tree)
+        assert tree.get_person("child")["firstname"] == "Child"
+        assert tree.graph["child"][parent]["type"] == "isChildOf"
+
+        failing = tree.stage()
+        failing.add_node("other", firstname="Other")
+        failing.add_edge("other", parent, type="notARelationship")
+        with pytest.raises(ValueError):
+            failing.commit(tree)
+        assert "other" not in tree.graph
+
+
+# ------------------------------------------------------------------
+# Binary snapshot storage
+# ------------------------------------------------------------------
+
+class TestSnapshot:
+    def test_snapshot_backend_round_trip(self, tmp_path, schema):
+        path = str(tmp_path / "tree.ftsnap")
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema)
+        assert tree.storage_format == "snapshot"
+        parent = tree.add_person(firstname="Parent", isAlive=False, pictures=["a.jpg", "b.jpg"])
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+
+        with open(path, "rb") as handle:
+            assert tree_snapshot.is_snapshot(handle.read())
+        reloaded = FamilyTree(backend="local", localfile=path, relationship_schema=schema)
+        assert reloaded.get_person(parent) == tree.get_person(parent)
+        assert reloaded.get_person(parent)["isAlive"] is False
+        assert reloaded.graph[child][parent]["type"] == "isChildOf"
+
+    def test_export_converts_between_formats(self, tree, tmp_path):
+        person = tree.add_person(firstname="Exported", lastname="Person")
+        snapshot_path = str(tmp_path / "exported.ftsnap")
+        tree.export_file(snapshot_path)
+        gml_path = str(tmp_path / "exported.gml")
+        FamilyTree(backend="local", localfile=snapshot_path, autosave=False).export_file(gml_path)
+
+        assert tree_snapshot.read_snapshot(snapshot_path).nodes[person]["lastname"] == "Person"
+        assert FamilyTree(backend="local", localfile=gml_path).get_person(person)["firstname"] == "Exported"
+
+    def test_rejects_unknown_version(self):
+        data = bytearray(tree_snapshot.dumps(nx.DiGraph()))
+        data[6] = 99
+        with pytest.raises(ValueError, match="Unsupported snapshot version"):
+            tree_snapshot.loads(bytes(data))
+
+    def test_reads_version_1_snapshots(self):
+        graph = nx.DiGraph()
+        graph.add_node("p1", firstname="Old", notes_json='["kept"]')
+        graph.add_node("p2", firstname="Child")
+        graph.add_edge("p2", "p1", type="isChildOf")
+        sections = [
+            tree_snapshot._json_bytes({"graph": {}, "directed": True, "nodes": 2, "edges": 1}),
+            tree_snapshot._json_bytes(["p1", "p2"]),
+            tree_snapshot._json_bytes([dict(graph.nodes["p1"]), dict(graph.nodes["p2"])]),
+            tree_snapshot._index_bytes([1]),
+            tree_snapshot._index_bytes([0]),
+            tree_snapshot._json_bytes([{"type": "isChildOf"}]),
+        ]
+        data = tree_snapshot._PREAMBLE.pack(tree_snapshot.MAGIC, 1) + b"".join(
+            tree_snapshot._LENGTH.pack(len(section)) + section for section in sections
+        )
+
+        assert nx.utils.graphs_equal(tree_snapshot.loads(data), graph)
+        loaded, details = tree_snapshot.loads_topology(data)
+        assert details is None
+        assert loaded.nodes["p1"]["notes_json"] == '["kept"]'
+
+
+# ------------------------------------------------------------------
+# Lazy attribute loading
+# ------------------------------------------------------------------
+
+class TestLazyAttributes:
+    @pytest.fixture()
+    def saved(self, tmp_path, schema):
+        path = str(tmp_path / "tree.ftsnap")
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema)
+        parent = tree.add_person(firstname="Parent", lastname="Smith", pictures=["a.jpg"], notes_json='["note"]')
+        child = tree.add_person(firstname="Child", lastname="Smith")
+        tree.add_relationship(child, parent, type="isChildOf")
+        return path, tree, parent, child
+
+    def test_topology_loads_summary_fields_only(self, saved):
+        path, original, parent, child = saved
+        graph, details = tree_snapshot.read_snapshot_topology(path)
+        assert graph.nodes[parent] == {key: value for key, value in original.graph.nodes[parent].items() if key in tree_snapshot.SUMMARY_FIELDS}
+        assert parent in details and child not in details
+        assert details.pop(parent) == {"pictures": ["a.jpg"], "notes_json": '["note"]'}
+        assert details.pop(parent) == {} and len(details) == 0
+
+    def test_details_load_on_first_use(self, saved, schema):
+        path, original, parent, child = saved
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema, lazy_attributes=True)
+        assert "pictures" not in tree.graph.nodes[parent]
+        assert tree.graph.nodes[parent]["firstname"] == "Parent"
+        assert tree.get_person(parent) == original.get_person(parent)
+        assert parent not in tree._details
+
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema, lazy_attributes=True)
+        tree.update_person(parent, firstname="Renamed")
+        assert tree.graph.nodes[parent]["notes_json"] == '["note"]'
+        tree.add_picture(parent, "b.jpg")
+        assert tree.get_person(parent)["pictures"] == ["a.jpg", "b.jpg"]
+
+    def test_unused_details_survive_saving(self, saved, schema, tmp_path):
+        path, original, parent, child = saved
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema, lazy_attributes=True)
+        tree.update_person(child, firstname="Renamed")
+        assert parent in tree._details
+
+        reloaded = FamilyTree(backend="local", localfile=path, relationship_schema=schema)
+        assert reloaded.get_person(parent) == original.get_person(parent)
+        assert reloaded.get_person(child)["firstname"] == "Renamed"
+        gml_path = str(tmp_path / "exported.gml")
+        tree.export_file(gml_path)
+        assert "pictures" in nx.read_gml(gml_path).nodes[parent]
+
+    def test_gml_trees_load_in_full(self, tmp_path, schema):
+        path = str(tmp_path / "tree.gml")
+        person = FamilyTree(backend="local", localfile=path, relationship_schema=schema).add_person(firstname="A", occupation="Baker")
+        tree = FamilyTree(backend="local", localfile=path, relationship_schema=schema, lazy_attributes=True)
+        assert tree._details is None
+        assert tree.graph.nodes[person]["occupation"] == "Baker"
+
+
+# ------------------------------------------------------------------
+# Write-behind saving to Azure Storage
+# ------------------------------------------------------------------
+
+class _FakeDownloader:
+    def __init__(self, data, etag):
+        self._data = data
+        self.properties = type("Properties", (), {"etag": etag})()
+
+    def chunks(self):
+        for offset in range(0, len(self._data), 1024):
+            yield self._data[offset:offset + 1024]
+
+
+class FakeBlobClient:
+    """In-memory stand-in for azure BlobClient honouring ETag conditions."""
+
+    def __init__(self):
+        self.data = None
+        self.etag = None
+        self.content_encoding = None
+        self.uploads = 0
+        self.downloads = 0
+        self.lengths = []
+
+    def download_blob(self, etag=None, match_condition=None, decompress=True):
+        if self.data is None:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        if etag is not None and etag == self.etag:
+            raise ResourceNotModifiedError("Not modified")
+        self.downloads += 1
+        return _FakeDownloader(self.data, self.etag)
+
+    def get_blob_properties(self):
+        return type("Properties", (), {"etag": self.etag})()
+
+    def upload_blob(self, data, length=None, overwrite=False, etag=None, match_condition=None, content_settings=None):
+        if etag is not None and etag != self.etag:
+            raise ResourceModifiedError("The condition specified using HTTP conditional header(s) is not met.")
+        if not overwrite and self.data is not None:
+            raise ResourceExistsError("The specified blob already exists.")
+        self.data = b"".join(data)
+        assert length is None or length == len(self.data)
+        self.lengths.append(length)
+        self.content_encoding = content_settings.content_encoding if content_settings else None
+        self.uploads += 1
+        self.etag = f'"{self.uploads}"'
+        return {"etag": self.etag}
+
+
+@pytest.fixture
+def blob(monkeypatch):
+    blob = FakeBlobClient()
+    monkeypatch.setattr(FamilyTree, "_get_blob_client", lambda self: blob)
+    return blob
+
+
+def azstorage_tree(schema, blob_name="tree.gml", **kwargs):
+    """A tree in the fake blob storage of the ``blob`` fixture."""
+    return FamilyTree(
+        backend="azstorage",
+        azstorage_account="account",
+        azstorage_key="key",
+        azstorage_container="container",
+        azstorage_blob=blob_name,
+        relationship_schema=schema,
+        **kwargs,
+    )
+
+
+class TestWriteBehind:
+    def test_coalesces_mutations_into_one_upload(self, schema, blob):
+        tree = azstorage_tree(schema, write_behind=True, flush_interval=60)
+        tree.wait_until_durable(timeout=5)
+        uploads = blob.uploads
+        ids = [tree.add_person(firstname=f"Person {i}") for i in range(20)]
+        assert blob.uploads == uploads
+
+        tree.wait_until_durable(timeout=5)
+        assert blob.uploads == uploads + 1
+        tree.close()
+        reloaded = azstorage_tree(schema)
+        assert all(reloaded.get_person(person_id) for person_id in ids)
+
+    def test_close_flushes_pending_changes(self, schema, blob):
+        tree = azstorage_tree(schema, write_behind=True, flush_interval=60)
+        person = tree.add_person(firstname="Last")
+        tree.close(timeout=5)
+        assert azstorage_tree(schema).get_person(person)["firstname"] == "Last"
+
+    def test_conditional_upload_detects_concurrent_writer(self, schema, blob):
+        first = azstorage_tree(schema)
+        second = azstorage_tree(schema)
+        first.add_person(firstname="First writer")
+        with pytest.raises(StorageConflictError):
+            second.add_person(firstname="Second writer")
+        assert "Second writer" not in blob.data.decode()
+
+    def test_write_behind_conflict_keeps_the_edits_until_reloaded(self, schema, blob):
+        tree = azstorage_tree(schema, write_behind=True, flush_interval=60)
+        tree.wait_until_durable(timeout=5)
+        other = azstorage_tree(schema)
+        remote = other.add_person(firstname="Other writer")
+
+        local = tree.add_person(firstname="Accepted edit")
+        with pytest.raises(StorageConflictError):
+            tree.wait_until_durable(timeout=5)
+        assert "Accepted edit" not in blob.data.decode()
+        # The edits are neither retried nor replaced by the other writer's version
+        assert tree.revalidate(force=True) is False
+        assert tree.get_person(local)["firstname"] == "Accepted edit"
+        with pytest.raises(StorageConflictError):
+            tree.add_person(firstname="Later edit")
+
+        assert tree.load_azstorage() is True
+        assert tree.get_person(local) is None and tree.get_person(remote)
+        assert tree.wait_until_durable(timeout=5)
+        person = tree.add_person(firstname="After reload")
+        tree.close(timeout=5)
+        assert azstorage_tree(schema).get_person(person)["firstname"] == "After reload"
+
+
+class TestBlobCache:
+    def test_unchanged_blob_is_loaded_from_cache(self, schema, blob, tmp_path):
+        writer = azstorage_tree(schema, cache_dir=str(tmp_path / "writer"))
+        person = writer.add_person(firstname="Cached")
+
+        first = azstorage_tree(schema, cache_dir=str(tmp_path / "reader"))
+        assert blob.downloads == 1
+        second = azstorage_tree(schema, cache_dir=str(tmp_path / "reader"))
+        assert blob.downloads == 1
+        assert second.get_person(person) == first.get_person(person)
+
+    def test_uploaded_file_becomes_the_cache(self, schema, blob, tmp_path):
+        writer = azstorage_tree(schema, cache_dir=str(tmp_path / "writer"), content_encoding="gzip")
+        writer.add_person(firstname="Cached")
+
+        # Streamed as a staged upload of unknown length, with the spooled file kept as the cache copy
+        assert blob.lengths and set(blob.lengths) == {None}
+        data_file, etag_file = writer._cache_paths()
+        with open(data_file, "rb") as f:
+            assert f.read() == blob.data
+        with open(etag_file) as f:
+            assert f.read() == blob.etag
+        assert sorted(os.listdir(tmp_path / "writer")) == sorted(os.path.basename(path) for path in (data_file, etag_file))
+
+    def test_revalidate_picks_up_other_writers(self, schema, blob, tmp_path):
+        writer = azstorage_tree(schema, cache_dir=str(tmp_path / "writer"))
+        reader = azstorage_tree(schema, cache_dir=str(tmp_path / "reader"), revalidate_interval=3600)
+        person = writer.add_person(firstname="Remote")
+
+        assert reader.revalidate() is False
+        assert reader.get_person(person) is None
+        assert reader.revalidate(force=True) is True
+        assert reader.get_person(person)["firstname"] == "Remote"
+        assert reader.revalidate(force=True) is False
+
+
+class TestBlobStreaming:
+    @pytest.mark.parametrize("blob_name", ["tree.gml", "tree.ftsnap"])
+    def test_gzip_encoded_round_trip(self, schema, blob, blob_name):
+        tree = azstorage_tree(schema, blob_name, content_encoding="gzip")
+        for i in range(200):
+            tree.add_person(firstname=f"Person {i}", lastname="Streaming")
+        person = tree.add_person(firstname="Last", pictures=["a.jpg"])
+
+        assert blob.content_encoding == "gzip"
+        assert blob.data[:2] == b"\x1f\x8b"
+        plain = tree_stream.iter_encoded(tree.graph, tree.storage_format)
+        assert len(blob.data) < sum(len(chunk) for chunk in plain) / 3
+        # A reader without an encoding configured still detects the compression
+        reloaded = azstorage_tree(schema, blob_name)
+        assert reloaded.graph.number_of_nodes() == 201
+        assert reloaded.get_person(person) == tree.get_person(person)
+
+    def test_chunked_gml_matches_write_gml(self, tree, tmp_path):
+        parent = tree.add_person(firstname="Parent", isAlive=False)
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+        path = tmp_path / "tree.gml"
+        nx.write_gml(tree.graph, str(path))
+
+        assert b"".join(tree_stream.iter_encoded(tree.graph, chunk_size=16)) == path.read_bytes()
+        chunks = tree_stream.iter_encoded(tree.graph, encoding="gzip", chunk_size=16)
+        parsed = tree_stream.read_graph(chunks)
+        assert parsed.nodes[parent] == tree.graph.nodes[parent]
+        assert parsed[child][parent]["type"] == "isChildOf"
+
+    def test_snapshot_is_streamed_one_section_at_a_time(self, tree):
+        parent = tree.add_person(firstname="Parent", notes_json='["details"]')
+        child = tree.add_person(firstname="Child")
+        tree.add_relationship(child, parent, type="isChildOf")
+        pieces = list(tree_snapshot.iter_dumps(tree.graph))
+
+        # Preamble, then a length and a payload for each section
+        assert len(pieces) == 1 + 2 * 8
+        assert b"".join(pieces) == tree_snapshot.dumps(tree.graph)
+        # The reader pulls sections from a stream that returns a few bytes at a time
+        chunks = tree_stream.iter_encoded(tree.graph, "snapshot", chunk_size=1)
+        parsed = tree_stream.read_graph(tree_stream.ChunkReader(chunks))
+        assert nx.utils.graphs_equal(parsed, tree.graph)
+        assert parsed.nodes[parent]["notes_json"] == '["details"]'
+        with pytest.raises(ValueError, match="Truncated"):
+            tree_stream.read_graph(iter([b"".join(pieces)[:-3]]))
+
+    def test_rejects_unknown_encoding(self, schema, blob):
+        with pytest.raises(ValueError, match="Invalid content encoding"):
+            azstorage_tree(schema, content_encoding="brotli")
+
+
+# ------------------------------------------------------------------
+# SQLite backend
+# ------------------------------------------------------------------
+
+class TestSQLiteBackend:
+    def _tree(self, tmp_path, schema, **kwargs):
+        return FamilyTree(backend="sqlite", sqlite_file=str(tmp_path / "tree.db"), relationship_schema=schema, **kwargs)
+
+    def _family(self, tree):
+        grandparent = tree.add_person(firstname="Grand", lastname="Parent")
+        parent = tree.add_person(firstname="Pa", lastname="Rent")
+        spouse = tree.add_person(firstname="Spouse", lastname="Inlaw")
+        child = tree.add_person(firstname="Kid", lastname="Rent")
+        tree.add_relationship(parent, grandparent, type="isChildOf")
+        tree.add_relationship(child, parent, type="isChildOf")
+        tree.add_relationship(parent, spouse, type="isSpouseOf")
+        return grandparent, parent, spouse, child
+
+    def test_mutations_persist_per_row(self, tmp_path, schema):
+        tree = self._tree(tmp_path, schema)
+        grandparent, parent, spouse, child = self._family(tree)
+        tree.update_person(child, birthplace="Girona")
+        tree.deactivate_relationship(parent, spouse)
+        tree.delete_person(grandparent)
+
+        reloaded = self._tree(tmp_path, schema)
+        assert nx.utils.graphs_equal(reloaded.graph, tree.graph)
+        assert reloaded.get_person(child)["birthplace"] == "Girona"
+        assert reloaded.graph[parent][spouse]["is_active"] is False
+        assert tree.store.person_count() == 3
+
+    def test_sql_queries_match_in_memory_results(self, tmp_path, schema, tree):
+        sqlite_tree = self._tree(tmp_path, schema)
+        self._family(tree)
+        grandparent, parent, spouse, child = self._family(sqlite_tree)
+        # The store answers on its own, without loading the tree
+        store = tree_sqlite.SQLiteTreeStore(str(tmp_path / "tree.db"))
+
+        assert set(store.subgraph_degrees(child, degree=1).nodes) == {child, parent}
+        assert set(store.subgraph_degrees(child, degree=2).nodes) == {child, parent, grandparent, spouse}
+        assert store.ancestors(child) == sqlite_tree.get_ancestors(child) == {parent: 1, grandparent: 2}
+        assert store.ancestors(child, max_depth=1) == {parent: 1}
+        assert store.descendants(grandparent) == sqlite_tree.get_descendants(grandparent) == {parent: 1, child: 2}
+        assert store.search("rent") == sqlite_tree.search_persons("rent") == [grandparent, child, parent]
+        assert store.search("RENT", limit=1) == [grandparent]
+
+        memory_ids = {tree.get_person(p)["firstname"]: p for p in tree.graph}
+        assert tree.get_ancestors(memory_ids["Kid"]) == {memory_ids["Pa"]: 1, memory_ids["Grand"]: 2}
+        assert tree.get_descendants(memory_ids["Grand"], max_depth=1) == {memory_ids["Pa"]: 1}
+        assert tree.search_persons("rent") == [memory_ids["Grand"], memory_ids["Kid"], memory_ids["Pa"]]
+
+    def test_lineage_queries_end_on_cycles(self):
+        store = tree_sqlite.SQLiteTreeStore(":memory:")
+        for person in ("a", "b", "c"):
+            store.put_person(person, {"firstname": person})
+        store.put_relationship("a", "b", {"type": "isChildOf"})
+        store.put_relationship("b", "a", {"type": "isChildOf"})
+        store.put_relationship("c", "a", {"type": "isChildOf"})
+        assert store.ancestors("a") == {"b": 1}
+        assert store.ancestors("c") == {"a": 1, "b": 2}
+        assert store.descendants("b") == {"a": 1, "c": 2}
+
+    def test_search_folds_case_beyond_ascii(self, tmp_path, schema, tree):
+        sqlite_tree = self._tree(tmp_path, schema)
+        for each in (tree, sqlite_tree):
+            each.add_person(firstname="Àlex", lastname="Straße")
+            each.add_person(firstname="Alex", lastname="Rovira")
+        for query in ("àlex", "STRASSE", "alex"):
+            names = [tree.get_person(p)["lastname"] for p in tree.search_persons(query)]
+            assert [sqlite_tree.get_person(p)["lastname"] for p in sqlite_tree.store.search(query)] == names
+        assert [tree.get_person(p)["lastname"] for p in tree.search_persons("àlex")] == ["Straße"]
+
+    def test_unsaved_changes_roll_back(self, tmp_path, schema):
+        tree = self._tree(tmp_path, schema, autosave=False)
+        kept = tree.add_person(firstname="Kept")
+        tree.save()
+        dropped = tree.add_person(firstname="Dropped")
+        tree.discard_pending()
+
+        reloaded = self._tree(tmp_path, schema)
+        assert reloaded.get_person(kept) is not None
+        assert reloaded.get_person(dropped) is None
+
+    def test_export_to_sqlite_file(self, tree, tmp_path, schema):
+        grandparent, parent, spouse, child = self._family(tree)
+        path = str(tmp_path / "exported.db")
+        tree.export_file(path)
+        exported = FamilyTree(backend="sqlite", sqlite_file=path, relationship_schema=schema)
+        assert nx.utils.graphs_equal(exported.graph, tree.graph)
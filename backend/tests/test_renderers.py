@@ -1,10 +1,18 @@
 """Tests that both renderers produce valid PNG bytes."""
 
+import math
+import sys
+
 import networkx as nx
 import pytest
 
-from backend.app.renderers.classical_tree import ClassicalTreeRenderer
-from backend.app.renderers.radial_tree import RadialAncestorRenderer, RadialDescendantRenderer
+from backend.app.renderers.classical_tree import ClassicalTreeRenderer, _assign_hlevels, _assign_vlevels
+from backend.app.renderers.radial_tree import (
+    RadialAncestorRenderer,
+    RadialDescendantRenderer,
+    _build_ancestor_fan,
+    _build_descendant_fan,
+)
 
 PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
@@ -65,3 +73,33 @@ class TestRadialDescendantRenderer:
         result = renderer.render(G)
         assert isinstance(result, bytes)
         assert result[:8] == PNG_SIGNATURE
+
+
+class TestLayoutWalks:
+    def test_levels_of_a_chain_deeper_than_the_recursion_limit(self):
+        depth = sys.getrecursionlimit() * 2
+        G = nx.DiGraph()
+        for generation in range(depth - 1):
+            G.add_edge(generation + 1, generation, type="isChildOf")
+        G, vlevels = _assign_vlevels(G)
+        assert vlevels == [0, depth - 1]
+        assert G.nodes[depth - 1]["vlevel"] == depth - 1
+        G, hlevels = _assign_hlevels(G, vlevels)
+        assert hlevels == [0] * depth
+
+    def test_fans_are_built_in_drawing_order(self, small_graph):
+        ancestors: list[tuple] = []
+        _build_ancestor_fan(small_graph, "c", 1, 0, math.pi, 0, ancestors)
+        assert ancestors == [("p", 1, 0, math.pi / 2, 0), ("gp", 2, 0, math.pi / 4, 0)]
+
+        descendants: list[tuple] = []
+        _build_descendant_fan(small_graph, "gp", 1, 0, math.pi, 3, descendants)
+        assert descendants == [("p", 1, 0, math.pi, 0), ("c", 2, 0, math.pi, 0)]
+
+    def test_descendant_wedges_are_proportional_to_descendant_counts(self, small_graph):
+        small_graph.add_node("p2", firstname="Parent", lastname="Two")
+        small_graph.add_edge("p2", "gp", type="isChildOf")
+        descendants: list[tuple] = []
+        _build_descendant_fan(small_graph, "gp", 1, 0, math.pi, 0, descendants, descendant_counts={"p": 2, "p2": 0})
+        assert descendants[:2] == [("p", 1, 0, math.pi * 3 / 4, 0), ("c", 2, 0, math.pi * 3 / 4, 0)]
+        assert descendants[2] == ("p2", 1, math.pi * 3 / 4, math.pi, 1)
@@ -0,0 +1,82 @@
+"""Compare the memory held by a loaded tree with and without shared attribute strings.
+
+Loads a synthetic tree from a binary snapshot, or from GML, which is much
+slower to parse while memory is traced, as ``FamilyTree`` does.  Then it
+measures the memory the graph holds as loaded and after
+``tree_attributes.AttributePool.compact_graph``.
+
+Usage:
+  python benchmarks/attribute_memory.py                  # 100k persons
+  python benchmarks/attribute_memory.py --sizes 10000 --formats gml snapshot
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tree_attributes  # noqa: E402
+import tree_snapshot  # noqa: E402
+from benchmarks.synthetic_tree import build_synthetic_tree  # noqa: E402
+
+_READERS = {"gml": nx.read_gml, "snapshot": tree_snapshot.read_snapshot}
+
+
+def _held(func, *args):
+    """Return the result of *func* and the memory it still holds once it returns."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        gc.collect()
+        held, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, held
+
+
+def _load_compacted(reader, path, pool):
+    graph = reader(path)
+    pool.compact_graph(graph)
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--formats", nargs="+", choices=sorted(_READERS), default=["snapshot"])
+    args = parser.parse_args()
+
+    print(f"{'Persons':>10} {'Format':>9} {'As loaded':>10} {'Compacted':>10} {'Saved':>7} {'Strings':>8}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            graph = build_synthetic_tree(size)
+            paths = {
+                "gml": os.path.join(temp_dir, f"tree_{size}.gml"),
+                "snapshot": os.path.join(temp_dir, f"tree_{size}{tree_snapshot.SNAPSHOT_EXTENSION}"),
+            }
+            for fmt in args.formats:
+                if fmt == "gml":
+                    nx.write_gml(graph, paths[fmt])
+                else:
+                    tree_snapshot.write_snapshot(graph, paths[fmt])
+                loaded, plain = _held(_READERS[fmt], paths[fmt])
+                del loaded
+                pool = tree_attributes.AttributePool(tree_attributes.person_fields())
+                compacted, pooled = _held(_load_compacted, _READERS[fmt], paths[fmt], pool)
+                assert nx.utils.nodes_equal(compacted.nodes(data=True), graph.nodes(data=True))
+                del compacted
+                print(
+                    f"{size:>10} {fmt:>9} {plain / 1e6:>9.1f}M {pooled / 1e6:>9.1f}M "
+                    f"{1 - pooled / plain:>6.0%} {len(pool):>8}"
+                )
+
+
+if __name__ == "__main__":
+    main()
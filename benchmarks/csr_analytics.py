@@ -0,0 +1,79 @@
+"""Time whole-tree analytics on the CSR snapshot against the networkx paths.
+
+Compares, on a synthetic tree, the search for everyone within N hops of a
+person as ``get_subgraph_degrees`` did it (``single_source_shortest_path_length``
+on an undirected copy), connected components and lineage depths with
+``tree_csr.CSRSnapshot``.  Building the snapshot is timed separately: it is
+paid once per change to the tree and shared by every query until the next.
+
+Usage:
+  python benchmarks/csr_analytics.py                       # 100k persons
+  python benchmarks/csr_analytics.py --persons 1000000 --hops 2 6
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tree_csr  # noqa: E402
+import tree_traversal  # noqa: E402
+from benchmarks.synthetic_tree import build_synthetic_tree  # noqa: E402
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persons", type=int, default=100_000)
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--hops", type=int, nargs="+", default=[2, 4, 8])
+    args = parser.parse_args()
+
+    graph = build_synthetic_tree(args.persons, generations=args.generations)
+    start = next(iter(graph))
+    print(f"{graph.number_of_nodes()} persons, {graph.number_of_edges()} relationships")
+    snapshot, build_seconds = _timed(tree_csr.CSRSnapshot, graph)
+    print(f"CSR snapshot built in {build_seconds:.2f}s")
+
+    rows = [
+        (
+            f"within {hops} hops",
+            lambda hops=hops: nx.single_source_shortest_path_length(graph.to_undirected(), start, cutoff=hops),
+            lambda hops=hops: snapshot.within_hops(start, hops),
+        )
+        for hops in args.hops
+    ]
+    rows.append(
+        (
+            "connected components",
+            lambda: nx.number_weakly_connected_components(graph),
+            snapshot.component_count,
+        )
+    )
+    rows.append(("lineage depths", lambda: tree_traversal.lineage_depths(graph), snapshot.lineage_depths))
+
+    print(f"{'Analysis':<22} {'networkx':>9} {'CSR':>9} {'Speedup':>8}  Result")
+    for label, networkx_path, csr_path in rows:
+        expected, networkx_seconds = _timed(networkx_path)
+        result, csr_seconds = _timed(csr_path)
+        assert result == expected, label
+        if isinstance(result, tuple):
+            result = result[0]
+        size = len(result) if isinstance(result, dict) else result
+        print(
+            f"{label:<22} {networkx_seconds:>8.3f}s {csr_seconds:>8.3f}s "
+            f"{networkx_seconds / csr_seconds:>7.1f}x  {size}"
+        )
+
+
+if __name__ == "__main__":
+    main()
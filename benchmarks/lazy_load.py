@@ -0,0 +1,87 @@
+"""Compare loading a tree in full with loading its topology and summary fields first.
+
+Gives every person of a synthetic tree notes and a few picture URLs, saves
+it as a binary snapshot and opens it with ``FamilyTree`` as the backend does
+on startup, with and without ``lazy_attributes``.  It reports the time until
+the tree is ready, the memory the loaded tree holds, and the time a lazily
+loaded tree then takes to read the details of one person.
+
+Usage:
+  python benchmarks/lazy_load.py                  # 100k persons
+  python benchmarks/lazy_load.py --sizes 10000 1000000 --notes 10
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tree_snapshot  # noqa: E402
+from benchmarks.synthetic_tree import build_synthetic_tree  # noqa: E402
+from familytree import FamilyTree  # noqa: E402
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _held(func, *args):
+    """Return the memory the result of *func* still holds once it returns."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        gc.collect()
+        held, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return held
+
+
+def _add_details(graph, notes):
+    for position, (person_id, attrs) in enumerate(graph.nodes(data=True)):
+        attrs["notes_json"] = json.dumps(
+            [{"text": f"Note {number} about {attrs['firstname']} {attrs['lastname']}", "author": "benchmark"} for number in range(notes)]
+        )
+        attrs["pictures"] = [f"https://example.org/pictures/{person_id}/{number}.jpg" for number in range(position % 4)]
+
+
+def _open(path, lazy):
+    return FamilyTree(backend="local", localfile=path, autosave=False, lazy_attributes=lazy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--notes", type=int, default=3, help="notes per person")
+    args = parser.parse_args()
+
+    print(f"{'Persons':>10} {'Mode':>6} {'Load':>8} {'Held':>9} {'First get_person':>17}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            graph = build_synthetic_tree(size)
+            _add_details(graph, args.notes)
+            path = os.path.join(temp_dir, f"tree_{size}{tree_snapshot.SNAPSHOT_EXTENSION}")
+            tree_snapshot.write_snapshot(graph, path)
+            person = next(iter(graph))
+            for label, lazy in (("full", False), ("lazy", True)):
+                tree, load_seconds = _timed(_open, path, lazy)
+                _, get_seconds = _timed(tree.get_person, person)
+                # The tree adds the generation level of each person
+                assert {key: value for key, value in tree.get_person(person).items() if key != "level"} == graph.nodes[person]
+                del tree
+                held = _held(_open, path, lazy)
+                print(f"{size:>10} {label:>6} {load_seconds:>7.2f}s {held / 1e6:>8.1f}M {get_seconds * 1e6:>15.0f}us")
+
+
+if __name__ == "__main__":
+    main()
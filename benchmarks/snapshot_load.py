@@ -0,0 +1,52 @@
+"""Compare tree load time: binary snapshot versus ``nx.read_gml``.
+
+Usage:
+  python benchmarks/snapshot_load.py                 # 10k, 100k and 1M persons
+  python benchmarks/snapshot_load.py --sizes 10000 100000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tree_snapshot  # noqa: E402
+from benchmarks.synthetic_tree import build_synthetic_tree  # noqa: E402
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'Persons':>10} {'GML size':>10} {'Snap size':>10} {'read_gml':>10} {'snapshot':>10} {'Speedup':>8}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            graph = build_synthetic_tree(size)
+            gml_path = os.path.join(temp_dir, f"tree_{size}.gml")
+            snap_path = os.path.join(temp_dir, f"tree_{size}{tree_snapshot.SNAPSHOT_EXTENSION}")
+            nx.write_gml(graph, gml_path)
+            tree_snapshot.write_snapshot(graph, snap_path)
+            _, gml_seconds = _timed(nx.read_gml, gml_path)
+            loaded, snap_seconds = _timed(tree_snapshot.read_snapshot, snap_path)
+            assert loaded.number_of_nodes() == graph.number_of_nodes()
+            assert loaded.number_of_edges() == graph.number_of_edges()
+            print(
+                f"{size:>10} {os.path.getsize(gml_path) / 1e6:>9.1f}M {os.path.getsize(snap_path) / 1e6:>9.1f}M "
+                f"{gml_seconds:>9.2f}s {snap_seconds:>9.2f}s {gml_seconds / snap_seconds:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Synthetic family trees for benchmarks.
+
+Builds a multi-generation tree in the same shape ``FamilyTree`` stores:
+person nodes with the usual attributes, ``isChildOf`` edges from child to
+each parent and ``isSpouseOf`` edges between partners.
+"""
+
+import random
+import uuid
+
+import networkx as nx
+
+_FIRSTNAMES = ["Ana", "Luis", "Marta", "Jordi", "Elena", "Pau", "Clara", "Marc", "Laia", "Joan", "Nuria", "Pere"]
+_LASTNAMES = ["Garcia", "Farell", "Torres", "Moreno", "Puig", "Soler", "Vidal", "Roca", "Serra", "Ferrer"]
+_PLACES = ["Barcelona", "Madrid", "Girona", "Valencia", "Lleida", "Tarragona", "Zaragoza", "Sevilla"]
+
+
+def build_synthetic_tree(persons, generations=10, seed=0):
+    """Return a DiGraph with *persons* nodes spread over *generations* generations."""
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    per_generation = max(2, persons // generations)
+    created = 0
+    previous_couples = []
+    for generation in range(generations):
+        remaining = persons - created
+        if remaining <= 0:
+            break
+        count = remaining if generation == generations - 1 else min(per_generation, remaining)
+        current = []
+        for _ in range(count):
+            person_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            year = 1500 + generation * 25 + rng.randint(0, 10)
+            graph.add_node(
+                person_id,
+                firstname=rng.choice(_FIRSTNAMES),
+                lastname=rng.choice(_LASTNAMES),
+                birthdate=str(year),
+                birthplace=rng.choice(_PLACES),
+                gender=rng.choice(["male", "female"]),
+                isAlive=generation >= generations - 3,
+            )
+            current.append(person_id)
+            if previous_couples:
+                for parent in rng.choice(previous_couples):
+                    graph.add_edge(person_id, parent, type="isChildOf")
+        created += count
+        # Pair most of the generation into couples that parent the next one
+        shuffled = current[:]
+        rng.shuffle(shuffled)
+        previous_couples = []
+        for first, second in zip(shuffled[0::2], shuffled[1::2]):
+            if rng.random() < 0.8:
+                graph.add_edge(first, second, type="isSpouseOf", is_active=True)
+                previous_couples.append((first, second))
+            else:
+                previous_couples.append((first,))
+        if not previous_couples:
+            previous_couples = [(person,) for person in current]
+    return graph
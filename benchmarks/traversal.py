@@ -0,0 +1,101 @@
+"""Time the iterative tree walks on deep synthetic trees.
+
+Runs every walk that used to be recursive (generation levels, longest
+ancestor chain, classical-tree layout, fan charts) on a 50-generation tree,
+and the old recursive generation-level walk for comparison, which fails
+once a component is deeper than the recursion limit.
+
+Usage:
+  python benchmarks/traversal.py                       # 100k persons, 50 generations
+  python benchmarks/traversal.py --persons 10000 --generations 50
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tree_traversal  # noqa: E402
+from backend.app.renderers.classical_tree import _assign_hlevels, _assign_vlevels  # noqa: E402
+from backend.app.renderers.radial_tree import _build_ancestor_fan, _build_descendant_fan  # noqa: E402
+from benchmarks.synthetic_tree import build_synthetic_tree  # noqa: E402
+
+
+def _recursive_levels(graph, start):
+    """The generation-level walk as it was written before tree_traversal."""
+    levels = {}
+
+    def walk(node, level):
+        levels[node] = level
+        for neighbor, step in tree_traversal.typed_neighbors(graph, node, tree_traversal.GENERATION_STEPS):
+            if neighbor not in levels:
+                walk(neighbor, level + step)
+
+    walk(start, 0)
+    return levels
+
+
+def _all_levels(graph):
+    levels = {}
+    for node in graph:
+        if node not in levels:
+            levels.update(tree_traversal.generation_offsets(graph, node))
+    return levels
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    except RecursionError:
+        return "RecursionError", time.perf_counter() - start
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persons", type=int, default=100_000)
+    parser.add_argument("--generations", type=int, default=50)
+    args = parser.parse_args()
+
+    graph = build_synthetic_tree(args.persons, generations=args.generations)
+    start = next(iter(graph))
+    leaf = next(node for node in reversed(list(graph)) if tree_traversal.parents(graph, node))
+    root = next(node for node in graph if tree_traversal.children(graph, node))
+    print(f"{graph.number_of_nodes()} persons, {graph.number_of_edges()} relationships, {args.generations} generations")
+
+    def layout():
+        layout_graph, vlevels = _assign_vlevels(graph.copy())
+        return _assign_hlevels(layout_graph, vlevels)[1]
+
+    def ancestor_fan():
+        segments = []
+        _build_ancestor_fan(graph, leaf, 1, 0, math.pi, 0, segments, max_lvl=12)
+        return len(segments)
+
+    def descendant_fan():
+        segments = []
+        _build_descendant_fan(graph, root, 1, 0, math.pi, 0, segments, max_lvl=12)
+        return len(segments)
+
+    rows = [
+        ("generation levels (recursive)", _recursive_levels, graph, start),
+        ("generation levels", _all_levels, graph),
+        ("ancestor/descendant depths", lambda: tree_traversal.lineage_depths(graph)[0]),
+        ("classical tree layout", layout),
+        ("ancestor fan, 12 generations", ancestor_fan),
+        ("descendant fan, 12 generations", descendant_fan),
+    ]
+    print(f"{'Walk':<32} {'Time':>9}  Result")
+    for label, func, *func_args in rows:
+        result, seconds = _timed(func, *func_args)
+        if isinstance(result, (dict, list)):
+            result = f"{len(result)} entries"
+        print(f"{label:<32} {seconds:>8.2f}s  {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,10 @@ Usage examples:
   python cli.py tree "Alba Farell Torres" --degree 3
   python cli.py info
   python cli.py activate-all
+  python cli.py search garcia
+  python cli.py --file familytree.gml convert familytree.ftsnap
+  python cli.py --file familytree.gml convert familytree.db
+  python cli.py --backend sqlite --file familytree.db tree "Alba Farell Torres"
 """
 
 import argparse
@@ -29,6 +33,9 @@ def _build_tree(args: argparse.Namespace) -> FamilyTree:
     if backend == "local":
         localfile = args.file or os.getenv("TREE_LOCAL_FILE", "familytree.gml")
         return FamilyTree(backend="local", localfile=localfile, verbose=args.verbose)
+    elif backend == "sqlite":
+        sqlite_file = args.file or os.getenv("TREE_SQLITE_FILE", "familytree.db")
+        return FamilyTree(backend="sqlite", sqlite_file=sqlite_file, verbose=args.verbose)
     elif backend == "azstorage":
         return FamilyTree(
             backend="azstorage",
@@ -80,6 +87,14 @@ def cmd_list(tree: FamilyTree, args: argparse.Namespace) -> None:
     print(f"\nTotal: {len(persons)} persons")
 
 
+def cmd_search(tree: FamilyTree, args: argparse.Namespace) -> None:
+    """Find persons whose full name contains the query."""
+    matches = tree.search_persons(args.query, limit=args.limit)
+    for pid in matches:
+        print(f"{_fullname(tree, pid):<40} {pid}")
+    print(f"\n{len(matches)} match(es)")
+
+
 def cmd_show(tree: FamilyTree, args: argparse.Namespace) -> None:
     """Show details for a person."""
     pid = _resolve_person(tree, args.person)
@@ -198,17 +213,6 @@ def cmd_add_rel(tree: FamilyTree, args: argparse.Namespace) -> None:
     )
     print(f"Created: {_fullname(tree, pid1)} --[{rel_type}]--> {_fullname(tree, pid2)}")
 
-    # For spouse, also create reverse edge
-    if rel_type == "isSpouseOf":
-        tree.add_relationship(
-            pid2,
-            pid1,
-            type=rel_type,
-            start_date=args.start_date,
-            override_warnings=args.override_warnings,
-        )
-        print(f"Created: {_fullname(tree, pid2)} --[{rel_type}]--> {_fullname(tree, pid1)}")
-
 
 def cmd_deactivate_rel(tree: FamilyTree, args: argparse.Namespace) -> None:
     """Deactivate a relationship."""
@@ -242,8 +246,7 @@ def cmd_tree(tree: FamilyTree, args: argparse.Namespace) -> None:
     pid = _resolve_person(tree, args.person)
     degree = args.degree
 
-    subgraph = tree.get_subgraph_degrees(pid, degree=degree)
-    tree.assign_generation_levels()
+    subgraph = tree.get_subgraph_degrees(pid, degree=degree, max_nodes=args.max_nodes)
 
     # Group by level
     levels: dict[int, list[str]] = {}
@@ -252,7 +255,8 @@ def cmd_tree(tree: FamilyTree, args: argparse.Namespace) -> None:
         levels.setdefault(lv, []).append(nid)
 
     print(f"\nTree centered on: {_fullname(tree, pid)} (degree={degree})")
-    print(f"Nodes: {subgraph.number_of_nodes()}, Edges: {subgraph.number_of_edges()}\n")
+    truncated = " (truncated)" if subgraph.graph.get("truncated") else ""
+    print(f"Nodes: {subgraph.number_of_nodes()}, Edges: {subgraph.number_of_edges()}{truncated}\n")
 
     for lv in sorted(levels.keys()):
         names = [_fullname(tree, n) for n in levels[lv]]
@@ -261,6 +265,37 @@ def cmd_tree(tree: FamilyTree, args: argparse.Namespace) -> None:
     print()
 
 
+def cmd_path(tree: FamilyTree, args: argparse.Namespace) -> None:
+    """Show the persons on the shortest paths between two persons."""
+    pid1 = _resolve_person(tree, args.person1)
+    pid2 = _resolve_person(tree, args.person2)
+    subgraph = tree.get_subgraph_between(
+        pid1,
+        pid2,
+        types=["isChildOf"] if args.blood_only else None,
+        active_only=not args.include_inactive,
+        max_paths=args.max_paths,
+        max_nodes=args.max_nodes,
+    )
+
+    if subgraph.graph["distance"] is None:
+        suffix = " (node budget reached)" if subgraph.graph["truncated"] else ""
+        print(f"No path between {_fullname(tree, pid1)} and {_fullname(tree, pid2)}{suffix}.")
+        return
+    truncated = " (truncated)" if subgraph.graph["truncated"] else ""
+    print(f"\nPaths between {_fullname(tree, pid1)} and {_fullname(tree, pid2)}")
+    print(f"Distance: {subgraph.graph['distance']}, shortest paths: {subgraph.graph['paths']}{truncated}\n")
+
+    levels: dict[int, list[str]] = {}
+    for nid in subgraph.nodes():
+        lv = tree.graph.nodes[nid].get("level", 0)
+        levels.setdefault(lv, []).append(nid)
+    for lv in sorted(levels.keys()):
+        names = [_fullname(tree, n) for n in levels[lv]]
+        print(f"  Level {lv}: {', '.join(sorted(names))}")
+    print()
+
+
 def cmd_info(tree: FamilyTree, args: argparse.Namespace) -> None:
     """Show general tree statistics."""
     n_persons = tree.graph.number_of_nodes()
@@ -271,6 +306,7 @@ def cmd_info(tree: FamilyTree, args: argparse.Namespace) -> None:
 
     print(f"Persons:            {n_persons}")
     print(f"Relationships:      {n_edges} ({n_active} active, {n_inactive} inactive)")
+    print(f"Connected groups:   {tree.get_component_count()}")
     print(f"Longest ancestor chain: {longest}")
 
     # Relationship types breakdown
@@ -297,6 +333,12 @@ def cmd_export(tree: FamilyTree, args: argparse.Namespace) -> None:
     print(json.dumps(data, indent=2, default=str))
 
 
+def cmd_convert(tree: FamilyTree, args: argparse.Namespace) -> None:
+    """Write the tree to another file, converting between GML, binary snapshot and SQLite."""
+    tree.export_file(args.output)
+    print(f"Written: {args.output} ({tree.graph.number_of_nodes()} persons, {tree.graph.number_of_edges()} relationships)")
+
+
 # ── Argument parser ───────────────────────────────────────────────────────
 
 def main() -> None:
@@ -306,8 +348,8 @@ def main() -> None:
     )
 
     # Global options
-    parser.add_argument("--backend", choices=["local", "azstorage"], help="Storage backend (default: $TREE_BACKEND or 'local')")
-    parser.add_argument("--file", help="Local GML file path (default: $TREE_LOCAL_FILE or 'familytree.gml')")
+    parser.add_argument("--backend", choices=["local", "sqlite", "azstorage"], help="Storage backend (default: $TREE_BACKEND or 'local')")
+    parser.add_argument("--file", help="Local GML or .ftsnap snapshot file path (default: $TREE_LOCAL_FILE or 'familytree.gml'), or SQLite database with --backend sqlite (default: $TREE_SQLITE_FILE or 'familytree.db')")
     parser.add_argument("--az-account", help="Azure Storage account name")
     parser.add_argument("--az-key", help="Azure Storage account key")
     parser.add_argument("--az-container", help="Azure Storage container (default: familytreejson)")
@@ -319,6 +361,11 @@ def main() -> None:
     # list
     sub.add_parser("list", help="List all persons")
 
+    # search
+    p = sub.add_parser("search", help="Search persons by name")
+    p.add_argument("query", help="Part of the full name (case-insensitive)")
+    p.add_argument("--limit", type=int, help="Maximum number of results")
+
     # show
     p = sub.add_parser("show", help="Show person details")
     p.add_argument("person", help="Person name or ID")
@@ -373,6 +420,16 @@ def main() -> None:
     p = sub.add_parser("tree", help="Show tree centered on a person")
     p.add_argument("person", help="Person name or ID")
     p.add_argument("--degree", "-d", type=int, default=3, help="Degree of separation (default: 3)")
+    p.add_argument("--max-nodes", type=int, default=None, help="Maximum number of persons to show, closest kin first")
+
+    # path
+    p = sub.add_parser("path", help="Show the shortest paths between two persons")
+    p.add_argument("person1", help="Person 1 name or ID")
+    p.add_argument("person2", help="Person 2 name or ID")
+    p.add_argument("--blood-only", action="store_true", help="Only follow parent-child relationships")
+    p.add_argument("--include-inactive", action="store_true", help="Also follow inactive relationships")
+    p.add_argument("--max-paths", type=int, default=100, help="Maximum number of paths to include (default: 100)")
+    p.add_argument("--max-nodes", type=int, default=100000, help="Maximum number of persons to visit (default: 100000)")
 
     # info
     sub.add_parser("info", help="Show tree statistics")
@@ -383,11 +440,16 @@ def main() -> None:
     p.add_argument("--degree", "-d", type=int, default=3, help="Degree (with --person)")
     p.add_argument("--include-inactive", action="store_true", help="Include inactive relationships")
 
+    # convert
+    p = sub.add_parser("convert", help="Convert the tree to GML, binary snapshot (.ftsnap) or SQLite (.db)")
+    p.add_argument("output", help="Output file; the format follows the extension (.gml, .ftsnap, .db or .sqlite)")
+
     args = parser.parse_args()
     tree = _build_tree(args)
 
     commands = {
         "list": cmd_list,
+        "search": cmd_search,
         "show": cmd_show,
         "add": cmd_add,
         "edit": cmd_edit,
@@ -397,8 +459,10 @@ def main() -> None:
         "reactivate-rel": cmd_reactivate_rel,
         "activate-all": cmd_activate_all,
         "tree": cmd_tree,
+        "path": cmd_path,
         "info": cmd_info,
         "export": cmd_export,
+        "convert": cmd_convert,
     }
 
     commands[args.command](tree, args)
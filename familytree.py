@@ -1,10 +1,25 @@
 import networkx as nx
+import copy
 import uuid
 import os
 import json
 import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from gremlin_python.driver import client, serializer
-from azure.storage.blob import BlobServiceClient
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotModifiedError
+from azure.storage.blob import BlobServiceClient, ContentSettings
+import tree_attributes
+import tree_csr
+import tree_indexes
+import tree_kinship
+import tree_snapshot
+import tree_sqlite
+import tree_staging
+import tree_stream
+import tree_traversal
 from tree_validation import (
     enforce_issues,
     validate_person_dates,
@@ -13,20 +28,64 @@ from tree_validation import (
 )
 
 
+class StorageConflictError(RuntimeError):
+    """Raised when the stored tree was modified by another writer since it was loaded."""
+
+
+class TreeChangedError(RuntimeError):
+    """Raised by a kinship walk when the tree is modified before the walk has ended."""
+
+
+class Transaction:
+    """The mutations of a FamilyTree.transaction() block, which undo() can still revert once the block has ended."""
+
+    def __init__(self, tree):
+        self._tree = tree
+        self.undo_log = []
+
+    def undo(self, unless_changed=None):
+        """Revert the mutations, unless *unless_changed*, called under the tree lock, returns True; says if they were."""
+        return self._tree._undo(self.undo_log, unless_changed)
+
+
 class FamilyTree:
     # Backends can be local, azstorage, cosmosdb
     # If local is specified, the following parameter must be provided: localfile
     # If azstorage is specified, the following parameters must be provided: azstorage, azstoragekey
     # If cosmosdb is specified, the following parameters must be provided: cosmosdbhost, cosmosdbkey
+    # If a journal is provided (any store with append/list/truncate, e.g. ChangeHistoryStore), every mutation
+    # is appended to it as a compact record and the backend file only gets rewritten every checkpoint_interval records
+    # storage_format is 'gml' or 'snapshot' (binary, see tree_snapshot.py); by default it follows the file/blob extension
+    # With write_behind=True, save() only marks the tree dirty and a background thread writes it at most once every
+    # flush_interval seconds; use wait_until_durable() when a caller needs the change persisted. If another writer
+    # changed the blob, the edits stay in memory unsaved and every later save() raises StorageConflictError until load()
+    # discards them
+    # cache_dir keeps the last downloaded blob and its ETag on disk, so a restart only issues a conditional GET;
+    # revalidate() (at most once every revalidate_interval seconds) reloads the tree when another instance changed it
+    # content_encoding ('gzip' or 'zstd') compresses the blob; compressed and plain blobs are both readable
+    # backend='sqlite' stores one row per person/relationship in sqlite_file: every mutation writes only its rows
+    # (committed by save()). The tree is still loaded whole and queried in memory; to query a tree too large to load,
+    # use tree_sqlite.SQLiteTreeStore on the file directly
+    # lazy_attributes loads snapshot trees with only the summary fields of each person (tree_snapshot.SUMMARY_FIELDS):
+    # the other attributes, such as notes and pictures, are parsed when the person is first used, see _load_details()
     def __init__(self, 
                  backend='local', autosave=True,
                  localfile=None, 
+                 sqlite_file=None,
                  azstorage_account=None, azstorage_key=None, azstorage_container=None, azstorage_blob=None, 
                  cosmosdb_host=None, cosmosdb_db=None, cosmosdb_collection=None, cosmosdb_key=None,
                  relationship_schema=None,
+                 journal=None, checkpoint_interval=500,
+                 storage_format=None,
+                 write_behind=False, flush_interval=5.0,
+                 cache_dir=None, revalidate_interval=60.0,
+                 content_encoding=None,
+                 lazy_attributes=False,
                  verbose=False):
         self.backend = backend
         self.localfile = localfile
+        self.sqlite_file = sqlite_file
+        self.store = None
         self.azstorage_account = azstorage_account
         self.azstorage_container = azstorage_container
         self.azstorage_blob = azstorage_blob
@@ -37,6 +96,52 @@ class FamilyTree:
         self.cosmosdb_key = cosmosdb_key
         self.autosave = autosave
         self.relationship_schema = relationship_schema
+        self.storage_format = storage_format or tree_snapshot.format_for_path(localfile if backend == 'local' else azstorage_blob)
+        if self.storage_format not in ('gml', 'snapshot'):
+            raise ValueError("Invalid storage format specified, valid formats are: gml, snapshot")
+        self.journal = journal
+        self.checkpoint_interval = checkpoint_interval
+        self._journal_seq = 0                   # Sequence number of the last journaled mutation
+        self._journal_pending = []              # Records applied to the graph but not yet appended to the journal
+        self._journal_since_checkpoint = 0      # Records in the journal that are not part of the checkpoint
+        self._checkpoint_seq = 0                # Journal position captured by the last checkpoint
+        self._undo_log = None                   # Inverse records of the open transaction, see transaction()
+        self._transaction = None
+        self._deferred_levels = None            # Nodes whose generation level must be recomputed, see _batch_levels()
+        self._derived_cache = {}                # Cached whole-graph computations, see _derived()
+        self._derived_graph = None
+        self._node_ids = None                   # Dense integer id of every person, built on first use
+        self._attribute_pool = tree_attributes.AttributePool(tree_attributes.person_fields())  # Shared attribute strings
+        self.lazy_attributes = lazy_attributes
+        self._details = None                    # Unparsed details of the persons not used since a lazy load
+        self._adjacency = None                  # Parents, children and spouses of every person, built on first use
+        self._ancestry = None                   # Ancestry index for cycle checks, built on first use
+        self._lineage = None                    # Numbered ancestor/descendant closures, built on first use
+        self._counts = None                     # Ancestor/descendant counts of every person, built on first use
+        self._kinship = {}                      # Kinship tables of recently asked persons, see iter_kinship()
+        self.kinship_cache_size = 16
+        self._lock = threading.RLock()          # Guards the graph while it is mutated or serialized
+        self._blob_client = None
+        self._etag = None                       # ETag of the blob version this tree is based on
+        self.cache_dir = cache_dir
+        tree_stream.check_encoding(content_encoding)
+        self.content_encoding = content_encoding
+        self.revalidate_interval = revalidate_interval
+        self._last_revalidation = time.monotonic()
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self._flush_cond = threading.Condition()
+        self._dirty_generation = 0              # Incremented by every save() request
+        self._flushed_generation = 0            # Last generation written by the flusher
+        self._checkpoint_requested = False
+        self._flush_now = False
+        self._flush_error = None
+        self._conflict = None                   # StorageConflictError that stopped the flusher, see _flush_loop()
+        self._closing = False
+        self._flusher = None
+        if self.write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, name="familytree-flusher", daemon=True)
+            self._flusher.start()
         if self.backend == "local" and len(self.localfile) > 0:
             self.tempfile = os.path.splitext(self.localfile)[0] + "_temp" + os.path.splitext(self.localfile)[1]
         # Create new graph or load it
@@ -45,13 +150,16 @@ class FamilyTree:
                 raise ValueError("Local file must be specified to load data when using backend=local")
             elif not os.path.exists(self.localfile):
                 self.graph = nx.DiGraph()
-                self.save_local()
+                self.replay_journal()
+                self.save(checkpoint=True)
             else:
                 try:
                     self.load_local()
                 except Exception as e:
                     # Error loading local file, initializating empty graph
                     self.graph = nx.DiGraph()
+                    self._details = None
+                    self.replay_journal()
         # To Do: mimick local behavior
         elif self.backend == 'azstorage':
             if not self.azstorage_account or not self.azstorage_key or not self.azstorage_container or not self.azstorage_blob:
@@ -63,10 +171,15 @@ class FamilyTree:
             else:
                 # Error loading Azure Storage file, initializing empty graph
                 self.graph = nx.DiGraph()
+                self.replay_journal()
                 try:
-                    self.save_azstorage()
+                    self.save(checkpoint=True)
                 except Exception as e:
                     print(f"Error saving Azure Storage file: {e}")
+        elif self.backend == 'sqlite':
+            if not self.sqlite_file:
+                raise ValueError("SQLite file must be specified to load data when using backend=sqlite")
+            self.load_sqlite()
         elif self.backend == 'cosmosdb':
             self.load_cosmosdb()
         elif self.backend == 'cosmosdb':
@@ -81,16 +194,120 @@ class FamilyTree:
             )
         else:
             raise ValueError("Invalid backend specified")
-    def save(self):
+    def save(self, checkpoint=False):
+        # In write-behind mode just record that there is something to write, the flusher thread does the rest
+        if self.write_behind and threading.current_thread() is not self._flusher and not self._closing:
+            with self._flush_cond:
+                self._dirty_generation += 1
+                self._checkpoint_requested = self._checkpoint_requested or checkpoint
+                self._flush_cond.notify_all()
+                if self._conflict is not None:
+                    raise self._conflict
+            return True
+        # With a journal, only append the pending mutation records unless a full checkpoint is due.
+        # A save without pending records means the graph was changed directly, so it is checkpointed.
+        if self.journal is not None and not checkpoint and self._journal_pending:
+            if self._journal_since_checkpoint + len(self._journal_pending) <= self.checkpoint_interval:
+                self.flush_journal()
+                return True
         # Save the graph to the specified backend
         if self.backend == 'local':
-            self.save_local()
+            saved = self.save_local()
         elif self.backend == 'azstorage':
-            self.save_azstorage()
+            saved = self.save_azstorage()
+        elif self.backend == 'sqlite':
+            saved = self.save_sqlite(checkpoint)
         elif self.backend == 'cosmosdb':
-            self.save_cosmosdb()
+            saved = self.save_cosmosdb()
         else:
             raise ValueError("Invalid backend specified")
+        # The checkpoint now contains every journaled record, so the journal can start over.
+        # Records applied after the checkpoint was serialized stay pending.
+        if saved and self.journal is not None:
+            with self._lock:
+                self.journal.truncate()
+                self._journal_pending = [record for record in self._journal_pending if record["seq"] > self._checkpoint_seq]
+                self._journal_since_checkpoint = 0
+        return saved
+    # Serialize a checkpoint under the lock, so that it matches the journal position it records
+    def _write_checkpoint(self, path):
+        with self._lock:
+            if self.journal is not None:
+                self.graph.graph['journal_seq'] = self._journal_seq
+            self._checkpoint_seq = self._journal_seq
+            self.write_file(path)
+    ###############
+    # Write-behind #
+    ###############
+    def _flush_loop(self):
+        last_flush = 0.0
+        while True:
+            with self._flush_cond:
+                # After a conflict nothing is written until load() discards the local edits
+                while (self._flushed_generation == self._dirty_generation or self._conflict is not None) and not self._closing:
+                    self._flush_cond.wait()
+                if self._flushed_generation == self._dirty_generation or self._conflict is not None:
+                    return
+                # Coalesce the edits that arrive before the interval since the last upload has elapsed
+                while not (self._closing or self._flush_now):
+                    remaining = last_flush + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._flush_cond.wait(remaining)
+                generation = self._dirty_generation
+                checkpoint = self._checkpoint_requested
+                self._checkpoint_requested = False
+                self._flush_now = False
+            error = None
+            try:
+                if not self.save(checkpoint=checkpoint):
+                    error = RuntimeError("Saving the family tree failed")
+            except Exception as e:
+                error = e
+            last_flush = time.monotonic()
+            with self._flush_cond:
+                self._flush_error = error
+                if error is None:
+                    self._flushed_generation = generation
+                elif isinstance(error, StorageConflictError):
+                    # Retrying cannot succeed and revalidate() must not replace the edits, so the tree stays dirty
+                    self._conflict = error
+                    self._checkpoint_requested = self._checkpoint_requested or checkpoint
+                    print(f"Error flushing family tree, the local edits were not saved: {error}")
+                else:
+                    # Transient failure: keep the tree dirty so the next interval retries
+                    self._checkpoint_requested = self._checkpoint_requested or checkpoint
+                    print(f"Error flushing family tree, will retry: {error}")
+                self._flush_cond.notify_all()
+    # Block until every save() requested so far has been written, raising the last flush error if any
+    def wait_until_durable(self, timeout=None):
+        if not self.write_behind:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._flush_cond:
+            target = self._dirty_generation
+            self._flush_now = True
+            self._flush_cond.notify_all()
+            while self._flushed_generation < target:
+                if self._flush_error is not None:
+                    raise self._flush_error
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Timed out waiting for the family tree to be saved")
+                self._flush_cond.wait(remaining)
+            if self._flush_error is not None:
+                raise self._flush_error
+        return True
+    # Write any pending changes and stop the background flusher
+    def close(self, timeout=None):
+        if not self.write_behind or self._flusher is None:
+            return
+        with self._flush_cond:
+            self._closing = True
+            self._flush_cond.notify_all()
+        self._flusher.join(timeout)
+        if self._flush_error is not None:
+            raise self._flush_error
     def save_local(self):
         # Save the graph to a local file
         # if self.localfile and self.tempfile:
@@ -106,37 +323,158 @@ class FamilyTree:
             temp_dir = tempfile.TemporaryDirectory()
             temp_file = os.path.join(temp_dir.name, "graph.gml")
             try:
-                nx.write_gml(self.graph, temp_file)
+                self._write_checkpoint(temp_file)
             except Exception as e:
                 print(f"Error saving graph to temporary file: {e}")
-            finally:
-                # Move the temporary file to the original location
-                if os.path.exists(temp_file):
-                    os.replace(temp_file, self.localfile)
+                return False
+            # Move the temporary file to the original location
+            if os.path.exists(temp_file):
+                os.replace(temp_file, self.localfile)
+            return True
         else:
             raise ValueError("Local file must be specified to save data when using backend=local")
-    # Save the graph to a local file in a local temporary directory and upload it to blob storage
+    # The blob client is created once and reused for every load and save
+    def _get_blob_client(self):
+        if self._blob_client is None:
+            blob_service_client = BlobServiceClient.from_connection_string(f"DefaultEndpointsProtocol=https;AccountName={self.azstorage_account};AccountKey={self.azstorage_key}")
+            self._blob_client = blob_service_client.get_blob_client(container=self.azstorage_container, blob=self.azstorage_blob)
+        return self._blob_client
+    # Serialize the graph into (optionally compressed) chunks on disk and stream them to blob storage from there, as a
+    # staged block upload without a length. The file is the new cache copy when there is a cache directory.
+    # The upload is conditional on the ETag of the version we loaded, so changes from other instances are never overwritten.
     def save_azstorage(self):
         if self.azstorage_account and self.azstorage_key and self.azstorage_container and self.azstorage_blob:
-            blob_service_client = BlobServiceClient.from_connection_string(f"DefaultEndpointsProtocol=https;AccountName={self.azstorage_account};AccountKey={self.azstorage_key}")
-            blob_client = blob_service_client.get_blob_client(container=self.azstorage_container, blob=self.azstorage_blob)
-            temp_dir = tempfile.TemporaryDirectory()
-            temp_file = os.path.join(temp_dir.name, "graph.gml")
+            blob_client = self._get_blob_client()
+            cache_file = self._open_cache_file()
+            spool = cache_file if cache_file is not None else tempfile.TemporaryFile()
             try:
-                nx.write_gml(self.graph, temp_file)
-                with open(temp_file, "rb") as data:
-                    blob_client.upload_blob(data, overwrite=True)
+                self._write_encoded_checkpoint(spool)
+                spool.seek(0)
+                chunks = iter(lambda: spool.read(tree_stream.CHUNK_SIZE), b"")
+                options = {"content_settings": ContentSettings(content_encoding=self.content_encoding)}
+                if self._etag:
+                    result = blob_client.upload_blob(chunks, overwrite=True, etag=self._etag, match_condition=MatchConditions.IfNotModified, **options)
+                else:
+                    result = blob_client.upload_blob(chunks, overwrite=False, **options)
+            except (ResourceModifiedError, ResourceExistsError) as e:
+                self._discard_cache(cache_file)
+                raise StorageConflictError(f"The tree in Azure Storage was modified by another writer: {e}") from e
             except Exception as e:
+                self._discard_cache(cache_file)
                 print(f"Error saving graph to Azure Storage: {e}")
+                return False
+            finally:
+                if cache_file is None:
+                    spool.close()
+            self._etag = result.get('etag')
+            self._commit_cache(cache_file, self._etag)
+            return True
+    # Like _write_checkpoint, but encoded into an open file, so the lock is released before the upload starts.
+    # The snapshot or GML is produced a section/line at a time and never held whole in memory.
+    def _write_encoded_checkpoint(self, handle):
+        with self._lock:
+            if self.journal is not None:
+                self.graph.graph['journal_seq'] = self._journal_seq
+            self._checkpoint_seq = self._journal_seq
+            if self.storage_format != 'snapshot':
+                self._load_all_details()
+            for chunk in tree_stream.iter_encoded(self.graph, self.storage_format, self.content_encoding, details=self._details):
+                handle.write(chunk)
+    # Location of the cached blob and of the file recording its ETag
+    def _cache_paths(self):
+        name = f"{self.azstorage_account}-{self.azstorage_container}-{self.azstorage_blob}".replace("/", "_")
+        return os.path.join(self.cache_dir, name), os.path.join(self.cache_dir, name + ".etag")
+    def _read_cache(self):
+        if not self.cache_dir:
+            return None, None
+        data_file, etag_file = self._cache_paths()
+        try:
+            with open(etag_file) as f:
+                etag = f.read().strip()
+        except OSError:
+            return None, None
+        if not etag or not os.path.exists(data_file):
+            return None, None
+        return data_file, etag
+    # The cache is written to a temporary file first and replaces the previous copy atomically once complete
+    def _open_cache_file(self):
+        if not self.cache_dir:
+            return None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            return tempfile.NamedTemporaryFile("w+b", dir=self.cache_dir, delete=False)
+        except OSError as e:
+            print(f"Error updating the local tree cache: {e}")
+            return None
+    def _commit_cache(self, handle, etag):
+        if handle is None:
+            return
+        handle.close()
+        if not etag:
+            os.remove(handle.name)
+            return
+        try:
+            data_file, etag_file = self._cache_paths()
+            os.replace(handle.name, data_file)
+            with open(etag_file, "w") as f:
+                f.write(etag)
+        except OSError as e:
+            print(f"Error updating the local tree cache: {e}")
+    def _discard_cache(self, handle):
+        if handle is not None:
+            handle.close()
+            os.remove(handle.name)
+    # Pass chunks through while copying them into the cache file
+    @staticmethod
+    def _tee(chunks, handle):
+        for chunk in chunks:
+            if handle is not None:
+                handle.write(chunk)
+            yield chunk
+    # Reload the tree when the blob was changed by another instance.
+    # Only a cheap properties request is made, at most once every revalidate_interval seconds unless force is set.
+    # Returns True when a newer version was loaded.
+    def revalidate(self, force=False):
+        if self.backend != 'azstorage':
+            return False
+        if not force and (self.revalidate_interval is None or time.monotonic() - self._last_revalidation < self.revalidate_interval):
+            return False
+        self._last_revalidation = time.monotonic()
+        # Never replace changes that have not been uploaded yet, the conditional upload will report the conflict
+        if self._journal_pending or self._dirty_generation != self._flushed_generation or self._conflict is not None:
+            return False
+        try:
+            etag = self._get_blob_client().get_blob_properties().etag
+        except Exception as e:
+            print(f"Error checking the tree in Azure Storage: {e}")
+            return False
+        if etag == self._etag:
+            return False
+        return self.load_azstorage()
+    # Rows are written as each mutation is applied, so saving only commits them.
+    # A checkpoint rewrites every row from the in-memory graph (after it was replaced or restored wholesale).
+    def save_sqlite(self, checkpoint=False):
+        with self._lock:
+            if self.journal is not None:
+                self.graph.graph['journal_seq'] = self._journal_seq
+            self._checkpoint_seq = self._journal_seq
+            if checkpoint:
+                self.store.replace_graph(self.graph)
+            else:
+                self.store.put_graph_attrs(dict(self.graph.graph))
+            self.store.commit()
+        return True
     # To Do: export the graph to CosmosDB
     def save_cosmosdb(self):
         # Save the graph to Azure Cosmos DB
-        pass
+        return False
     def load(self):
         if self.backend == 'local':
             self.load_local()
         elif self.backend == 'azstorage':
             self.load_azstorage()
+        elif self.backend == 'sqlite':
+            self.load_sqlite()
         elif self.backend == 'cosmosdb':
             self.load_cosmosdb()
         else:
@@ -144,26 +482,74 @@ class FamilyTree:
     def load_local(self):
         # Load the graph from a local file
         if self.localfile:
-            self.graph = nx.read_gml(self.localfile)
+            if self.lazy_attributes:
+                self.graph, self._details = self.read_file_topology(self.localfile)
+            else:
+                self.graph, self._details = self.read_file(self.localfile), None
+            self.replay_journal()
+            self._attribute_pool.compact_graph(self.graph)
+            self._merge_symmetric_relationships()
+            self._ensure_levels()
         else:
             raise ValueError("Local file must be specified to load data when using backend=local")
     def load_azstorage(self):
-        # Download the graph from Azure Storage to a temp file and open it
+        # Parse the graph while it streams from Azure Storage, without a temporary copy.
+        # With a cache directory the download is conditional and an unchanged blob is read from the local copy.
         if self.azstorage_account and self.azstorage_key and self.azstorage_container and self.azstorage_blob:
-            blob_service_client = BlobServiceClient.from_connection_string(f"DefaultEndpointsProtocol=https;AccountName={self.azstorage_account};AccountKey={self.azstorage_key}")
-            blob_client = blob_service_client.get_blob_client(container=self.azstorage_container, blob=self.azstorage_blob)
-            temp_dir = tempfile.TemporaryDirectory()
-            temp_file = os.path.join(temp_dir.name, "graph.gml")
+            blob_client = self._get_blob_client()
             try:
-                with open(temp_file, mode="wb") as f:
-                    f.write(blob_client.download_blob().readall())
-                self.graph = nx.read_gml(temp_file)
+                cached_file, cached_etag = self._read_cache()
+                try:
+                    conditions = {} if cached_etag is None else {"etag": cached_etag, "match_condition": MatchConditions.IfModified}
+                    # Keep the stored encoding, tree_stream decompresses while parsing
+                    downloader = blob_client.download_blob(decompress=False, **conditions)
+                    cache_file = self._open_cache_file()
+                    try:
+                        chunks = self._tee(downloader.chunks(), cache_file)
+                        graph, details = self._read_stream(chunks)
+                        for _ in chunks:
+                            pass
+                    except Exception:
+                        self._discard_cache(cache_file)
+                        raise
+                    etag = downloader.properties.etag
+                    self._commit_cache(cache_file, etag)
+                except ResourceNotModifiedError:
+                    with open(cached_file, "rb") as f:
+                        graph, details = self._read_stream(f)
+                    etag = cached_etag
+                with self._lock:
+                    self.graph = graph
+                    self._details = details
+                    self._etag = etag
+                    self.replay_journal()
+                    self._attribute_pool.compact_graph(self.graph)
+                    self._merge_symmetric_relationships()
+                    self._ensure_levels()
+                self._last_revalidation = time.monotonic()
+                # The unsaved edits of the flusher, including any that conflicted, are gone with the reload
+                with self._flush_cond:
+                    self._flushed_generation = self._dirty_generation
+                    self._checkpoint_requested = False
+                    self._conflict = self._flush_error = None
+                    self._flush_cond.notify_all()
                 return True
             except Exception as e:
                 print(f"Error loading graph from Azure Storage: {e}")
                 return False
         else:
             raise ValueError("Local file must be specified to load data when using backend=local")
+    def load_sqlite(self):
+        with self._lock:
+            if self.store is None:
+                self.store = tree_sqlite.SQLiteTreeStore(self.sqlite_file)
+            self.graph = self.store.load_graph()
+            self._details = None
+            self.replay_journal()
+            self._attribute_pool.compact_graph(self.graph)
+            self._merge_symmetric_relationships()
+            self._ensure_levels()
+        return True
     def load_cosmosdb(self):
         find_vertices_query = (
             "g.V().hasLabel('person')"
@@ -184,12 +570,529 @@ class FamilyTree:
         # To Do: Process the loaded nodes and edges and turn them into a networkx graph
     def set_localfile(self, localfile):
         self.localfile = localfile
+    # Serialize the graph to a file, in the tree's storage format unless another one is given
+    # Details not parsed since a lazy load are copied into snapshots as they are
+    def write_file(self, path, storage_format=None):
+        with self._lock:
+            if (storage_format or self.storage_format) == 'snapshot':
+                tree_snapshot.write_snapshot(self.graph, path, self._details)
+            else:
+                self._load_all_details()
+                nx.write_gml(self.graph, path)
+    def read_file(self, path, storage_format=None):
+        if (storage_format or self.storage_format) == 'snapshot':
+            return tree_snapshot.read_snapshot(path)
+        return nx.read_gml(path)
+    # Like read_file, but returns the graph and the unparsed details of its persons (None for GML, which is read in full)
+    def read_file_topology(self, path, storage_format=None):
+        if (storage_format or self.storage_format) == 'snapshot':
+            return tree_snapshot.read_snapshot_topology(path)
+        return nx.read_gml(path), None
+    def _read_stream(self, source):
+        if self.lazy_attributes:
+            return tree_stream.read_topology(source, self.storage_format)
+        return tree_stream.read_graph(source, self.storage_format), None
+    # Parse the details of a lazily loaded person into its attributes, the first time the person is used
+    def _load_details(self, person_id):
+        if self._details is None or person_id not in self._details:
+            return
+        with self._lock:
+            if self._details is not None and person_id in self._details:
+                details = self._attribute_pool.compact(self._details.pop(person_id))
+                self.graph.nodes[person_id].update(details)
+    def _load_all_details(self):
+        with self._lock:
+            if self._details is not None:
+                for person_id in self._details:
+                    self._load_details(person_id)
+                self._details = None
+    # Write a copy of the tree to another file, picking the format from its extension (.ftsnap, .db/.sqlite or .gml)
+    def export_file(self, path):
+        if os.path.splitext(path)[1].lower() in tree_sqlite.SQLITE_EXTENSIONS:
+            store = tree_sqlite.SQLiteTreeStore(path)
+            try:
+                with self._lock:
+                    self._load_all_details()
+                    store.replace_graph(self.graph)
+                store.commit()
+            finally:
+                store.close()
+            return
+        self.write_file(path, storage_format=tree_snapshot.format_for_path(path))
+    ###############
+    #   Journal   #
+    ###############
+    # Every mutation goes through _apply as a compact record: add_node, update_node, remove_node,
+    # add_edge, update_edge, remove_edge or clear. The same records are replayed on load.
+    def _apply(self, record, journal=True):
+        with self._lock:
+            self._apply_locked(record, journal)
+    def _apply_locked(self, record, journal):
+        record = self._canonical_record(record)
+        op = record["op"]
+        if "id" in record:
+            self._load_details(record["id"])
+        elif op == "clear" and self._undo_log is not None:
+            self._load_all_details()
+        if self._undo_log is not None:
+            self._undo_log.append(self._inverse(record))
+        relevel = self._relevel_targets(record)
+        if op != "update_node":
+            self._derived_cache = {}
+        self._kinship = {}
+        was_link = op in ("add_edge", "update_edge", "remove_edge") and self._is_parent_link(record["source"], record["target"])
+        linked = op in ("add_edge", "update_edge") and not was_link
+        join = self._level_join(record)
+        lineage_link = self._lineage_link(record)
+        attrs = copy.deepcopy(record.get("attrs", {}))
+        if op in ("add_node", "update_node"):
+            self._attribute_pool.compact(attrs)
+        if op == "add_node":
+            self.graph.add_node(record["id"], **attrs)
+        elif op == "update_node":
+            node = self.graph.nodes[record["id"]]
+            for key in record.get("clear", []):
+                node.pop(key, None)
+            node.update(attrs)
+        elif op == "remove_node":
+            if record["id"] in self.graph:
+                self.graph.remove_node(record["id"])
+        elif op == "add_edge":
+            self.graph.add_edge(record["source"], record["target"], **attrs)
+        elif op == "update_edge":
+            edge = self.graph[record["source"]][record["target"]]
+            for key in record.get("clear", []):
+                edge.pop(key, None)
+            edge.update(attrs)
+        elif op == "remove_edge":
+            if self.graph.has_edge(record["source"], record["target"]):
+                self.graph.remove_edge(record["source"], record["target"])
+        elif op == "clear":
+            self.graph.clear()
+            self._details = None
+        else:
+            raise ValueError(f"Invalid journal operation '{op}'")
+        self._update_node_ids(record)
+        self._update_adjacency(record)
+        if self.store is not None:
+            self._store_record(record)
+        self._update_ancestry(record, linked)
+        self._update_lineage(record, lineage_link)
+        self._update_counts(record, was_link)
+        if relevel:
+            self._relevel(relevel)
+        if join:
+            self._join_levels(*join)
+        if journal and self.journal is not None:
+            self._journal_seq += 1
+            self._journal_pending.append({**copy.deepcopy(record), "seq": self._journal_seq})
+    # Records that undo a record, computed before it is applied. Only the touched node or edge is copied.
+    def _inverse(self, record):
+        op = record["op"]
+        if op in ("add_node", "update_node"):
+            node_id = record["id"]
+            if node_id not in self.graph:
+                return [{"op": "remove_node", "id": node_id}]
+            return [self._restore_attrs_record(op, self.graph.nodes[node_id], record, id=node_id)]
+        if op == "remove_node":
+            node_id = record["id"]
+            if node_id not in self.graph:
+                return []
+            inverse = [{"op": "add_node", "id": node_id, "attrs": copy.deepcopy(self.graph.nodes[node_id])}]
+            for source, target, data in list(self.graph.in_edges(node_id, data=True)) + list(self.graph.out_edges(node_id, data=True)):
+                inverse.append({"op": "add_edge", "source": source, "target": target, "attrs": copy.deepcopy(data)})
+            return inverse
+        if op in ("add_edge", "update_edge"):
+            source, target = record["source"], record["target"]
+            if self.graph.has_edge(source, target):
+                return [self._restore_attrs_record("update_edge", self.graph[source][target], record, source=source, target=target)]
+            # add_edge also creates missing persons, which must go away again
+            return [{"op": "remove_edge", "source": source, "target": target}] + [
+                {"op": "remove_node", "id": node_id} for node_id in (source, target) if node_id not in self.graph
+            ]
+        if op == "remove_edge":
+            source, target = record["source"], record["target"]
+            if not self.graph.has_edge(source, target):
+                return []
+            return [{"op": "add_edge", "source": source, "target": target, "attrs": copy.deepcopy(self.graph[source][target])}]
+        if op == "clear":
+            return [{"op": "add_node", "id": node_id, "attrs": copy.deepcopy(data)} for node_id, data in self.graph.nodes(data=True)] + [
+                {"op": "add_edge", "source": source, "target": target, "attrs": copy.deepcopy(data)}
+                for source, target, data in self.graph.edges(data=True)
+            ]
+        return []
+    # An update record putting back the previous values of the keys a record sets or clears
+    @staticmethod
+    def _restore_attrs_record(op, current, record, **key):
+        op = "update_node" if op in ("add_node", "update_node") else "update_edge"
+        keys = set(record.get("attrs", {})) | set(record.get("clear", []))
+        return {
+            "op": op,
+            **key,
+            "attrs": {k: copy.deepcopy(current[k]) for k in keys if k in current},
+            "clear": sorted(k for k in keys if k not in current),
+        }
+    ###############
+    #   Levels    #
+    ###############
+    # Generation levels live in each person's 'level' attribute and are stored with the tree. They are kept up
+    # to date as records are applied, so reads never have to recompute them: a new isChildOf/isSpouseOf
+    # relationship shifts the smaller of the two groups it joins, other changes relabel the affected component.
+    LEVEL_TYPES = ('isChildOf', 'isSpouseOf')
+    # Persons whose component must be relabeled after a record is applied (computed before applying it)
+    def _relevel_targets(self, record):
+        op = record["op"]
+        if op == "add_node":
+            return [record["id"]]
+        if op == "remove_node":
+            node_id = record["id"]
+            if node_id not in self.graph:
+                return []
+            # Only parents, children and spouses share a level component
+            adjacency = self._adjacency_index()
+            return adjacency.parents(node_id) + adjacency.children(node_id) + adjacency.spouses(node_id)
+        if op in ("add_edge", "update_edge", "remove_edge"):
+            source, target = record["source"], record["target"]
+            if self._level_join(record):
+                return []
+            if op == "update_edge" and "type" not in record.get("attrs", {}) and "type" not in record.get("clear", []):
+                return []
+            current = self.graph[source][target].get('type') if self.graph.has_edge(source, target) else None
+            if current in self.LEVEL_TYPES or record.get("attrs", {}).get("type") in self.LEVEL_TYPES:
+                return [source, target]
+        return []
+    # A relationship added between two persons, as (source, target, level of target minus level of source)
+    def _level_join(self, record):
+        if record["op"] != "add_edge" or self.graph.has_edge(record["source"], record["target"]):
+            return None
+        rel_type = record.get("attrs", {}).get("type")
+        if rel_type not in self.LEVEL_TYPES:
+            return None
+        return record["source"], record["target"], -1 if rel_type == 'isChildOf' else 0
+    # Shift the smaller side of a new relationship so that it holds. The whole component is only relabeled when
+    # the two persons were already connected or the larger side would have to move too (a new top generation).
+    def _join_levels(self, source, target, step):
+        if self._deferred_levels is not None:
+            self._deferred_levels.update((source, target))
+            return
+        nodes = self.graph.nodes
+        if 'level' not in nodes[source] or 'level' not in nodes[target]:
+            self._relevel([source])
+            return
+        shift = nodes[source]['level'] + step - nodes[target]['level']
+        if shift == 0:
+            return
+        split = tree_traversal.smaller_side(self.graph, source, target, adjacency=self._adjacency_index())
+        if split is None:
+            self._relevel([source])
+            return
+        side, members = split
+        if side == 0:
+            shift = -shift
+        if min(nodes[node]['level'] for node in members) + shift < 0:
+            self._relevel([source])
+            return
+        for node in members:
+            nodes[node]['level'] += shift
+            if self.store is not None:
+                self.store.put_person(node, nodes[node])
+    # Relative levels of the component containing start, walking isChildOf (parents one level up)
+    # and isSpouseOf (same level) relationships breadth-first
+    def _level_component(self, start):
+        return tree_traversal.generation_offsets(self.graph, start, adjacency=self._adjacency_index())
+    # Recompute the levels of the components containing the given persons, normalized so each component starts at 0
+    def _relevel(self, nodes):
+        if self._deferred_levels is not None:
+            self._deferred_levels.update(nodes)
+            return
+        seen = set()
+        for start in nodes:
+            if start in seen or start not in self.graph:
+                continue
+            levels = self._level_component(start)
+            seen.update(levels)
+            offset = min(levels.values())
+            for node, level in levels.items():
+                if self.graph.nodes[node].get('level') != level - offset:
+                    self.graph.nodes[node]['level'] = level - offset
+                    if self.store is not None:
+                        self.store.put_person(node, self.graph.nodes[node])
+    # Relabel each affected component once at the end of a bulk change instead of after every record
+    @contextmanager
+    def _batch_levels(self):
+        with self._lock:
+            if self._deferred_levels is not None:
+                yield
+                return
+            self._deferred_levels = set()
+            try:
+                yield
+            finally:
+                nodes, self._deferred_levels = self._deferred_levels, None
+                self._relevel(nodes)
+    # Symmetric relationship types ('directed: false' in the schema, e.g. isSpouseOf) are stored once, in the
+    # orientation they were added with, and looked up either way (see find_relationship)
+    def _is_symmetric(self, rel_type):
+        if self.relationship_schema:
+            return self.relationship_schema.is_valid_type(rel_type) and not self.relationship_schema.is_directed(rel_type)
+        return rel_type == 'isSpouseOf'
+    # Trees stored by older versions hold symmetric relationships both ways; the edge from the lower id is kept.
+    # The removals are journaled right away, ahead of any later record, so that replaying a later removal of the kept
+    # edge does not leave the other one in place. Without a journal the next full write stores the merged tree.
+    def _merge_symmetric_relationships(self):
+        reverse_edges = [
+            (source, target) for source, target, data in self.graph.edges(data=True)
+            if str(source) > str(target) and self._is_symmetric(data.get('type'))
+            and self.graph.has_edge(target, source) and self.graph[target][source].get('type') == data.get('type')
+        ]
+        for source, target in reverse_edges:
+            self._apply({"op": "remove_edge", "source": source, "target": target})
+        if reverse_edges and self.journal is not None:
+            self.flush_journal()
+    # Trees stored before levels were maintained get them computed once when loaded
+    def _ensure_levels(self):
+        if any('level' not in data for _, data in self.graph.nodes(data=True)):
+            self.assign_generation_levels()
+    # Values computed from the whole graph, such as lineage depths, are cached under a key until the next
+    # record that changes persons or relationships (attribute-only person updates keep them)
+    def _derived(self, key, compute):
+        with self._lock:
+            if self._derived_graph is not self.graph:
+                self._derived_graph = self.graph
+                self._derived_cache = {}
+            if key not in self._derived_cache:
+                self._derived_cache[key] = compute()
+            return self._derived_cache[key]
+    # Ancestry index of the current graph (see tree_indexes.py), kept up to date by _apply so that
+    # the cycle check of every new isChildOf relationship does not have to walk the tree
+    def _ancestry_index(self):
+        with self._lock:
+            if self._ancestry is None or self._ancestry.graph is not self.graph:
+                self._ancestry = tree_indexes.AncestryIndex(self.graph)
+            return self._ancestry
+    def _is_parent_link(self, source, target):
+        if not self.graph.has_edge(source, target):
+            return False
+        data = self.graph[source][target]
+        return data.get('type') == 'isChildOf' and tree_traversal.is_active(data)
+    # Dense integer ids of the persons of the current graph (see tree_indexes.NodeIds), for array-backed indexes.
+    # Records have their ids swapped for the key objects the graph holds, so that a person's UUID is stored once
+    # however many relationships, indexes and replayed records refer to it.
+    def _node_id_index(self):
+        with self._lock:
+            if self._node_ids is None or self._node_ids.graph is not self.graph:
+                self._node_ids = tree_indexes.NodeIds(self.graph)
+            return self._node_ids
+    def _canonical_record(self, record):
+        fields = [field for field in ("id", "source", "target") if field in record]
+        if not fields:
+            return record
+        index = self._node_id_index()
+        return {**record, **{field: index.key(record[field]) for field in fields}}
+    def _update_node_ids(self, record):
+        index = self._node_ids
+        if index is None or index.graph is not self.graph:
+            return
+        op = record["op"]
+        if op == "add_node":
+            index.add_person(record["id"])
+        elif op == "add_edge":
+            # Adding a relationship adds any person it names who is not in the graph yet
+            index.add_person(record["source"])
+            index.add_person(record["target"])
+        elif op == "remove_node":
+            index.remove_person(record["id"])
+        elif op == "clear":
+            index.rebuild()
+    # Typed parent, child and spouse lists of the current graph (see tree_indexes.TypedAdjacency), used by the
+    # walks here instead of filtering every relationship of each person they visit
+    def _adjacency_index(self):
+        with self._lock:
+            if self._adjacency is None or self._adjacency.graph is not self.graph:
+                self._adjacency = tree_indexes.TypedAdjacency(self.graph)
+            return self._adjacency
+    def _update_adjacency(self, record):
+        index = self._adjacency
+        if index is None or index.graph is not self.graph:
+            return
+        op = record["op"]
+        if op == "add_node":
+            index.add_person(record["id"])
+        elif op == "remove_node":
+            index.remove_person(record["id"])
+        elif op == "clear":
+            index.rebuild()
+        elif op in ("add_edge", "remove_edge") or "type" in record.get("attrs", {}) or "type" in record.get("clear", []):
+            # Entries refer to the relationship attributes, so activating or deactivating needs no update
+            index.touch_relationship(record["source"], record["target"])
+    def _update_ancestry(self, record, linked):
+        index = self._ancestry
+        if index is None or index.graph is not self.graph:
+            return
+        op = record["op"]
+        if op == "add_node":
+            index.add_person(record["id"])
+        elif op == "remove_node":
+            index.remove_person(record["id"])
+        elif op == "clear":
+            index.rebuild()
+        elif linked and self._is_parent_link(record["source"], record["target"]):
+            # Removed or deactivated relationships leave the index valid; only new parent links reorder it
+            index.link(record["source"], record["target"])
+    # Numbered ancestor and descendant closures of the current graph (see tree_indexes.py). _apply only
+    # drops the closures a record affects, so repeated queries on an unchanged part of the tree are not walked again.
+    def _lineage_index(self):
+        with self._lock:
+            if self._lineage is None or self._lineage.graph is not self.graph:
+                self._lineage = tree_indexes.LineageIndex(self.graph)
+            return self._lineage
+    # The (child, parent) of an edge record that is, or was, an 'isChildOf' relationship; taken before it is applied
+    def _lineage_link(self, record):
+        if record["op"] not in ("add_edge", "update_edge", "remove_edge"):
+            return None
+        source, target = record["source"], record["target"]
+        types = {record.get("attrs", {}).get('type')}
+        if self.graph.has_edge(source, target):
+            types.add(self.graph[source][target].get('type'))
+        return (source, target) if 'isChildOf' in types else None
+    def _update_lineage(self, record, link):
+        index = self._lineage
+        if index is None or index.graph is not self.graph:
+            return
+        op = record["op"]
+        if op == "clear":
+            index.clear()
+        elif op == "remove_node":
+            index.touch_person(record["id"])
+        elif op == "update_node":
+            # Gender orders parents and birth dates order children
+            if {'gender', 'birthdate'} & (set(record.get("attrs", {})) | set(record.get("clear", []))):
+                index.touch_person(record["id"])
+        elif link is not None:
+            index.touch_link(*link)
+    def _lineage_counts(self):
+        with self._lock:
+            if self._counts is None or self._counts.graph is not self.graph:
+                self._counts = tree_indexes.LineageCounts(self.graph)
+            return self._counts
+    # Keep the counts in step with a just-applied record; was_link tells whether its edge was an active parent link
+    def _update_counts(self, record, was_link):
+        index = self._counts
+        if index is None or index.graph is not self.graph:
+            return
+        op = record["op"]
+        if op == "clear":
+            index.stale = True
+        elif op == "add_node":
+            index.add_person(record["id"])
+        elif op == "remove_node":
+            index.remove_person(record["id"])
+        elif op in ("add_edge", "update_edge", "remove_edge"):
+            source, target = record["source"], record["target"]
+            is_link = self._is_parent_link(source, target)
+            if is_link and not was_link:
+                index.link(source, target)
+            elif was_link and not is_link:
+                index.unlink(source, target)
+    # Start a copy-on-write overlay of the graph for validating changes before applying them (see tree_staging.py)
+    def stage(self):
+        return tree_staging.StagedGraph(self.graph)
+    # Group mutations so that they are all undone if the block raises. Only the inverse of each touched
+    # node or edge is recorded, so the cost is proportional to the change. Nested blocks join the outer one.
+    # The block gets a Transaction, whose undo() reverts the mutations after the block (and the lock) was left, so
+    # slow work such as saving can run outside the lock and still be compensated for.
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._transaction is not None:
+                yield self._transaction
+                return
+            self._transaction = Transaction(self)
+            self._undo_log = self._transaction.undo_log
+            pending_start = len(self._journal_pending)
+            seq_start = self._journal_seq
+            graph_attrs = dict(self.graph.graph)
+            try:
+                yield self._transaction
+            except BaseException:
+                undo_log, self._undo_log = self._undo_log, None
+                self._rollback(undo_log, pending_start, seq_start, graph_attrs)
+                raise
+            finally:
+                self._undo_log = None
+                self._transaction = None
+    # Revert the mutations of a transaction that has ended. Others may have been applied since, so the inverse records
+    # are journaled like any other change
+    def _undo(self, undo_log, unless_changed=None):
+        with self._lock:
+            if unless_changed is not None and unless_changed():
+                return False
+            for inverse in reversed(undo_log):
+                for record in inverse:
+                    self._apply_locked(record, journal=True)
+            return True
+    def _rollback(self, undo_log, pending_start, seq_start, graph_attrs):
+        # If nothing was flushed, the journaled records are simply dropped; otherwise the inverses are journaled too
+        unflushed = self._journal_seq - seq_start == len(self._journal_pending) - pending_start
+        for inverse in reversed(undo_log):
+            for record in inverse:
+                self._apply_locked(record, journal=not unflushed)
+        if unflushed:
+            del self._journal_pending[pending_start:]
+            self._journal_seq = seq_start
+        # Graph attributes only disappear through a clear
+        for key, value in graph_attrs.items():
+            self.graph.graph.setdefault(key, value)
+    # Write the rows touched by a record to the SQLite store, using the state the graph now has
+    def _store_record(self, record):
+        op = record["op"]
+        if op in ("add_node", "update_node"):
+            self.store.put_person(record["id"], self.graph.nodes[record["id"]])
+        elif op == "remove_node":
+            self.store.delete_person(record["id"])
+        elif op in ("add_edge", "update_edge"):
+            source, target = record["source"], record["target"]
+            for person_id in (source, target):
+                if op == "add_edge" and self.store.get_person(person_id) is None:
+                    self.store.put_person(person_id, self.graph.nodes[person_id])
+            self.store.put_relationship(source, target, self.graph[source][target])
+        elif op == "remove_edge":
+            self.store.delete_relationship(record["source"], record["target"])
+        elif op == "clear":
+            self.store.clear()
+    def flush_journal(self):
+        # Append the pending records to the journal, oldest first
+        with self._lock:
+            while self._journal_pending:
+                self.journal.append(self._journal_pending[0])
+                self._journal_pending.pop(0)
+                self._journal_since_checkpoint += 1
+    def discard_pending(self):
+        # Forget records that were never flushed (the caller restored the graph itself)
+        self._journal_pending = []
+        if self.store is not None:
+            self.store.rollback()
+    def replay_journal(self):
+        # Re-apply the journal records that are newer than the loaded checkpoint
+        if self.journal is None:
+            return
+        checkpoint_seq = int(self.graph.graph.get('journal_seq', 0))
+        self._journal_seq = checkpoint_seq
+        self._journal_pending = []
+        self._journal_since_checkpoint = 0
+        with self._batch_levels():
+            for record in self.journal.list():
+                if record.get("seq", 0) <= checkpoint_seq:
+                    continue
+                self._apply(record, journal=False)
+                self._journal_seq = max(self._journal_seq, record["seq"])
+                self._journal_since_checkpoint += 1
     ###############
     #    Import   #
     ###############
     def import_from_app_json(self, json_data_file, import_pics=False, pics_folder=None, azure_storage_account=None, azure_storage_key=None, azure_storage_container=None):
         # Clear the existing graph
-        self.graph.clear()
+        self._apply({"op": "clear"})
         # Optionally, upload the images to the provided Azure Storage account, verifying that the provided folder exists
         if import_pics and pics_folder and azure_storage_account and azure_storage_key and azure_storage_container and os.path.exists(pics_folder):
             blob_service_client = BlobServiceClient.from_connection_string(f"DefaultEndpointsProtocol=https;AccountName={azure_storage_account};AccountKey={azure_storage_key}")
@@ -238,43 +1141,40 @@ class FamilyTree:
                 else:
                     raise ValueError(f"Node {node_id} is missing 'infoId' attribute")
                 node_count += 1
-            # Now add the edges
-            for node_id in json_data['nodes']:
-                if 'relations' in json_data['nodes'][node_id]:
-                    for relation in json_data['nodes'][node_id]['relations']:
-                        target_id = relation.get('to')
-                        if target_id in self.graph and node_id in self.graph:
-                            if relation.get('type') == 'parent':
-                                self.add_relationship(
-                                    node_id,
-                                    target_id,
-                                    type='isChildOf',
-                                    override_warnings=True,
-                                )
-                            elif relation.get('type') == 'child':
-                                self.add_relationship(
-                                    target_id,
-                                    node_id,
-                                    type='isChildOf',
-                                    override_warnings=True,
-                                )
-                            elif relation.get('type') == 'spouse':
-                                self.add_relationship(
-                                    node_id,
-                                    target_id,
-                                    type='isSpouseOf',
-                                    override_warnings=True,
-                                )
-                                self.add_relationship(
-                                    target_id,
-                                    node_id,
-                                    type='isSpouseOf',
-                                    override_warnings=True,
-                                )
+            # Now add the edges, relabeling generation levels once at the end
+            with self._batch_levels():
+                for node_id in json_data['nodes']:
+                    if 'relations' in json_data['nodes'][node_id]:
+                        for relation in json_data['nodes'][node_id]['relations']:
+                            target_id = relation.get('to')
+                            if target_id in self.graph and node_id in self.graph:
+                                if relation.get('type') == 'parent':
+                                    self.add_relationship(
+                                        node_id,
+                                        target_id,
+                                        type='isChildOf',
+                                        override_warnings=True,
+                                    )
+                                elif relation.get('type') == 'child':
+                                    self.add_relationship(
+                                        target_id,
+                                        node_id,
+                                        type='isChildOf',
+                                        override_warnings=True,
+                                    )
+                                elif relation.get('type') == 'spouse':
+                                    # Both spouses list each other, the relationship is stored once
+                                    if self.find_relationship(node_id, target_id) is None:
+                                        self.add_relationship(
+                                            node_id,
+                                            target_id,
+                                            type='isSpouseOf',
+                                            override_warnings=True,
+                                        )
+                                else:
+                                    raise ValueError(f"Invalid relationship type {relation.get('type')} for nodes {node_id} and {target_id}")
                             else:
-                                raise ValueError(f"Invalid relationship type {relation.get('type')} for nodes {node_id} and {target_id}")
-                        else:
-                            raise ValueError(f"Cannot create relationship: one of the nodes {node_id} or {target_id} does not exist")
+                                raise ValueError(f"Cannot create relationship: one of the nodes {node_id} or {target_id} does not exist")
             # Restore previous autosave value and save the tree
             self.save()
             self.autosave = old_autosave_value
@@ -295,7 +1195,7 @@ class FamilyTree:
             person_id = id  # Not enforcing that ID is a valid UUID
         else:
             person_id = str(uuid.uuid4())
-        self.graph.add_node(person_id, **attributes)
+        self._apply({"op": "add_node", "id": person_id, "attrs": attributes})
         if self.autosave:
             self.save()
         if self.backend == 'cosmosdb':
@@ -332,6 +1232,8 @@ class FamilyTree:
                 type,
                 start_date=start_date,
                 end_date=extra_attrs.get("end_date"),
+                ancestry=self._ancestry_index(),
+                symmetric=self._is_symmetric(type),
             ),
             override_warnings=override_warnings,
         )
@@ -346,7 +1248,7 @@ class FamilyTree:
             edge_attrs.setdefault('is_active', True)
             if start_date:
                 edge_attrs['start_date'] = start_date
-        self.graph.add_edge(person1_id, person2_id, **edge_attrs)
+        self._apply({"op": "add_edge", "source": person1_id, "target": person2_id, "attrs": edge_attrs})
         if self.autosave:
             self.save()
         if self.backend == 'cosmosdb':
@@ -368,9 +1270,8 @@ class FamilyTree:
         if root_id not in self.graph:
             raise ValueError("Root person must be in the family tree")
         spouse_id = self.add_person(**spouse_attributes)
-        # In a directed graph you need to include the link twice
         self.add_relationship(root_id, spouse_id, type='isSpouseOf')
-        self.add_relationship(spouse_id, root_id, type='isSpouseOf')
+        return spouse_id
     def add_parent(self, root_id, **parent_attributes):
         if root_id not in self.graph:
             raise ValueError("Root person must be in the family tree")
@@ -394,14 +1295,10 @@ class FamilyTree:
             prospective.pop(key, None)
         prospective.update(attributes)
         if {"birthdate", "deathdate", "isAlive"} & (set(attributes) | clear_fields):
-            enforce_issues(
-                validate_person_relationships(self.graph, person_id, prospective),
-                override_warnings=override_warnings,
-            )
-        for key in clear_fields:
-            self.graph.nodes[person_id].pop(key, None)
-        for key, value in attributes.items():
-            self.graph.nodes[person_id][key] = value
+            with self._lock:
+                issues = validate_person_relationships(self.graph, person_id, prospective, self._adjacency_index())
+            enforce_issues(issues, override_warnings=override_warnings)
+        self._apply({"op": "update_node", "id": person_id, "attrs": attributes, "clear": sorted(clear_fields)})
         if self.autosave:
             self.save()
             if self.backend == 'cosmosdb':
@@ -413,95 +1310,176 @@ class FamilyTree:
     #################
     #   Subgraphs   #
     #################
-    # Get a subgraph centered on a person, including all nodes within 'degree' relationship hops
-    def get_subgraph_degrees(self, person_id, degree=1):
+    # Subgraphs are read-only views of the tree (see tree_traversal.subgraph_view) that follow every change to it. Read
+    # them under the lock, or take a detach_subgraph() copy before changing them or using them outside it
+    # Get a subgraph centered on a person, including all nodes within 'degree' relationship hops.
+    # max_nodes caps the persons taken, closest kin first (see tree_traversal.nearest_relatives); the graph attributes
+    # of the result then tell whether the cap left anyone out and which persons have relatives beyond it.
+    def get_subgraph_degrees(self, person_id, degree=1, max_nodes=None):
         if person_id not in self.graph:
             raise ValueError("Person must be in the family tree")
-        nodes_within_degree = nx.single_source_shortest_path_length(self.graph.to_undirected(), person_id, cutoff=degree).keys()
-        return self.graph.subgraph(nodes_within_degree).copy()
-    # Get a subgraph containing all paths between two persons
-    def get_subgraph_between(self, person1_id, person2_id):
+        if max_nodes is not None:
+            with self._lock:
+                search = tree_traversal.nearest_relatives(self.graph, person_id, degree, max_nodes)
+                return tree_traversal.subgraph_view(
+                    self.graph, search.distances, truncated=search.truncated, frontier=search.frontier
+                )
+        with self._lock:
+            # A CSR snapshot built since the last change answers fastest, but rebuilding it for this query would cost
+            # more than a search of the live graph, which visits only the persons it finds
+            snapshot = self._derived_cache.get('csr') if self._derived_graph is self.graph else None
+            if snapshot is not None:
+                nodes_within_degree = snapshot.within_hops(person_id, degree)
+            else:
+                nodes_within_degree = tree_traversal.within_hops(self.graph, person_id, degree)
+            return tree_traversal.subgraph_view(self.graph, nodes_within_degree)
+    # Get a subgraph containing all shortest paths between two persons, found with a bidirectional search that
+    # never copies the graph (see tree_traversal.shortest_paths_between). types limits the relationship types followed,
+    # e.g. ['isChildOf'] for blood relatives only. max_paths and max_nodes bound the work on densely intermarried trees;
+    # the graph attributes of the result give the distance, the number of paths and whether a bound truncated them.
+    def get_subgraph_between(self, person1_id, person2_id, types=None, active_only=False, max_paths=None, max_nodes=None):
         if person1_id not in self.graph or person2_id not in self.graph:
             raise ValueError("Both persons must be in the family tree")
-        try:
-            paths = list(nx.all_shortest_paths(self.graph.to_undirected(), source=person1_id, target=person2_id))
-            nodes_in_paths = set()
-            for path in paths:
-                nodes_in_paths.update(path)
-            return self.graph.subgraph(nodes_in_paths).copy()
-        except nx.NetworkXNoPath:
-            return nx.DiGraph()
-    # Get the longest chain of ancestors in the tree using edges of type 'isChildOf'
+        with self._lock:
+            search = tree_traversal.shortest_paths_between(
+                self.graph, person1_id, person2_id, types=types, active_only=active_only, max_paths=max_paths, max_nodes=max_nodes
+            )
+            return tree_traversal.subgraph_view(
+                self.graph, search.nodes, distance=search.distance, paths=search.paths, truncated=search.truncated
+            )
+    # A copy of a subgraph view that no longer follows the tree, taken under the lock so no change lands halfway through
+    def detach_subgraph(self, subgraph):
+        with self._lock:
+            return subgraph.copy()
+    # How person2 is related to person1 by blood ("second cousin once removed"), with the nearest common ancestors,
+    # the generations of each person below them and one path through them (see tree_kinship.py)
+    def get_relationship_between(self, person1_id, person2_id):
+        if person1_id not in self.graph or person2_id not in self.graph:
+            raise ValueError("Both persons must be in the family tree")
+        with self._lock:
+            return tree_kinship.relationship_between(self.graph, person1_id, person2_id)
+    # Everyone related to a person by blood or marriage as (person id, kinship label, generation offset), nearest first
+    # (see tree_kinship.kinship_table). Entries are produced while the tree is walked, taking the lock one step at a time,
+    # and the table of each person is kept until the next mutation. Every mutation replaces the cache, so it also tells
+    # the walk the tree has changed under it: the walk then raises TreeChangedError, as the rest would describe another tree.
+    def iter_kinship(self, person_id):
+        with self._lock:
+            if person_id not in self.graph:
+                raise ValueError("Person must be in the family tree")
+            cache = self._kinship
+            table = cache.get(person_id)
+        if table is not None:
+            return iter(table)
+        return self._walk_kinship(person_id, cache)
+    def _walk_kinship(self, person_id, cache):
+        walk = tree_kinship.kinship_table(self.graph, person_id)
+        table = []
+        while True:
+            with self._lock:
+                if self._kinship is not cache:
+                    raise TreeChangedError("The family tree changed during the kinship walk")
+                entry = next(walk, None)
+            if entry is None:
+                break
+            table.append(entry)
+            yield entry
+        with self._lock:
+            if self._kinship is cache:
+                if len(cache) >= self.kinship_cache_size:
+                    cache.pop(next(iter(cache)))
+                cache[person_id] = table
+    # Get the ancestors (or descendants) of a person through active 'isChildOf' relationships,
+    # as a dict of person id to number of generations away, optionally limited to max_depth generations
+    def get_ancestors(self, person_id, max_depth=None):
+        return self._get_lineage(person_id, max_depth, ancestors=True)
+    def get_descendants(self, person_id, max_depth=None):
+        return self._get_lineage(person_id, max_depth, ancestors=False)
+    def _get_lineage(self, person_id, max_depth, ancestors):
+        if person_id not in self.graph:
+            raise ValueError("Person must be in the family tree")
+        depths = {person_id: 0}
+        frontier = [person_id]
+        with self._lock:
+            adjacency = self._adjacency_index()
+            relatives = adjacency.parents if ancestors else adjacency.children
+            while frontier and (max_depth is None or depths[frontier[0]] < max_depth):
+                next_frontier = []
+                for node in frontier:
+                    for relative in relatives(node, active_only=True):
+                        if relative not in depths:
+                            depths[relative] = depths[node] + 1
+                            next_frontier.append(relative)
+                frontier = next_frontier
+        del depths[person_id]
+        return depths
+    # Ancestors numbered the Ahnentafel way (the father of n is 2n, the mother 2n+1) and descendants numbered the
+    # d'Aboville way (the children of 1.2 are 1.2.1, 1.2.2, ... by birth date), as (person id, generation, number)
+    # tuples ordered by generation and number, optionally limited to max_generations. The person (number 1) is left out.
+    def get_numbered_ancestors(self, person_id, max_generations=None):
+        if person_id not in self.graph:
+            raise ValueError("Person must be in the family tree")
+        with self._lock:
+            return self._lineage_index().ancestors(person_id, max_generations)[1:]
+    def get_numbered_descendants(self, person_id, max_generations=None):
+        if person_id not in self.graph:
+            raise ValueError("Person must be in the family tree")
+        with self._lock:
+            return self._lineage_index().descendants(person_id, max_generations)[1:]
+    # Number of distinct ancestors and descendants of a person and the generations below them, kept up to date
+    # relationship by relationship once first asked for (see tree_indexes.LineageCounts)
+    def get_lineage_counts(self, person_id):
+        if person_id not in self.graph:
+            raise ValueError("Person must be in the family tree")
+        with self._lock:
+            return self._lineage_counts().counts(person_id)
+    # Get the longest chain of ancestors in the tree using edges of type 'isChildOf', counted in persons
     def get_longest_ancestor_chain(self):
-        def dfs(current_node, visited):
-            visited.add(current_node)
-            max_length = 0
-            for neighbor in self.graph.successors(current_node):
-                if self.graph[current_node][neighbor]['type'] == 'isChildOf' and neighbor not in visited:
-                    length = dfs(neighbor, visited)
-                    max_length = max(max_length, length)
-            visited.remove(current_node)
-            return max_length + 1
-        longest_chain = 0
-        for node in self.graph.nodes():
-            chain_length = dfs(node, set())
-            longest_chain = max(longest_chain, chain_length)
-        return longest_chain
-    # Add a level attribute to each node indicating its generation level.
+        ancestor_depths, _ = self.get_lineage_depths()
+        return max(ancestor_depths.values(), default=-1) + 1
+    # Number of generations above (ancestor depth) and below (descendant depth) every person, as two dicts.
+    # Computed a generation at a time over the 'isChildOf' relationships of the CSR snapshot and cached until they change.
+    def get_lineage_depths(self):
+        return self._derived('lineage_depths', lambda: self.get_csr_snapshot().lineage_depths())
+    def get_ancestor_depth(self, person_id):
+        if person_id not in self.graph:
+            raise ValueError("Person must be in the family tree")
+        return self.get_lineage_depths()[0][person_id]
+    def get_descendant_depth(self, person_id):
+        if person_id not in self.graph:
+            raise ValueError("Person must be in the family tree")
+        return self.get_lineage_depths()[1][person_id]
+    # Read-only NumPy (CSR) copy of the relationships, for whole-tree analytics (see tree_csr.py). It is built on
+    # first use after a change to persons or relationships and shared until the next one.
+    def get_csr_snapshot(self):
+        return self._derived('csr', lambda: tree_csr.CSRSnapshot(self.graph, self._node_id_index()))
+    # Number of separate groups of persons connected by any relationship
+    def get_component_count(self):
+        return self.get_csr_snapshot().component_count()
+    # Recompute the generation level of every person from scratch. Levels are maintained incrementally,
+    # so this is only needed for trees loaded without them.
     def assign_generation_levels(self, debug=False):
-        # Clear any previously assigned levels
-        for node in self.graph.nodes():
-            if 'level' in self.graph.nodes[node]:
-                del self.graph.nodes[node]['level']
-        # Recursive function to assign levels
-        def assign_level(node_id, level):
+        with self._lock:
+            for node in self.graph.nodes():
+                self.graph.nodes[node].pop('level', None)
+            self._relevel(list(self.graph.nodes()))
             if debug:
-                print(f"DEBUG: Assigning level {level} to node {node_id} ({self.graph.nodes[node_id].get('firstname', '')} {self.graph.nodes[node_id].get('lastname', '')})")
-            self.graph.nodes[node_id]['level'] = level                      # This marks the node as visited
-            # Look for neighbors with outgoing edges (successors): parents (isChildOf) and spouses
-            for neighbor in self.graph.successors(node_id):
-                if self.graph[node_id][neighbor]['type'] == 'isChildOf':
-                    if 'level' not in self.graph.nodes[neighbor]:
-                        assign_level(neighbor, level - 1)
-                elif self.graph[node_id][neighbor]['type'] == 'isSpouseOf':
-                    if 'level' not in self.graph.nodes[neighbor]:
-                        assign_level(neighbor, level)
-            # Look for neighbors with incoming edges (predecessors): children and spouses
-            for neighbor in self.graph.predecessors(node_id):
-                if self.graph[neighbor][node_id]['type'] == 'isChildOf':
-                    if 'level' not in self.graph.nodes[neighbor]:
-                        assign_level(neighbor, level + 1)
-                elif self.graph[neighbor][node_id]['type'] == 'isSpouseOf':     # Although this shouldnt be required, since the isSpouseOf relationship is bidirectional
-                    if 'level' not in self.graph.nodes[neighbor]:
-                        assign_level(neighbor, level)
-        # Assign and normalize every connected component independently.
-        for root_node_id in self.graph.nodes():
-            if 'level' in self.graph.nodes[root_node_id]:
-                continue
-            assign_level(root_node_id, 0)
-            component = nx.node_connected_component(self.graph.to_undirected(as_view=True), root_node_id)
-            min_level = min(self.graph.nodes[node]['level'] for node in component)
-            if min_level != 0:
-                for node in component:
-                    self.graph.nodes[node]['level'] -= min_level
+                for node_id, data in self.graph.nodes(data=True):
+                    print(f"DEBUG: Assigned level {data['level']} to node {node_id} ({data.get('firstname', '')} {data.get('lastname', '')})")
 
     ###############
     #     Get     #
     ###############
     def get_person(self, person_id):
         if person_id in self.graph:
+            self._load_details(person_id)
             return self.graph.nodes[person_id]
         else:
             return None
     def get_spouses(self, person_id):
         if person_id not in self.graph:
             raise ValueError("Person must be in the family tree")
-        spouse_ids = []
-        neighbors = self.graph.adj[person_id]
-        for i in neighbors:
-            if neighbors[i]['type'] == 'isSpouseOf':
-                spouse_ids.append(i)
-        return spouse_ids
+        with self._lock:
+            return self._adjacency_index().spouses(person_id)
     # For all nodes of type 'person' return a list containing a combination of their first and last names, if they exist
     def get_person_list(self):
         # return [ (node, self.graph.nodes[node].get('firstname', '') + ' ' + self.graph.nodes[node].get('lastname', '')).strip()
@@ -511,6 +1489,17 @@ class FamilyTree:
             if len(full_name) > 0:
                 person_list.append(full_name)
         return person_list
+    # Get the ids of the persons whose full name contains the query (case-insensitive), sorted by last and first name.
+    # Names are compared casefolded, as tree_sqlite.SQLiteTreeStore.search does, so both give the same results.
+    def search_persons(self, query, limit=None):
+        query = query.strip().casefold()
+        matches = []
+        for node, data in self.graph.nodes(data=True):
+            full_name = (str(data.get('firstname', '')) + ' ' + str(data.get('lastname', ''))).strip()
+            if query in full_name.casefold():
+                matches.append((str(data.get('lastname', '')).casefold(), str(data.get('firstname', '')).casefold(), node))
+        matches.sort()
+        return [node for _, _, node in matches[:limit]]
     # Get a node matching a full name (first + last name)
     def get_person_by_full_name(self, full_name):
         for node in self.graph.nodes():
@@ -521,6 +1510,14 @@ class FamilyTree:
     #####################
     #   Relationships   #
     #####################
+    # The (source, target) under which the relationship between two persons is stored, or None if there is
+    # none. A symmetric relationship is found from either person.
+    def find_relationship(self, person1_id, person2_id):
+        if self.graph.has_edge(person1_id, person2_id):
+            return person1_id, person2_id
+        if self.graph.has_edge(person2_id, person1_id) and self._is_symmetric(self.graph[person2_id][person1_id].get('type')):
+            return person2_id, person1_id
+        return None
     def deactivate_relationship(
         self,
         person1_id,
@@ -529,8 +1526,10 @@ class FamilyTree:
         override_warnings=False,
     ):
         """Soft-delete a deactivatable relationship by setting is_active=False and end_date."""
-        if not self.graph.has_edge(person1_id, person2_id):
+        pair = self.find_relationship(person1_id, person2_id)
+        if pair is None:
             raise ValueError(f"No relationship exists between {person1_id} and {person2_id}")
+        person1_id, person2_id = pair
         edge = self.graph[person1_id][person2_id]
         rel_type = edge.get('type', '')
         if end_date:
@@ -553,56 +1552,36 @@ class FamilyTree:
             is_permanent = (rel_type == 'isChildOf')
         if is_permanent:
             raise ValueError(f"Cannot deactivate permanent relationship type '{rel_type}'")
-        edge['is_active'] = False
+        changes = {'is_active': False}
         if end_date:
-            edge['end_date'] = end_date
-        # For bidirectional relationships (e.g., isSpouseOf), also deactivate the reverse edge
-        if self.graph.has_edge(person2_id, person1_id):
-            reverse_edge = self.graph[person2_id][person1_id]
-            if reverse_edge.get('type') == rel_type:
-                reverse_edge['is_active'] = False
-                if end_date:
-                    reverse_edge['end_date'] = end_date
+            changes['end_date'] = end_date
+        self._apply({"op": "update_edge", "source": person1_id, "target": person2_id, "attrs": changes})
         if self.autosave:
             self.save()
 
     def reactivate_relationship(self, person1_id, person2_id):
         """Re-activate a previously deactivated relationship."""
-        if not self.graph.has_edge(person1_id, person2_id):
+        pair = self.find_relationship(person1_id, person2_id)
+        if pair is None:
             raise ValueError(f"No relationship exists between {person1_id} and {person2_id}")
-        edge = self.graph[person1_id][person2_id]
-        rel_type = edge.get('type', '')
-        edge['is_active'] = True
-        edge.pop('end_date', None)
-        # For bidirectional relationships, also reactivate the reverse edge
-        if self.graph.has_edge(person2_id, person1_id):
-            reverse_edge = self.graph[person2_id][person1_id]
-            if reverse_edge.get('type') == rel_type:
-                reverse_edge['is_active'] = True
-                reverse_edge.pop('end_date', None)
+        self._apply({"op": "update_edge", "source": pair[0], "target": pair[1], "attrs": {'is_active': True}, "clear": ['end_date']})
         if self.autosave:
             self.save()
 
     def activate_all_relationships(self):
         """Set is_active=True on every edge in the graph."""
-        for _src, _tgt, data in self.graph.edges(data=True):
+        for src, tgt, data in list(self.graph.edges(data=True)):
             if 'is_active' in data:
-                data['is_active'] = True
-                data.pop('end_date', None)
+                self._apply({"op": "update_edge", "source": src, "target": tgt, "attrs": {'is_active': True}, "clear": ['end_date']})
         if self.autosave:
             self.save()
 
     def delete_relationship(self, person1_id, person2_id):
         """Permanently remove a relationship (edge) between two persons."""
-        if not self.graph.has_edge(person1_id, person2_id):
+        pair = self.find_relationship(person1_id, person2_id)
+        if pair is None:
             raise ValueError(f"No relationship exists from {person1_id} to {person2_id}")
-        rel_type = self.graph[person1_id][person2_id].get('type', '')
-        self.graph.remove_edge(person1_id, person2_id)
-        # For bidirectional relationships, also remove the reverse edge
-        if self.graph.has_edge(person2_id, person1_id):
-            reverse_type = self.graph[person2_id][person1_id].get('type', '')
-            if reverse_type == rel_type:
-                self.graph.remove_edge(person2_id, person1_id)
+        self._apply({"op": "remove_edge", "source": pair[0], "target": pair[1]})
         if self.autosave:
             self.save()
 
@@ -629,44 +1608,54 @@ class FamilyTree:
         """Infer siblings: persons sharing at least one parent via isChildOf edges."""
         if person_id not in self.graph:
             raise ValueError("Person must be in the family tree")
-        parents = set()
-        for neighbor in self.graph.successors(person_id):
-            if self.graph[person_id][neighbor].get('type') == 'isChildOf':
-                if self.graph[person_id][neighbor].get('is_active', True):
-                    parents.add(neighbor)
-        siblings = set()
-        for parent in parents:
-            for child in self.graph.predecessors(parent):
-                edge = self.graph[child][parent]
-                if edge.get('type') == 'isChildOf' and edge.get('is_active', True):
-                    if child != person_id:
-                        siblings.add(child)
-        return list(siblings)
+        with self._lock:
+            return self._adjacency_index().siblings(person_id, active_only=True)
     #################
     #   API Format  #
     #################
-    def format_for_api(self, root_id=None, degree=None, include_inactive=False):
-        """Return graph data formatted for the REST API (nodes + edges dicts)."""
-        # Ensure generation levels are assigned so the frontend can do hierarchical layout
-        self.assign_generation_levels()
-        if root_id and degree:
-            subgraph = self.get_subgraph_degrees(root_id, degree=degree)
+    def format_for_api(self, root_id=None, degree=None, include_inactive=False, max_nodes=None):
+        """Return graph data formatted for the REST API (nodes + edges dicts).
+
+        With *max_nodes* at most that many persons around *root_id* are returned, closest kin first, and
+        ``truncated`` tells whether anyone within *degree* hops was left out.
+        """
+        # Generation levels for the frontend's hierarchical layout are maintained on every change
+        if root_id and (degree or max_nodes):
+            subgraph = self.get_subgraph_degrees(root_id, degree=degree, max_nodes=max_nodes)
         else:
             subgraph = self.graph
+        return {
+            **self.format_graph_for_api(subgraph, include_inactive=include_inactive),
+            'truncated': subgraph is not self.graph and subgraph.graph.get('truncated', False),
+        }
+    def format_graph_for_api(self, subgraph, include_inactive=False):
+        """Return the nodes and edges of a graph (usually a subgraph of the tree) formatted for the REST API.
+
+        Persons of the tree also get their ancestor and descendant counts over the whole tree. Persons in the
+        ``frontier`` graph attribute of a budgeted subgraph are marked ``truncated``: they have relatives left out.
+        """
         nodes = []
-        for person_id, person_data in subgraph.nodes(data=True):
-            node = dict(person_data)
-            node['id'] = person_id
-            node['fullname'] = (node.get('firstname', '') + ' ' + node.get('lastname', '')).strip()
-            nodes.append(node)
-        edges = []
-        for source, target, data in subgraph.edges(data=True):
-            if include_inactive or data.get('is_active', True):
-                edge = dict(data)
-                edge['id'] = f"{source}_to_{target}"
-                edge['source'] = source
-                edge['target'] = target
-                edges.append(edge)
+        frontier = subgraph.graph.get('frontier', ()) if subgraph is not self.graph else ()
+        with self._lock:
+            counts = self._lineage_counts()
+            for person_id, person_data in subgraph.nodes(data=True):
+                node = dict(person_data)
+                node['id'] = person_id
+                node['fullname'] = (node.get('firstname', '') + ' ' + node.get('lastname', '')).strip()
+                if person_id in self.graph:
+                    node.update(counts.counts(person_id))
+                if person_id in frontier:
+                    node['truncated'] = True
+                nodes.append(node)
+            # Subgraphs are views of the tree, so they are read under the lock too
+            edges = []
+            for source, target, data in subgraph.edges(data=True):
+                if include_inactive or data.get('is_active', True):
+                    edge = dict(data)
+                    edge['id'] = f"{source}_to_{target}"
+                    edge['source'] = source
+                    edge['target'] = target
+                    edges.append(edge)
         return {'nodes': nodes, 'edges': edges}
     # Return a (sub)graph formatted for representation with the Streamlit Link Analysis library
     def format_for_st_link_analysis(self, root_id=None, degree=None):
@@ -677,23 +1666,24 @@ class FamilyTree:
             subgraph = self.get_subgraph_degrees(root_id, degree=degree)
         else:
             subgraph = self.graph
-        # Build the nodes and edges lists in a dictionary format
-        for person_id, person_data in subgraph.nodes(data=True):
-            person = person_data
-            person["id"] = person_id
-            person["label"] = "person"
-            person["fullname"] = (person.get('firstname', '') + ' ' + person.get('lastname', '')).strip()
-            person["fullname_linebreaks"] = person["fullname"].replace(' ', '\n')
-            nodes.append({"data": person})
-        for source, target, edge_data in subgraph.edges(data=True):
-            edges.append({
-                "data": {
-                    "id": source + "to" + target,
-                    "source": source,
-                    "target": target,
-                    "label": edge_data.get("type", ""),
-                }
-            })
+        # Build the nodes and edges lists in a dictionary format, under the lock as the subgraph is a view of the tree
+        with self._lock:
+            for person_id, person_data in subgraph.nodes(data=True):
+                person = dict(person_data)
+                person["id"] = person_id
+                person["label"] = "person"
+                person["fullname"] = (person.get('firstname', '') + ' ' + person.get('lastname', '')).strip()
+                person["fullname_linebreaks"] = person["fullname"].replace(' ', '\n')
+                nodes.append({"data": person})
+            for source, target, edge_data in subgraph.edges(data=True):
+                edges.append({
+                    "data": {
+                        "id": source + "to" + target,
+                        "source": source,
+                        "target": target,
+                        "label": edge_data.get("type", ""),
+                    }
+                })
         return {"nodes": nodes, "edges": edges}
     ###############
     #   Pictures  #
@@ -701,31 +1691,32 @@ class FamilyTree:
     def add_profile_picture(self, person_id, picture_url):
         if person_id not in self.graph:
             raise ValueError("Person must be in the family tree")
-        self.graph.nodes[person_id]["profilepic"] = picture_url
+        self._apply({"op": "update_node", "id": person_id, "attrs": {"profilepic": picture_url}})
         if self.autosave:
             self.save()
     def add_picture(self, person_id, picture_url):
         if person_id not in self.graph:
             raise ValueError("Person must be in the family tree")
-        if 'pictures' not in self.graph.nodes[person_id]:
-            self.graph.nodes[person_id]["pictures"] = []
-        if picture_url not in self.graph.nodes[person_id]["pictures"]:
-            self.graph.nodes[person_id]["pictures"].append(picture_url)
+        pics = list(self.get_person(person_id).get("pictures", []))
+        if picture_url not in pics:
+            pics.append(picture_url)
+            self._apply({"op": "update_node", "id": person_id, "attrs": {"pictures": pics}})
         if self.autosave:
             self.save()
 
     def remove_picture(self, person_id, picture_url):
         if person_id not in self.graph:
             raise ValueError("Person must be in the family tree")
-        pics = self.graph.nodes[person_id].get("pictures", [])
+        pics = list(self.get_person(person_id).get("pictures", []))
         if picture_url in pics:
             pics.remove(picture_url)
-            self.graph.nodes[person_id]["pictures"] = pics
+            self._apply({"op": "update_node", "id": person_id, "attrs": {"pictures": pics}})
             if self.autosave:
                 self.save()
 
     def get_people_in_picture(self, picture_url):
         """Return list of {id, fullname} for all persons who have this picture URL."""
+        self._load_all_details()
         results = []
         for pid, data in self.graph.nodes(data=True):
             pics = data.get("pictures", [])
@@ -744,7 +1735,7 @@ class FamilyTree:
     ###############
     def delete_person(self, person_id):
         if person_id in self.graph:
-            self.graph.remove_node(person_id)
+            self._apply({"op": "remove_node", "id": person_id})
         if self.autosave:
             self.save()
         if self.backend == 'cosmosdb':
@@ -752,7 +1743,21 @@ class FamilyTree:
             pass
         return person_id
     def delete_all(self):
-        self.graph.clear()
+        self._apply({"op": "clear"})
+    # Add the persons and relationships of another graph that are not in this tree yet, returning the number of new persons
+    def merge_graph(self, other):
+        imported_count = 0
+        with self._batch_levels():
+            for node_id, data in other.nodes(data=True):
+                if node_id not in self.graph:
+                    self._apply({"op": "add_node", "id": node_id, "attrs": dict(data)})
+                    imported_count += 1
+            for src, tgt, data in other.edges(data=True):
+                if not self.graph.has_edge(src, tgt):
+                    self._apply({"op": "add_edge", "source": src, "target": tgt, "attrs": dict(data)})
+        if self.autosave:
+            self.save()
+        return imported_count
 
     ###############
     #    Debug    #
@@ -787,28 +1792,13 @@ class FamilyTree:
         import argparse
 
         def assign_vlevels(graph, debug=False):
-            # Recursive function to assign levels
+            # Walk parents (isChildOf, one level up), children (one level down) and spouses (same level) breadth-first
             def assign_vlevel(node_id, vlevel):
-                if debug:
-                    print(f"DEBUG: Assigning vlevel {vlevel} to node {node_id} ({graph.nodes[node_id].get('firstname', '')} {graph.nodes[node_id].get('lastname', '')})")
-                graph.nodes[node_id]['vlevel'] = vlevel                      # This marks the node as visited
-                # Look for neighbors with outgoing edges (successors): parents (isChildOf) and spouses
-                for neighbor in graph.successors(node_id):
-                    if graph[node_id][neighbor]['type'] == 'isChildOf':
-                        if 'vlevel' not in graph.nodes[neighbor]:
-                            assign_vlevel(neighbor, vlevel - 1)
-                    elif graph[node_id][neighbor]['type'] == 'isSpouseOf':
-                        if 'vlevel' not in graph.nodes[neighbor]:
-                            assign_vlevel(neighbor, vlevel)
-                # Look for neighbors with incoming edges (predecessors): children and spouses
-                for neighbor in graph.predecessors(node_id):
-                    if graph[neighbor][node_id]['type'] == 'isChildOf':
-                        if 'vlevel' not in graph.nodes[neighbor]:
-                            assign_vlevel(neighbor, vlevel + 1)
-                    elif graph[neighbor][node_id]['type'] == 'isSpouseOf':     # Although this shouldnt be required, since the isSpouseOf relationship is bidirectional
-                        if 'vlevel' not in graph.nodes[neighbor]:
-                            assign_vlevel(neighbor, vlevel)
-            # Start from any node, from example, the first one, and assign vlevels recursively to all its neighbors
+                for person_id, offset in tree_traversal.generation_offsets(graph, node_id, adjacency=adjacency).items():
+                    if debug:
+                        print(f"DEBUG: Assigning vlevel {vlevel + offset} to node {person_id} ({graph.nodes[person_id].get('firstname', '')} {graph.nodes[person_id].get('lastname', '')})")
+                    graph.nodes[person_id]['vlevel'] = vlevel + offset
+            # Start from any node, from example, the first one, and assign vlevels to everybody connected to it
             if len(graph.nodes) > 0:
                 # Take the first node as root
                 root_node_id = list(graph.nodes)[0]
@@ -837,7 +1827,7 @@ class FamilyTree:
                 if 'parent_family_id' not in graph.nodes[person_id]:
                     # This person has not been assigned to a family yet as parent
                     # Look for their children
-                    children = [neighbor for neighbor in graph.predecessors(person_id) if graph[neighbor][person_id]['type'] == 'isChildOf']
+                    children = adjacency.children(person_id)
                     # If the person has children, assign everybody to the same family
                     if len(children) > 0:
                         family_id = None
@@ -853,7 +1843,7 @@ class FamilyTree:
                             graph.nodes[child]['child_family_id'] = family_id
                         graph.nodes[person_id]['parent_family_id'] = family_id
                         # Also assign the spouse(s) to the same family
-                        spouses = [neighbor for neighbor in graph.successors(person_id) if graph[person_id][neighbor]['type'] == 'isSpouseOf']
+                        spouses = adjacency.spouses(person_id)
                         for spouse in spouses:
                             graph.nodes[spouse]['parent_family_id'] = family_id
                         # Add the family to the families dictionary
@@ -869,59 +1859,45 @@ class FamilyTree:
         # Function that returns the IDs of the spouses of a person
         # Used to place children without spouses to the left of the chart, to avoid crossing lines
         def get_spouse_ids(graph, person_id):
-            spouse_ids = []
-            neighbors = graph.adj[person_id]
-            for i in neighbors:
-                if neighbors[i]['type'] == 'isSpouseOf':
-                    spouse_ids.append(i)
-            return spouse_ids
+            return adjacency.spouses(person_id)
         # Function that returns the IDs of the parents of the spouses of a person
         # Used to place couples where the spouse has no uplinks to the left of the chart, to avoid crossing lines
         def get_spouse_parents(graph, person_id):
             parents = []
             spouses = get_spouse_ids(graph, person_id)
             for spouse in spouses:
-                spouse_parents = [neighbor for neighbor in graph.successors(spouse) if graph[spouse][neighbor]['type'] == 'isChildOf']
-                parents.extend(spouse_parents)
+                parents.extend(adjacency.parents(spouse))
             return parents
         # This functions assigns the position in each vertical level (hlevel) to each person
         # This function is critical to reduce the amount of crossing lines in the final image between parents and children
         def assign_hlevels(graph, vlevels=None, debug=False):
-            # Recursive function to assign hlevels
-            def assign_hlevel(node_id, hlevels):
-                # Assign the level to the target person
+            # Place a person, then their spouses, then depth-first the children without spouses, the children whose
+            # spouses have no parents, the children whose spouses have parents and finally any remaining children
+            def place(node_id, hlevels):
                 if not 'hlevel' in graph.nodes[node_id]:
                     graph.nodes[node_id]['hlevel'] = hlevels[graph.nodes[node_id]['vlevel']]
                     hlevels[graph.nodes[node_id]['vlevel']] += 1
                 # Assign a consecutive level to spouses on the same vlevel
-                for neighbor in graph.successors(node_id):
-                    if graph[node_id][neighbor]['type'] == 'isSpouseOf':
-                        if not 'hlevel' in graph.nodes[neighbor]:
-                            graph.nodes[neighbor]['hlevel'] = hlevels[graph.nodes[neighbor]['vlevel']]
-                            hlevels[graph.nodes[neighbor]['vlevel']] += 1
-                # Start picking hlevels for the children that have no spouses
-                for neighbor in graph.predecessors(node_id):
-                    if graph[neighbor][node_id]['type'] == 'isChildOf':
-                        if len(get_spouse_ids(graph, neighbor)) == 0:
-                            if not 'hlevel' in graph.nodes[neighbor]:
-                                hlevels = assign_hlevel(neighbor, hlevels)
-                # Continue picking hlevels for the children whose spouses have no parents
-                for neighbor in graph.predecessors(node_id):
-                    if graph[neighbor][node_id]['type'] == 'isChildOf':
-                        if len(get_spouse_ids(graph, neighbor)) > 0 and len(get_spouse_parents(graph, neighbor)) == 0:
-                            if not 'hlevel' in graph.nodes[neighbor]:
-                                hlevels = assign_hlevel(neighbor, hlevels)
-                # Finally pick hlevels for the children whose spouses have parents
-                for neighbor in graph.predecessors(node_id):
-                    if graph[neighbor][node_id]['type'] == 'isChildOf':
-                        if len(get_spouse_ids(graph, neighbor)) > 0 and len(get_spouse_parents(graph, neighbor)) > 0:
-                            if not 'hlevel' in graph.nodes[neighbor]:
-                                hlevels = assign_hlevel(neighbor, hlevels)
-                # And for the parents
-                for neighbor in graph.predecessors(node_id):
-                    if graph[neighbor][node_id]['type'] == 'isChildOf':
-                        if not 'hlevel' in graph.nodes[neighbor]:
-                            hlevels = assign_hlevel(neighbor, hlevels)
+                for neighbor in adjacency.spouses(node_id):
+                    if not 'hlevel' in graph.nodes[neighbor]:
+                        graph.nodes[neighbor]['hlevel'] = hlevels[graph.nodes[neighbor]['vlevel']]
+                        hlevels[graph.nodes[neighbor]['vlevel']] += 1
+            # Children to descend into, checked lazily so that each child sees the places taken by its older siblings' families
+            def unplaced_children(node_id):
+                children = adjacency.children(node_id)
+                groups = [
+                    lambda child: len(get_spouse_ids(graph, child)) == 0,
+                    lambda child: len(get_spouse_ids(graph, child)) > 0 and len(get_spouse_parents(graph, child)) == 0,
+                    lambda child: len(get_spouse_ids(graph, child)) > 0 and len(get_spouse_parents(graph, child)) > 0,
+                    lambda child: True,
+                ]
+                for in_group in groups:
+                    for child in children:
+                        if in_group(child) and not 'hlevel' in graph.nodes[child]:
+                            yield child
+            def assign_hlevel(node_id, hlevels):
+                for person_id in tree_traversal.preorder(node_id, unplaced_children):
+                    place(person_id, hlevels)
                 return hlevels
             if vlevels is None:
                 return None
@@ -944,9 +1920,12 @@ class FamilyTree:
 
         # Load up tree from Azure Storage
         if root_person_id and degrees:
-            subgraph = self.get_subgraph_degrees(root_person_id, degree=degrees)
+            # The layout below writes its coordinates into the attributes of each person
+            subgraph = self.detach_subgraph(self.get_subgraph_degrees(root_person_id, degree=degrees))
         else:
             subgraph = self.graph
+        # The layout only changes person attributes, so the parents, children and spouses are listed once up front
+        adjacency = self._adjacency_index() if subgraph is self.graph else tree_indexes.TypedAdjacency(subgraph)
 
         # Assign levels
         subgraph, vlevels = assign_vlevels(subgraph, debug=verbose)
@@ -1037,46 +2016,45 @@ class FamilyTree:
             if 'spouse_position' in person_data:
                 continue    # Already processed
             else:
-                for neighbor in subgraph.successors(person_id):
-                    if subgraph[person_id][neighbor]['type'] == 'isSpouseOf':
-                        distance = abs(subgraph.nodes[neighbor]['pic_center'][0] - subgraph.nodes[person_id]['pic_center'][0])
-                        new_distance = int(round(distance * spouse_spacing_factor, 0))
-                        personpic_w = personpic_ws[subgraph.nodes[person_id]['vlevel']]
-                        personpic_h = personpic_hs[subgraph.nodes[person_id]['vlevel']]
-                        # Make sure they dont get closer than their picture width
-                        if new_distance < personpic_w * picframe_scale_factor:
-                            new_distance = personpic_w * picframe_scale_factor
-                        # DEBUG
-                        if verbose:
-                            print(f"DEBUG: Bringing spouses {person_id} and {neighbor} closer together, from distance {distance} to {new_distance}")
-                            print(f"DEBUG: Person picture size: {personpic_w}x{personpic_h}")
-                            print(f"DEBUG: Original positions were {subgraph.nodes[person_id]['pic_center']} and {subgraph.nodes[neighbor]['pic_center']}")
-                        # Mark the relative position of the spouses depending on their hlevel
-                        if subgraph.nodes[person_id]['hlevel'] < subgraph.nodes[neighbor]['hlevel']:
-                            subgraph.nodes[person_id]['spouse_position'] = 'left'
-                            subgraph.nodes[neighbor]['spouse_position'] = 'right'
-                            subgraph.nodes[person_id]['pic_center'] = (int(round(subgraph.nodes[person_id]['pic_center'][0] + (distance-new_distance) / 2, 0)), subgraph.nodes[person_id]['pic_center'][1])
-                            subgraph.nodes[neighbor]['pic_center'] = (int(round(subgraph.nodes[neighbor]['pic_center'][0] - (distance-new_distance) / 2, 0)), subgraph.nodes[neighbor]['pic_center'][1])
-                            subgraph.nodes[person_id]['pic_topleft'] = (int(round(subgraph.nodes[person_id]['pic_topleft'][0] + (distance-new_distance) / 2, 0)), subgraph.nodes[person_id]['pic_topleft'][1])
-                            subgraph.nodes[neighbor]['pic_topleft'] = (int(round(subgraph.nodes[neighbor]['pic_topleft'][0] - (distance-new_distance) / 2, 0)), subgraph.nodes[neighbor]['pic_topleft'][1])
-                        else:
-                            subgraph.nodes[neighbor]['spouse_position'] = 'right'
-                            subgraph.nodes[person_id]['spouse_position'] = 'left'
-                            subgraph.nodes[neighbor]['pic_center'] = (int(round(subgraph.nodes[neighbor]['pic_center'][0] + (distance-new_distance) / 2, 0)), subgraph.nodes[neighbor]['pic_center'][1])
-                            subgraph.nodes[person_id]['pic_center'] = (int(round(subgraph.nodes[person_id]['pic_center'][0] - (distance-new_distance) / 2, 0)), subgraph.nodes[person_id]['pic_center'][1])
-                            subgraph.nodes[neighbor]['pic_topleft'] = (int(round(subgraph.nodes[neighbor]['pic_topleft'][0] + (distance-new_distance) / 2, 0)), subgraph.nodes[neighbor]['pic_topleft'][1])
-                            subgraph.nodes[person_id]['pic_topleft'] = (int(round(subgraph.nodes[person_id]['pic_topleft'][0] - (distance-new_distance) / 2, 0)), subgraph.nodes[person_id]['pic_topleft'][1])
-                        # DEBUG
-                        if verbose:
-                            print(f"DEBUG: New positions are {subgraph.nodes[person_id]['pic_center']} and {subgraph.nodes[neighbor]['pic_center']}")
-                        # Add as well a random offset so that horizontal lines to children are not overlapping with other families
-                        random_offset = random.randint(-100, 100)
-                        subgraph.nodes[person_id]['offset'] = random_offset
-                        subgraph.nodes[neighbor]['offset'] = random_offset
-                        # Add the midpoint between the two spouses too
-                        spouses_midpoint_x = int(round((subgraph.nodes[person_id]['pic_center'][0] + subgraph.nodes[neighbor]['pic_center'][0]) / 2, 0))
-                        subgraph.nodes[person_id]['spouses_midpoint_x'] = spouses_midpoint_x
-                        subgraph.nodes[neighbor]['spouses_midpoint_x'] = spouses_midpoint_x
+                for neighbor in adjacency.spouses(person_id):
+                    distance = abs(subgraph.nodes[neighbor]['pic_center'][0] - subgraph.nodes[person_id]['pic_center'][0])
+                    new_distance = int(round(distance * spouse_spacing_factor, 0))
+                    personpic_w = personpic_ws[subgraph.nodes[person_id]['vlevel']]
+                    personpic_h = personpic_hs[subgraph.nodes[person_id]['vlevel']]
+                    # Make sure they dont get closer than their picture width
+                    if new_distance < personpic_w * picframe_scale_factor:
+                        new_distance = personpic_w * picframe_scale_factor
+                    # DEBUG
+                    if verbose:
+                        print(f"DEBUG: Bringing spouses {person_id} and {neighbor} closer together, from distance {distance} to {new_distance}")
+                        print(f"DEBUG: Person picture size: {personpic_w}x{personpic_h}")
+                        print(f"DEBUG: Original positions were {subgraph.nodes[person_id]['pic_center']} and {subgraph.nodes[neighbor]['pic_center']}")
+                    # Mark the relative position of the spouses depending on their hlevel
+                    if subgraph.nodes[person_id]['hlevel'] < subgraph.nodes[neighbor]['hlevel']:
+                        subgraph.nodes[person_id]['spouse_position'] = 'left'
+                        subgraph.nodes[neighbor]['spouse_position'] = 'right'
+                        subgraph.nodes[person_id]['pic_center'] = (int(round(subgraph.nodes[person_id]['pic_center'][0] + (distance-new_distance) / 2, 0)), subgraph.nodes[person_id]['pic_center'][1])
+                        subgraph.nodes[neighbor]['pic_center'] = (int(round(subgraph.nodes[neighbor]['pic_center'][0] - (distance-new_distance) / 2, 0)), subgraph.nodes[neighbor]['pic_center'][1])
+                        subgraph.nodes[person_id]['pic_topleft'] = (int(round(subgraph.nodes[person_id]['pic_topleft'][0] + (distance-new_distance) / 2, 0)), subgraph.nodes[person_id]['pic_topleft'][1])
+                        subgraph.nodes[neighbor]['pic_topleft'] = (int(round(subgraph.nodes[neighbor]['pic_topleft'][0] - (distance-new_distance) / 2, 0)), subgraph.nodes[neighbor]['pic_topleft'][1])
+                    else:
+                        subgraph.nodes[neighbor]['spouse_position'] = 'right'
+                        subgraph.nodes[person_id]['spouse_position'] = 'left'
+                        subgraph.nodes[neighbor]['pic_center'] = (int(round(subgraph.nodes[neighbor]['pic_center'][0] + (distance-new_distance) / 2, 0)), subgraph.nodes[neighbor]['pic_center'][1])
+                        subgraph.nodes[person_id]['pic_center'] = (int(round(subgraph.nodes[person_id]['pic_center'][0] - (distance-new_distance) / 2, 0)), subgraph.nodes[person_id]['pic_center'][1])
+                        subgraph.nodes[neighbor]['pic_topleft'] = (int(round(subgraph.nodes[neighbor]['pic_topleft'][0] + (distance-new_distance) / 2, 0)), subgraph.nodes[neighbor]['pic_topleft'][1])
+                        subgraph.nodes[person_id]['pic_topleft'] = (int(round(subgraph.nodes[person_id]['pic_topleft'][0] - (distance-new_distance) / 2, 0)), subgraph.nodes[person_id]['pic_topleft'][1])
+                    # DEBUG
+                    if verbose:
+                        print(f"DEBUG: New positions are {subgraph.nodes[person_id]['pic_center']} and {subgraph.nodes[neighbor]['pic_center']}")
+                    # Add as well a random offset so that horizontal lines to children are not overlapping with other families
+                    random_offset = random.randint(-100, 100)
+                    subgraph.nodes[person_id]['offset'] = random_offset
+                    subgraph.nodes[neighbor]['offset'] = random_offset
+                    # Add the midpoint between the two spouses too
+                    spouses_midpoint_x = int(round((subgraph.nodes[person_id]['pic_center'][0] + subgraph.nodes[neighbor]['pic_center'][0]) / 2, 0))
+                    subgraph.nodes[person_id]['spouses_midpoint_x'] = spouses_midpoint_x
+                    subgraph.nodes[neighbor]['spouses_midpoint_x'] = spouses_midpoint_x
 
         # For each vlevel, set an additional field on the nodes similar to hlevel but where spouses count as one single position
         for vlevel in range(vlevels[0], vlevels[1] + 1):
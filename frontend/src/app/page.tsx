@@ -53,6 +53,9 @@ const EDGE_COLORS: Record<string, string> = {
 
 type HistoryMode = "none" | "push" | "replace";
 
+// Persons shown around the root at most, closest kin first; the rest are marked on the persons at the edge
+const GRAPH_MAX_NODES = 500;
+
 function isNotFoundError(error: unknown): boolean {
   return error instanceof Error && error.message.startsWith("404:");
 }
@@ -145,7 +148,7 @@ export default function ExplorePage() {
   const fetchGraph = useCallback(async () => {
     setLoading(true);
     try {
-      const data = await getGraph(rootId || undefined, degree, true);
+      const data = await getGraph(rootId || undefined, degree, true, rootId ? GRAPH_MAX_NODES : undefined);
       setGraphData(data);
     } catch (err) {
       console.error("Failed to load graph:", err);
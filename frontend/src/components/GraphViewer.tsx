@@ -469,6 +469,7 @@ export default function GraphViewer({ data, layout = "family", onNodeClick, onNo
             profilepicUrl: picUrl || "",
             hasPic: n.profilepic ? "yes" : "no",
             isDeceased: !n.isAlive && n.isAlive !== undefined ? "yes" : "no",
+            truncated: n.truncated ? "yes" : "no",
             level: typeof n.level === "number" ? n.level : 0,
           },
         };
@@ -598,6 +599,15 @@ export default function GraphViewer({ data, layout = "family", onNodeClick, onNo
             opacity: 0.8,
           } as cytoscape.Css.Node,
         },
+        // Relatives left out by the node budget: dashed outline
+        {
+          selector: 'node[truncated = "yes"]',
+          style: {
+            "border-width": 2,
+            "border-color": "#d97706",
+            "border-style": "dashed",
+          } as cytoscape.Css.Node,
+        },
       ],
       layout: canRestoreGraphState && savedGraphState
         ? {
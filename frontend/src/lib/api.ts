@@ -108,12 +108,14 @@ async function apiFetch(path: string, init?: RequestInit): Promise<Response> {
 export async function getGraph(
   rootId?: string,
   degree?: number,
-  includeInactive?: boolean
+  includeInactive?: boolean,
+  maxNodes?: number
 ): Promise<GraphData> {
   const params = new URLSearchParams();
   if (rootId) params.append("root_id", rootId);
   if (degree !== undefined) params.append("degree", String(degree));
   if (includeInactive) params.append("include_inactive", "true");
+  if (maxNodes !== undefined) params.append("max_nodes", String(maxNodes));
   const res = await apiFetch(`/api/graph?${params}`);
   return res.json();
 }
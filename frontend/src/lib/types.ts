@@ -14,6 +14,7 @@ export interface PersonNode {
   level?: number;
   relationships?: GraphEdge[];
   siblings?: string[];
+  truncated?: boolean;
   [key: string]: unknown;
 }
 
@@ -30,6 +31,7 @@ export interface GraphEdge {
 export interface GraphData {
   nodes: PersonNode[];
   edges: GraphEdge[];
+  truncated?: boolean;
 }
 
 export interface FieldConfig {
@@ -341,12 +341,6 @@ def cmd_import(args: argparse.Namespace) -> None:
                         type="isSpouseOf",
                         override_warnings=True,
                     )
-                    tree.add_relationship(
-                        fam_pid,
-                        person_id,
-                        type="isSpouseOf",
-                        override_warnings=True,
-                    )
                     print(f"    → Spouse: {fam_name}")
                 elif rel == "parent":
                     tree.add_relationship(
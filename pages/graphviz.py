@@ -17,8 +17,7 @@ def show_graphviz(user_role='user'):
 
     # Initialize the family tree with Azure storage as backend
     tree = FamilyTree(backend='azstorage', azstorage_account=azure_storage_account, azstorage_key=azure_storage_key, azstorage_container="familytreejson", azstorage_blob='familytree.gml')
-    # Assign generation levels for a hierarchical layout
-    tree.assign_generation_levels()
+    # Generation levels for the hierarchical layout are maintained by FamilyTree
 
     # Graph filter
     left, center, right = st.columns(3)
@@ -39,7 +38,8 @@ def show_graphviz(user_role='user'):
     # Create subgraph
     subgraph = None
     if selected_person and selected_node_id:
-        subgraph = tree.get_subgraph_degrees(selected_node_id, degree=degree)
+        # The graph is drawn from a copy, as the view follows the tree while other sessions change it
+        subgraph = tree.detach_subgraph(tree.get_subgraph_degrees(selected_node_id, degree=degree))
         if subgraph.number_of_nodes() == 0:
             st.warning(f"No relationships found within {degree} degrees of '{selected_person}'. Showing full graph instead.")
             subgraph = tree.graph
@@ -22,8 +22,7 @@ def show_pyvis(user_role='user'):
 
     # Initialize the family tree with Azure storage as backend
     tree = FamilyTree(backend='azstorage', azstorage_account=azure_storage_account, azstorage_key=azure_storage_key, azstorage_container="familytreejson", azstorage_blob='familytree.gml')
-    # Assign generation levels for a hierarchical layout
-    tree.assign_generation_levels()
+    # Generation levels for the hierarchical layout are maintained by FamilyTree
 
     # Graph filter
     left, center, right = st.columns(3)
@@ -38,7 +37,8 @@ def show_pyvis(user_role='user'):
         degree = st.slider("Select graph degree (number of relationship hops from center person):", min_value=1, max_value=5, value=2, step=1)
     subgraph = None
     if selected_person and selected_node_id:
-        subgraph = tree.get_subgraph_degrees(selected_node_id, degree=degree)
+        # pyvis writes its defaults into the attributes of each person, so it gets a copy of the view
+        subgraph = tree.detach_subgraph(tree.get_subgraph_degrees(selected_node_id, degree=degree))
         if subgraph.number_of_nodes() == 0:
             st.warning(f"No relationships found within {degree} degrees of '{selected_person}'. Showing full graph instead.")
             subgraph = tree.graph
@@ -1,6 +1,7 @@
 import streamlit as st
 import uuid
 import os
+import tempfile
 from pathlib import Path
 import datetime
 from st_link_analysis import st_link_analysis, NodeStyle, EdgeStyle
@@ -54,7 +55,9 @@ def show_st_link_analysis(user_role='user'):
 
     # Initialize the family tree
     # tree = FamilyTree(backend='local', localfile='C:\\Users\\jomore\\Downloads\\familytree.gml')
-    tree = FamilyTree(backend='azstorage', azstorage_account=azure_storage_account, azstorage_key=azure_storage_key, azstorage_container="familytreejson", azstorage_blob='familytree.gml')
+    # The local cache turns the download on every rerun into a conditional GET
+    tree = FamilyTree(backend='azstorage', azstorage_account=azure_storage_account, azstorage_key=azure_storage_key, azstorage_container="familytreejson", azstorage_blob='familytree.gml',
+                      cache_dir=os.path.join(tempfile.gettempdir(), "familytree-cache"))
 
     # Graph filter
     left, right = st.columns(2)
@@ -0,0 +1,81 @@
+"""Compact storage of person attributes.
+
+Person attributes stay plain dicts, as networkx, the serializers and every
+caller expect them to be, but the strings in them are shared.  Surnames,
+places, dates, genders and picture URLs repeat across thousands of persons,
+and every load, request or journal record otherwise gives each person a copy
+of its own.  An :class:`AttributePool` keeps one string per distinct value of
+the pooled fields, which are the text fields of ``config/person_schema.json``
+and ``gender``, and per attribute name; values of other fields, such as
+notes, are kept as they are.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Iterable
+
+import networkx as nx
+
+
+PERSON_SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "config", "person_schema.json")
+
+# Schema field types whose values are strings, or lists of strings, worth sharing
+_POOLED_TYPES = ("string", "date", "image_url", "image_url_array")
+
+# Fields pooled whatever the schema says: set by the importers and the layout, and few distinct values
+_BUILTIN_FIELDS = ("gender",)
+
+
+def person_fields(config_path: str = PERSON_SCHEMA_PATH) -> tuple[str, ...]:
+    """The fields of the person schema at *config_path* whose values are pooled."""
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            fields = json.load(f).get("fields", {})
+    except FileNotFoundError:
+        fields = {}
+    pooled = [name for name, config in fields.items() if config.get("type") in _POOLED_TYPES]
+    return tuple(dict.fromkeys(pooled + list(_BUILTIN_FIELDS)))
+
+
+class AttributePool:
+    """One shared copy of each attribute name and of each value of the *fields* to pool."""
+
+    def __init__(self, fields: Iterable[str]) -> None:
+        self.fields = frozenset(fields)
+        self._strings: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def _string(self, value: str) -> str:
+        return self._strings.setdefault(value, value)
+
+    def share(self, value: Any) -> Any:
+        """*value* made of shared strings: a string, or a list of strings such as picture URLs."""
+        if isinstance(value, str):
+            return self._string(value)
+        if isinstance(value, list):
+            return [self._string(item) if isinstance(item, str) else item for item in value]
+        return value
+
+    def compact(self, attrs: dict[str, Any]) -> dict[str, Any]:
+        """Swap the names and pooled values of *attrs* for their shared copies, in place, and return it."""
+        items = [
+            (self._string(key), self.share(value) if key in self.fields else value)
+            for key, value in attrs.items()
+        ]
+        attrs.clear()
+        attrs.update(items)
+        return attrs
+
+    def compact_graph(self, graph: nx.DiGraph) -> None:
+        """Compact the attributes of every person of *graph*, starting from an empty pool.
+
+        Starting afresh drops the values that no person of the previous graph
+        holds any longer, such as names that were since corrected.
+        """
+        self._strings = {}
+        for _, attrs in graph.nodes(data=True):
+            self.compact(attrs)
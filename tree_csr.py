@@ -0,0 +1,235 @@
+"""Read-only compressed sparse row (CSR) snapshots of family-tree graphs.
+
+networkx keeps relationships as dicts of dicts, so a pass over the whole
+tree runs in Python one person and one relationship at a time.  A
+:class:`CSRSnapshot` copies the topology once into NumPy arrays, with rows
+numbered by the dense ids of ``tree_indexes.NodeIds``.  Each relationship
+type gets an ``indptr``/``indices`` pair listing the target of every
+relationship of each person, and an ``active`` mask over them.  Searches
+within a number of hops, connected components and lineage depths then
+process a whole frontier or generation per step as array operations.  A
+snapshot never changes: ``FamilyTree.get_csr_snapshot`` builds a new one on
+first use after the tree changed.
+"""
+
+from __future__ import annotations
+
+from typing import Hashable, Iterable, NamedTuple
+
+import networkx as nx
+import numpy as np
+
+import tree_traversal
+from tree_indexes import NodeIds
+
+
+class TypeAdjacency(NamedTuple):
+    """Relationships of one type in CSR form: person ``i`` has targets ``indices[indptr[i]:indptr[i + 1]]``."""
+
+    indptr: np.ndarray
+    indices: np.ndarray
+    active: np.ndarray
+
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+def _csr(sources: np.ndarray, targets: np.ndarray, size: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """``(indptr, indices, order)`` of the edges *sources* to *targets*; *order* sorts other per-edge arrays alike."""
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+    return indptr, targets[order], order
+
+
+def _gather(indptr: np.ndarray, indices: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The neighbours of all *rows*, as ``(row of each, neighbour)`` arrays."""
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    total = int(counts.sum())
+    if not total:
+        return rows[:0], indices[:0]
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+    return np.repeat(rows, counts), indices[offsets]
+
+
+class CSRSnapshot:
+    """Immutable CSR adjacency of *graph*, rows numbered by *node_ids* (a new :class:`NodeIds` if not given).
+
+    Rows of ids that no person holds have no relationships and are left out
+    of every result.  Relationships are taken as they are when the snapshot
+    is built; activating or deactivating one later is not seen either.
+    """
+
+    def __init__(self, graph: nx.DiGraph, node_ids: NodeIds | None = None) -> None:
+        if node_ids is None:
+            node_ids = NodeIds(graph)
+        self.nodes: tuple[Hashable | None, ...] = tuple(node_ids.nodes)
+        self.ids: dict[Hashable, int] = dict(node_ids.ids)
+        size = len(self.nodes)
+        # Rows in the order the graph lists its persons, which the results keep
+        self.order = _frozen(np.fromiter((self.ids[node] for node in graph), dtype=np.int64, count=len(self.ids)))
+        present = np.zeros(size, dtype=bool)
+        present[self.order] = True
+        self.present = _frozen(present)
+
+        codes: dict[Hashable, int] = {}
+        edges = [
+            (self.ids[source], self.ids[target], codes.setdefault(data.get("type"), len(codes)), tree_traversal.is_active(data))
+            for source, target, data in graph.edges(data=True)
+        ]
+        columns = np.array(edges, dtype=np.int64).reshape(-1, 4).T
+        sources, targets, kinds, active = columns
+        self.types: dict[Hashable, TypeAdjacency] = {}
+        for rel_type, code in codes.items():
+            selected = kinds == code
+            indptr, indices, order = _csr(sources[selected], targets[selected], size)
+            self.types[rel_type] = TypeAdjacency(
+                _frozen(indptr), _frozen(indices), _frozen(active[selected][order].astype(bool))
+            )
+        self._views: dict[tuple, tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def size(self) -> int:
+        """Number of rows, which is at least the number of persons."""
+        return len(self.nodes)
+
+    def edges(self, types: Iterable[Hashable] | None = None, active_only: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """``(sources, targets)`` rows of the relationships of *types* (all types if ``None``)."""
+        sources, targets = [], []
+        for rel_type in self.types if types is None else types:
+            adjacency = self.types.get(rel_type)
+            if adjacency is None:
+                continue
+            rows = np.repeat(np.arange(self.size), np.diff(adjacency.indptr))
+            if active_only:
+                sources.append(rows[adjacency.active])
+                targets.append(adjacency.indices[adjacency.active])
+            else:
+                sources.append(rows)
+                targets.append(adjacency.indices)
+        if not sources:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(sources), np.concatenate(targets)
+
+    def _view(self, types: Iterable[Hashable] | None, active_only: bool, direction: str) -> tuple[np.ndarray, np.ndarray]:
+        """``(indptr, indices)`` from each person to their relatives: ``"out"`` targets, ``"in"`` sources or ``"both"``."""
+        key = (None if types is None else frozenset(types), active_only, direction)
+        if key not in self._views:
+            sources, targets = self.edges(types, active_only)
+            if direction == "in":
+                sources, targets = targets, sources
+            elif direction == "both":
+                sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+            indptr, indices, _ = _csr(sources, targets, self.size)
+            self._views[key] = (_frozen(indptr), _frozen(indices))
+        return self._views[key]
+
+    # ------------------------------------------------------------------
+    # Analytics
+    # ------------------------------------------------------------------
+
+    def within_hops(
+        self,
+        start: Hashable,
+        hops: int | None = None,
+        types: Iterable[Hashable] | None = None,
+        active_only: bool = False,
+    ) -> dict[Hashable, int]:
+        """Everyone within *hops* relationships of *start* either way, with their distance, nearest first."""
+        indptr, indices = self._view(types, active_only, "both")
+        distance = np.full(self.size, -1, dtype=np.int64)
+        frontier = np.array([self.ids[start]], dtype=np.int64)
+        distance[frontier] = 0
+        hop = 0
+        while frontier.size and (hops is None or hop < hops):
+            hop += 1
+            _, reached = _gather(indptr, indices, frontier)
+            frontier = np.unique(reached[distance[reached] < 0])
+            distance[frontier] = hop
+        found = np.flatnonzero(distance >= 0)
+        found = found[np.argsort(distance[found], kind="stable")]
+        return dict(zip((self.nodes[row] for row in found.tolist()), distance[found].tolist()))
+
+    def components(self, types: Iterable[Hashable] | None = None, active_only: bool = False) -> np.ndarray:
+        """Label of every row: the smallest row of the person's connected component, or -1 for rows without one.
+
+        Labels are lowered across every relationship and then shortcut to
+        the label of their label until nothing changes, which usually takes
+        far fewer rounds than the longest distance within a component.
+        """
+        sources, targets = self.edges(types, active_only)
+        labels = np.arange(self.size)
+        while True:
+            lowered = labels.copy()
+            np.minimum.at(lowered, sources, labels[targets])
+            np.minimum.at(lowered, targets, labels[sources])
+            while True:
+                shortcut = lowered[lowered]
+                if np.array_equal(shortcut, lowered):
+                    break
+                lowered = shortcut
+            if np.array_equal(lowered, labels):
+                break
+            labels = lowered
+        labels[~self.present] = -1
+        return labels
+
+    def component_count(self, types: Iterable[Hashable] | None = None, active_only: bool = False) -> int:
+        """Number of connected components, counting persons without relationships as one each."""
+        labels = self.components(types, active_only)
+        return int(np.count_nonzero(labels == np.arange(self.size)))
+
+    def lineage_depths(self, active_only: bool = False) -> tuple[dict[Hashable, int], dict[Hashable, int]]:
+        """Generations above and below every person, as :func:`tree_traversal.lineage_depths` computes them.
+
+        The persons that are not on a cycle of ``isChildOf`` relationships are
+        done one generation at a time; the rare persons on a cycle are then
+        done one by one in graph order, as ``tree_traversal`` does.
+        """
+        parents = self._view(["isChildOf"], active_only, "out")
+        children = self._view(["isChildOf"], active_only, "in")
+        size = self.size
+        above = np.full(size, -1, dtype=np.int64)
+        pending = np.diff(parents[0])
+        frontier = np.flatnonzero(self.present & (pending == 0))
+        depth = 0
+        while frontier.size:
+            above[frontier] = depth
+            _, reached = _gather(*children, frontier)
+            pending = pending - np.bincount(reached, minlength=size)
+            frontier = np.unique(reached[pending[reached] == 0])
+            depth += 1
+        ordered = above >= 0
+        cyclic = self.order[~ordered[self.order]]
+        for row in cyclic.tolist():
+            known = above[parents[1][parents[0][row]:parents[0][row + 1]]]
+            above[row] = 1 + int(known.max(initial=-1))
+
+        # Children of persons on a cycle are on one too, so those are done first, from the last one back
+        below = np.full(size, -1, dtype=np.int64)
+        for row in cyclic[::-1].tolist():
+            known = below[children[1][children[0][row]:children[0][row + 1]]]
+            below[row] = 1 + int(known.max(initial=-1))
+        best = np.zeros(size, dtype=np.int64)
+        owners, reached = _gather(*parents, cyclic)
+        np.maximum.at(best, reached, below[owners] + 1)
+        # Then the rest one generation at a time from those without ordered children, whose parents are all ordered
+        _, reached = _gather(*parents, np.flatnonzero(ordered))
+        pending = np.bincount(reached, minlength=size)
+        frontier = np.flatnonzero(ordered & (pending == 0))
+        while frontier.size:
+            below[frontier] = best[frontier]
+            owners, reached = _gather(*parents, frontier)
+            np.maximum.at(best, reached, below[owners] + 1)
+            pending = pending - np.bincount(reached, minlength=size)
+            frontier = np.unique(reached[pending[reached] == 0])
+
+        nodes = [self.nodes[row] for row in self.order.tolist()]
+        return dict(zip(nodes, above[self.order].tolist())), dict(zip(nodes, below[self.order].tolist()))
@@ -0,0 +1,674 @@
+"""Incrementally maintained indexes over family-tree graphs.
+
+Indexes are built once from a graph and then kept up to date by
+``FamilyTree`` as records are applied, so queries do not have to walk the
+whole tree.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from typing import Any, Hashable, Iterator
+
+import networkx as nx
+
+import tree_traversal
+
+
+# Ahnentafel slot of a parent by gender: fathers are 2n, mothers 2n + 1
+_PARENT_SLOTS = {"male": 0, "female": 1}
+
+
+class NodeIds:
+    """Dense integer ids for the persons of *graph*, and the person of each id.
+
+    Persons keep their UUID keys in the graph and the API; the integer ids
+    are for array-backed indexes and walks that would otherwise hash those
+    keys.  Ids run from 0 to ``capacity - 1``: the id of a removed person is
+    given to the next person added, so arrays sized by ``capacity`` stay
+    dense however many persons come and go.  :meth:`key` returns the key
+    object the graph holds for an equal id, so that ids parsed from requests,
+    rows or journal records can share one string per person.
+    """
+
+    def __init__(self, graph: nx.DiGraph) -> None:
+        self.graph = graph
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        self.nodes: list[Hashable | None] = list(self.graph)
+        self.ids: dict[Hashable, int] = {node: node_id for node_id, node in enumerate(self.nodes)}
+        self._free: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, node: object) -> bool:
+        return node in self.ids
+
+    @property
+    def capacity(self) -> int:
+        return len(self.nodes)
+
+    def id(self, node: Hashable) -> int:
+        return self.ids[node]
+
+    def node(self, node_id: int) -> Hashable:
+        node = self.nodes[node_id]
+        if node is None:
+            raise KeyError(node_id)
+        return node
+
+    def key(self, node: Hashable) -> Hashable:
+        """The key of *node* as the graph holds it, or *node* itself for someone not in the graph."""
+        node_id = self.ids.get(node)
+        return node if node_id is None else self.nodes[node_id]
+
+    def add_person(self, node: Hashable) -> int:
+        if node in self.ids:
+            return self.ids[node]
+        if self._free:
+            node_id = self._free.pop()
+            self.nodes[node_id] = node
+        else:
+            node_id = len(self.nodes)
+            self.nodes.append(node)
+        self.ids[node] = node_id
+        return node_id
+
+    def remove_person(self, node: Hashable) -> None:
+        node_id = self.ids.pop(node, None)
+        if node_id is not None:
+            self.nodes[node_id] = None
+            self._free.append(node_id)
+
+
+class TypedAdjacency:
+    """Parents, children and spouses of every person of *graph*, by relationship type.
+
+    Each entry keeps a reference to the attribute dict of its relationship,
+    which networkx updates in place, so activating or deactivating a
+    relationship needs no maintenance and every query can be asked with or
+    without inactive relationships.  Only adding, removing or retyping a
+    relationship, or removing a person, changes the index.  Spouses are
+    listed once whichever way, or both ways, the relationship is stored.
+    Parents and children are listed in the adjacency order of the graph when
+    the index is built, followed by relationships added or retyped since.
+    """
+
+    def __init__(self, graph: nx.DiGraph) -> None:
+        self.graph = graph
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        self._parents: dict[Hashable, dict[Hashable, dict]] = {node: {} for node in self.graph}
+        self._children: dict[Hashable, dict[Hashable, dict]] = {node: {} for node in self.graph}
+        self._spouses: dict[Hashable, dict[Hashable, list[dict]]] = {node: {} for node in self.graph}
+        for source, target, data in self.graph.edges(data=True):
+            if data.get("type") == "isChildOf":
+                self._parents[source][target] = data
+                self._children[target][source] = data
+            elif data.get("type") == "isSpouseOf":
+                self._spouses[source].setdefault(target, []).append(data)
+                if source != target:
+                    self._spouses[target].setdefault(source, []).append(data)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def parents(self, node: Hashable, active_only: bool = False) -> list[Hashable]:
+        return [parent for parent, data in self._parents[node].items() if not active_only or tree_traversal.is_active(data)]
+
+    def children(self, node: Hashable, active_only: bool = False) -> list[Hashable]:
+        return [child for child, data in self._children[node].items() if not active_only or tree_traversal.is_active(data)]
+
+    def spouses(self, node: Hashable, active_only: bool = False) -> list[Hashable]:
+        return [
+            spouse for spouse, edges in self._spouses[node].items()
+            if not active_only or any(tree_traversal.is_active(data) for data in edges)
+        ]
+
+    def siblings_by_parent(self, node: Hashable, active_only: bool = False) -> dict[Hashable, list[Hashable]]:
+        """The other children of each parent of *node*."""
+        return {
+            parent: [child for child in self.children(parent, active_only) if child != node]
+            for parent in self.parents(node, active_only)
+        }
+
+    def siblings(self, node: Hashable, active_only: bool = False) -> list[Hashable]:
+        """Persons sharing at least one parent with *node*, each once."""
+        siblings: dict[Hashable, None] = {}
+        for children in self.siblings_by_parent(node, active_only).values():
+            siblings.update(dict.fromkeys(children))
+        return list(siblings)
+
+    def relationships(self, node: Hashable) -> Iterator[tuple[Hashable, Hashable, dict]]:
+        """The parent, child and spouse relationships of *node* as (source, target, attribute dict).
+
+        Parent relationships are given as (node, parent), child ones as
+        (child, node) and spouse ones as (node, spouse), whichever way each
+        is stored.
+        """
+        for parent, data in self._parents[node].items():
+            yield node, parent, data
+        for child, data in self._children[node].items():
+            yield child, node, data
+        for spouse, edges in self._spouses[node].items():
+            for data in edges:
+                yield node, spouse, data
+
+    def typed_neighbors(
+        self, node: Hashable, steps: tree_traversal.Steps, active_only: bool = False
+    ) -> Iterator[tuple[Hashable, int]]:
+        """Like :func:`tree_traversal.typed_neighbors`, for the parent and spouse relationships indexed here.
+
+        Spouses are yielded once, with the forward step of ``isSpouseOf``.
+        """
+        step = steps.get("isChildOf", (None, None))
+        if step[0] is not None:
+            for parent in self.parents(node, active_only):
+                yield parent, step[0]
+        if step[1] is not None:
+            for child in self.children(node, active_only):
+                yield child, step[1]
+        step = steps.get("isSpouseOf", (None, None))
+        if step[0] is not None:
+            for spouse in self.spouses(node, active_only):
+                yield spouse, step[0]
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def add_person(self, node: Hashable) -> None:
+        self._parents.setdefault(node, {})
+        self._children.setdefault(node, {})
+        self._spouses.setdefault(node, {})
+
+    def remove_person(self, node: Hashable) -> None:
+        for parent in self._parents.pop(node, {}):
+            self._children[parent].pop(node, None)
+        for child in self._children.pop(node, {}):
+            self._parents[child].pop(node, None)
+        for spouse in self._spouses.pop(node, {}):
+            if spouse != node:
+                self._spouses[spouse].pop(node, None)
+
+    def touch_relationship(self, source: Hashable, target: Hashable) -> None:
+        """Re-read the relationship from *source* to *target* after it was added, removed or changed type."""
+        self.add_person(source)
+        self.add_person(target)
+        data = self.graph.adj[source].get(target) if source in self.graph else None
+        if data is not None and data.get("type") == "isChildOf":
+            self._parents[source][target] = data
+            self._children[target][source] = data
+        else:
+            self._parents[source].pop(target, None)
+            self._children[target].pop(source, None)
+        # A couple may be stored both ways, so their entry is made from both relationships
+        edges = [
+            data for data in (self.graph.adj[a].get(b) for a, b in ((source, target), (target, source)) if a in self.graph)
+            if data is not None and data.get("type") == "isSpouseOf"
+        ]
+        for a, b in ((source, target), (target, source)):
+            if edges:
+                self._spouses[a][b] = edges
+            else:
+                self._spouses[a].pop(b, None)
+
+
+class AncestryIndex:
+    """Two topological labels over the active ``isChildOf`` relationships of *graph*.
+
+    ``rank`` counts generations down from the top and ``height`` generations up
+    from the bottom: every parent has a lower rank and a greater height than
+    each of their children.  So A can only be an ancestor of B if A is ranked
+    below B and stands higher than B.  This answers "is A an ancestor of B"
+    immediately in the common cases, such as a brand new person or parent, and
+    otherwise limits the search to B's ancestors that lie between the two.
+    Labels need not be unique or dense; removing or deactivating a
+    relationship only loosens the constraints, so it leaves them valid.
+
+    Labels cannot order a cycle of ``isChildOf`` relationships, which
+    validation prevents but unvalidated imports may contain.  Once one is
+    found the index answers queries with unpruned searches until it is rebuilt.
+    """
+
+    def __init__(self, graph: nx.DiGraph) -> None:
+        self.graph = graph
+        self.rank: dict[Hashable, int] = {}
+        self.height: dict[Hashable, int] = {}
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        self.rank, self.height = tree_traversal.lineage_depths(self.graph, active_only=True)
+        self.cyclic = any(
+            self.rank[parent] >= self.rank[child] or self.height[parent] <= self.height[child]
+            for child, parent, data in self.graph.edges(data=True)
+            if data.get("type") == "isChildOf" and tree_traversal.is_active(data)
+        )
+
+    def _parents(self, node: Hashable):
+        for parent, data in self.graph.adj[node].items():
+            if data.get("type") == "isChildOf" and tree_traversal.is_active(data):
+                yield parent
+
+    def _children(self, node: Hashable):
+        for child, data in self.graph.pred[node].items():
+            if data.get("type") == "isChildOf" and tree_traversal.is_active(data):
+                yield child
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def add_person(self, node: Hashable) -> None:
+        self.rank.setdefault(node, 0)
+        self.height.setdefault(node, 0)
+
+    def remove_person(self, node: Hashable) -> None:
+        self.rank.pop(node, None)
+        self.height.pop(node, None)
+
+    def link(self, child: Hashable, parent: Hashable) -> None:
+        """Restore the label order after an active ``isChildOf`` from *child* to *parent* appeared."""
+        self.add_person(child)
+        self.add_person(parent)
+        if self.cyclic:
+            return
+        # Ranks: the child's descendants move down, unless a parent with no parents can just move up
+        if self.rank[parent] >= self.rank[child]:
+            if next(self._parents(parent), None) is None:
+                self.rank[parent] = self.rank[child] - 1
+            elif not self._push(self.rank, child, self.rank[parent] + 1, self._children):
+                self.cyclic = True
+                return
+        # Heights: the parent's ancestors move up, unless a child with no children can just move down
+        if self.height[child] >= self.height[parent]:
+            if next(self._children(child), None) is None:
+                self.height[child] = self.height[parent] - 1
+            elif not self._push(self.height, parent, self.height[child] + 1, self._parents):
+                self.cyclic = True
+
+    @staticmethod
+    def _push(labels, start, value, successors) -> bool:
+        """Raise *start* to *value* and its successors above it in turn; False if a cycle leads back to *start*."""
+        labels[start] = value
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for successor in successors(node):
+                if labels[successor] <= labels[node]:
+                    if successor == start:
+                        return False
+                    labels[successor] = labels[node] + 1
+                    queue.append(successor)
+        return True
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _between(self, node: Hashable, ancestor: Hashable) -> bool:
+        return self.cyclic or (self.rank[node] > self.rank[ancestor] and self.height[node] < self.height[ancestor])
+
+    def is_ancestor(self, ancestor: Hashable, person: Hashable) -> bool:
+        """Whether *ancestor* is reached from *person* through active ``isChildOf`` relationships."""
+        if ancestor == person or ancestor not in self.rank or person not in self.rank:
+            return False
+        if not self._between(person, ancestor):
+            return False
+        seen = {person}
+        stack = [person]
+        while stack:
+            for parent in self._parents(stack.pop()):
+                if parent == ancestor:
+                    return True
+                if parent not in seen and self._between(parent, ancestor):
+                    seen.add(parent)
+                    stack.append(parent)
+        return False
+
+    def would_create_cycle(self, child: Hashable, parent: Hashable) -> bool:
+        """Whether making *parent* a parent of *child* would make someone their own ancestor."""
+        return child == parent or self.is_ancestor(child, parent)
+
+
+class LineageIndex:
+    """Numbered ancestor and descendant closures, computed on first use and kept until a change affects them.
+
+    Ancestors are numbered the Ahnentafel way: the person is 1, the father of
+    *n* is ``2n`` and the mother ``2n + 1``.  Descendants get d'Aboville
+    numbers: the person is ``"1"`` and the children of ``"1.2"`` are
+    ``"1.2.1"``, ``"1.2.2"``, ... in order of birth.  Both walks are breadth
+    first, so a closure lists its members by generation and, within a
+    generation, by number.  With pedigree collapse a relative reached along
+    several lines keeps the lowest number only, and their own line is numbered
+    from it.
+
+    Each closure is kept as computed, to the deepest generation asked for, in
+    a bounded least-recently-used cache.  Mutations only drop the closures
+    they affect: a new or changed parent link of a child drops the ancestor
+    closures that contain the child, and the descendant closures that contain
+    the parent.
+    """
+
+    def __init__(self, graph: nx.DiGraph, capacity: int = 1024) -> None:
+        self.graph = graph
+        self.capacity = capacity
+        # (direction, person) -> (generations covered or None for all, members in order, member positions)
+        self._closures: OrderedDict[tuple[str, Hashable], tuple[int | None, list, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._closures)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def clear(self) -> None:
+        self._closures.clear()
+
+    def _drop(self, direction: str, person: Hashable) -> None:
+        stale = [
+            key for key, (_, _, positions) in self._closures.items()
+            if key[0] == direction and (key[1] == person or person in positions)
+        ]
+        for key in stale:
+            del self._closures[key]
+
+    def touch_person(self, person: Hashable) -> None:
+        """Drop every closure that *person* belongs to or is the root of."""
+        self._drop("ancestors", person)
+        self._drop("descendants", person)
+
+    def touch_link(self, child: Hashable, parent: Hashable) -> None:
+        """Drop the closures affected by a parent link from *child* to *parent* appearing, changing or going."""
+        self._drop("ancestors", child)
+        self._drop("descendants", parent)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def ancestors(self, person: Hashable, max_generations: int | None = None) -> list[tuple[Hashable, int, int]]:
+        """``(id, generation, Ahnentafel number)`` of *person* and their ancestors, up to *max_generations*."""
+        return self._closure("ancestors", person, max_generations)
+
+    def descendants(self, person: Hashable, max_generations: int | None = None) -> list[tuple[Hashable, int, str]]:
+        """``(id, generation, d'Aboville number)`` of *person* and their descendants, up to *max_generations*."""
+        return self._closure("descendants", person, max_generations)
+
+    def _closure(self, direction: str, person: Hashable, max_generations: int | None) -> list:
+        key = (direction, person)
+        cached = self._closures.get(key)
+        if cached is not None and (cached[0] is None or (max_generations is not None and max_generations <= cached[0])):
+            self._closures.move_to_end(key)
+            members = cached[1]
+        else:
+            walk = self._walk_ancestors if direction == "ancestors" else self._walk_descendants
+            members = walk(person, max_generations)
+            self._closures[key] = (max_generations, members, {member[0]: i for i, member in enumerate(members)})
+            if len(self._closures) > self.capacity:
+                self._closures.popitem(last=False)
+        if max_generations is None:
+            return list(members)
+        return members[: bisect_right(members, max_generations, key=lambda member: member[1])]
+
+    def _walk_ancestors(self, person: Hashable, max_generations: int | None) -> list[tuple[Hashable, int, int]]:
+        members = [(person, 0, 1)]
+        seen = {person}
+        for node, generation, number in members:
+            if max_generations is not None and generation >= max_generations:
+                break
+            for slot, parent in enumerate(self._parent_slots(node)):
+                if parent is not None and parent not in seen:
+                    seen.add(parent)
+                    members.append((parent, generation + 1, 2 * number + slot))
+        return members
+
+    def _walk_descendants(self, person: Hashable, max_generations: int | None) -> list[tuple[Hashable, int, str]]:
+        members = [(person, 0, "1")]
+        seen = {person}
+        for node, generation, number in members:
+            if max_generations is not None and generation >= max_generations:
+                break
+            for position, child in enumerate(self._birth_order(node), start=1):
+                if child not in seen:
+                    seen.add(child)
+                    members.append((child, generation + 1, f"{number}.{position}"))
+        return members
+
+    def _parent_slots(self, node: Hashable) -> list[Hashable]:
+        """The father and mother of *node*; parents of unknown gender fill the free slots in stored order.
+
+        Ahnentafel numbering has room for two parents, so any further ones are left out.
+        """
+        slots: list[Any] = [None, None]
+        unknown = []
+        for parent in tree_traversal.parents(self.graph, node, active_only=True):
+            slot = _PARENT_SLOTS.get(str(self.graph.nodes[parent].get("gender") or "").lower())
+            if slot is not None and slots[slot] is None:
+                slots[slot] = parent
+            else:
+                unknown.append(parent)
+        for slot in (0, 1):
+            if slots[slot] is None and unknown:
+                slots[slot] = unknown.pop(0)
+        return slots
+
+    def _birth_order(self, node: Hashable) -> list[Hashable]:
+        """Children of *node* by birth date; those without one follow in stored order."""
+        children = tree_traversal.children(self.graph, node, active_only=True)
+        birthdates = [str(self.graph.nodes[child].get("birthdate") or "") for child in children]
+        order = sorted(range(len(children)), key=lambda i: (not birthdates[i], birthdates[i]))
+        return [children[i] for i in order]
+
+
+class LineageCounts:
+    """Number of ancestors and descendants, and generations below, of every person.
+
+    Counts are over active ``isChildOf`` relationships and count every
+    relative once, however many lines lead to them.  They are built in one
+    topological pass that keeps each person's descendants (and ancestors) as
+    a bitset only until all of their parents (children) have used it, and
+    then kept up to date relationship by relationship: a new or removed
+    parent link from a child to a parent only changes the counts of the pairs
+    formed by the parent with their ancestors on one side and the child with
+    their descendants on the other, and only the pairs that are not related
+    through another line.  When checking them would take more than
+    *max_pairs* steps, counting the pairs and the relatives searched to rule
+    them out, the counts are rebuilt on next use instead.
+    """
+
+    def __init__(self, graph: nx.DiGraph, max_pairs: int = 1_000_000) -> None:
+        self.graph = graph
+        self.max_pairs = max_pairs
+        self.ancestors: dict[Hashable, int] = {}
+        self.descendants: dict[Hashable, int] = {}
+        self.below: dict[Hashable, int] = {}
+        self.stale = True
+
+    def _parents(self, node: Hashable, skip: tuple | None = None):
+        for parent, data in self.graph.adj[node].items():
+            if data.get("type") == "isChildOf" and tree_traversal.is_active(data) and (node, parent) != skip:
+                yield parent
+
+    def _children(self, node: Hashable, skip: tuple | None = None):
+        for child, data in self.graph.pred[node].items():
+            if data.get("type") == "isChildOf" and tree_traversal.is_active(data) and (child, node) != skip:
+                yield child
+
+    def _closure(self, start: Hashable, step, skip: tuple | None = None, limit: int | None = None) -> set[Hashable] | None:
+        """Everyone reached from *start*, or ``None`` as soon as that is more than *limit* people."""
+        seen = {start}
+        stack = [start]
+        while stack:
+            for relative in step(stack.pop(), skip):
+                if relative not in seen:
+                    seen.add(relative)
+                    if limit is not None and len(seen) > limit:
+                        return None
+                    stack.append(relative)
+        return seen
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def counts(self, node: Hashable) -> dict[str, int]:
+        if self.stale:
+            self.rebuild()
+        return {
+            "ancestor_count": self.ancestors.get(node, 0),
+            "descendant_count": self.descendants.get(node, 0),
+            "generations_below": self.below.get(node, 0),
+        }
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def rebuild(self) -> None:
+        parent_lists: dict[Hashable, list[Hashable]] = {node: [] for node in self.graph}
+        child_lists: dict[Hashable, list[Hashable]] = {node: [] for node in self.graph}
+        for child, parent, data in self.graph.edges(data=True):
+            if data.get("type") == "isChildOf" and tree_traversal.is_active(data):
+                parent_lists[child].append(parent)
+                child_lists[parent].append(child)
+        pending = {node: len(node_parents) for node, node_parents in parent_lists.items()}
+        order = [node for node, count in pending.items() if count == 0]
+        for node in order:
+            for child in child_lists[node]:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    order.append(child)
+        if len(order) < len(parent_lists):
+            ordered = set(order)
+            order.extend(node for node in parent_lists if node not in ordered)
+        position = {node: i for i, node in enumerate(order)}
+        self.ancestors = self._sweep(order, parent_lists, child_lists, position)
+        self.descendants = self._sweep(order[::-1], child_lists, parent_lists, position)
+        self.below = {}
+        for node in reversed(order):
+            self.below[node] = 1 + max((self.below[child] for child in child_lists[node] if child in self.below), default=-1)
+        self.stale = False
+
+    @staticmethod
+    def _sweep(order, sources, consumers, position) -> dict[Hashable, int]:
+        """Count everyone reached through *sources*, visiting each person after their sources.
+
+        A person's bitset is dropped as soon as every consumer has merged it,
+        so only the bitsets of about one generation are held at a time.  Bit
+        *position[person]* stands for each person.
+        """
+        bits: dict[Hashable, int] = {}
+        waiting = {node: len(consumers[node]) for node in order}
+        counts = {}
+        for node in order:
+            reached = 0
+            for source in sources[node]:
+                if source in bits:
+                    reached |= bits[source] | 1 << position[source]
+                    waiting[source] -= 1
+                    if waiting[source] == 0:
+                        del bits[source]
+            counts[node] = reached.bit_count()
+            if waiting[node]:
+                bits[node] = reached
+        return counts
+
+    def add_person(self, node: Hashable) -> None:
+        if not self.stale:
+            self.ancestors.setdefault(node, 0)
+            self.descendants.setdefault(node, 0)
+            self.below.setdefault(node, 0)
+
+    def remove_person(self, node: Hashable) -> None:
+        """Forget a removed person; if they had relatives, the counts of those are rebuilt on next use."""
+        if self.stale:
+            return
+        if self.ancestors.get(node) or self.descendants.get(node):
+            self.stale = True
+            return
+        self.ancestors.pop(node, None)
+        self.descendants.pop(node, None)
+        self.below.pop(node, None)
+
+    def link(self, child: Hashable, parent: Hashable) -> None:
+        """Count a parent link from *child* to *parent* that just became active."""
+        if self.stale:
+            return
+        self.add_person(child)
+        self.add_person(parent)
+        if self._relink(child, parent, 1):
+            # Generations below only grow, from the parent upwards
+            self.below[parent] = max(self.below[parent], self.below[child] + 1)
+            stack = [parent]
+            while stack:
+                node = stack.pop()
+                for grandparent in self._parents(node):
+                    if self.below[grandparent] < self.below[node] + 1:
+                        self.below[grandparent] = self.below[node] + 1
+                        stack.append(grandparent)
+
+    def unlink(self, child: Hashable, parent: Hashable) -> None:
+        """Uncount a parent link from *child* to *parent* that was just removed or deactivated."""
+        if self.stale:
+            return
+        above = self._relink(child, parent, -1)
+        if above:
+            # Generations below can only shrink for the parent and their ancestors, recomputed children first
+            pending = {node: sum(1 for c in self._children(node) if c in above) for node in above}
+            ready = [node for node, count in pending.items() if count == 0]
+            while ready:
+                node = ready.pop()
+                self.below[node] = 1 + max((self.below[c] for c in self._children(node)), default=-1)
+                for grandparent in self._parents(node):
+                    if grandparent in pending:
+                        pending[grandparent] -= 1
+                        if pending[grandparent] == 0:
+                            ready.append(grandparent)
+
+    def _relink(self, child: Hashable, parent: Hashable, sign: int) -> set[Hashable] | None:
+        """Add *sign* to the counts of the pairs related only through the link; returns the parent's side.
+
+        Ancestors are taken through the parent and descendants through the
+        child without following the link itself, so this works whether it was
+        just added or just removed.  Returns ``None`` and marks the counts
+        stale once the pairs and the searches checking them exceed
+        *max_pairs* steps; the counts changed so far are then rebuilt anyway.
+        """
+        skip = (child, parent)
+        above = self._closure(parent, self._parents, limit=self.max_pairs)
+        below = self._closure(child, self._children, limit=self.max_pairs)
+        budget = None if above is None or below is None else self.max_pairs - len(above) * len(below)
+        if budget is None or budget < 0:
+            self.stale = True
+            return None
+        # Check each pair from the smaller side, whose own relatives are searched without the link
+        if len(below) <= len(above):
+            for descendant in below:
+                related = self._closure(descendant, self._parents, skip, budget)
+                if related is None:
+                    self.stale = True
+                    return None
+                budget -= len(related)
+                gained = [ancestor for ancestor in above if ancestor not in related]
+                self.ancestors[descendant] += sign * len(gained)
+                for ancestor in gained:
+                    self.descendants[ancestor] += sign
+        else:
+            for ancestor in above:
+                related = self._closure(ancestor, self._children, skip, budget)
+                if related is None:
+                    self.stale = True
+                    return None
+                budget -= len(related)
+                gained = [descendant for descendant in below if descendant not in related]
+                self.descendants[ancestor] += sign * len(gained)
+                for descendant in gained:
+                    self.ancestors[descendant] += sign
+        return above
@@ -0,0 +1,283 @@
+"""Blood relationships between persons of a family tree.
+
+Two persons are related by blood when they share an ancestor through active
+``isChildOf`` relationships.  The relationship is named from the number of
+generations each of them is below their nearest common ancestor, e.g. ``(2,
+3)`` is a first cousin once removed.  Parents are shared by couples, so a
+tree of persons with two parents each has no single lowest common ancestor:
+the nearest common ancestors are found with a breadth-first search upwards
+from both persons at once, which stops as soon as no closer ancestor can
+remain.  Its cost depends on how distant the relationship is, not on the
+size of the tree.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Hashable, Iterator
+
+import networkx as nx
+
+import tree_traversal
+
+
+_COUSIN_DEGREES = ["first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth", "ninth", "tenth"]
+_REMOVED = {1: "once removed", 2: "twice removed"}
+
+# Words for each kind of relative by gender, the last one is used when the gender is unknown
+_WORDS = {
+    "parent": ("father", "mother", "parent"),
+    "child": ("son", "daughter", "child"),
+    "sibling": ("brother", "sister", "sibling"),
+    "spouse": ("husband", "wife", "spouse"),
+    "pibling": ("uncle", "aunt", None),
+    "nibling": ("nephew", "niece", None),
+}
+
+
+def _word(kind: str, gender: str | None, prefix: str = "", suffix: str = "") -> str:
+    male, female, neutral = _WORDS[kind]
+    gender = str(gender or "").lower()
+    if gender == "male":
+        return prefix + male + suffix
+    if gender == "female":
+        return prefix + female + suffix
+    if neutral is None:
+        return f"{prefix}{female}{suffix} or {prefix}{male}{suffix}"
+    return prefix + neutral + suffix
+
+
+def _ordinal(n: int) -> str:
+    suffix = "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+def _greats(n: int) -> str:
+    """Prefix for *n* further generations: "", "great-", "2nd great-", ..."""
+    if n <= 0:
+        return ""
+    if n == 1:
+        return "great-"
+    return f"{_ordinal(n)} great-"
+
+
+def kinship_label(up: int, down: int, gender: str | None = None, half: bool = False) -> str:
+    """Name the relative who is *down* generations below the common ancestor of someone *up* generations below it.
+
+    The label says what the relative is to that someone, in the relative's
+    *gender* (``"male"``, ``"female"`` or unknown); *half* marks relatives
+    through only one of two parents.
+    """
+    half_prefix = "half-" if half else ""
+    if up == 0 and down == 0:
+        return "self"
+    if up == 0:
+        return _word("child", gender, _greats(down - 2) + ("grand" if down >= 2 else ""))
+    if down == 0:
+        return _word("parent", gender, _greats(up - 2) + ("grand" if up >= 2 else ""))
+    if up == 1 and down == 1:
+        return _word("sibling", gender, half_prefix)
+    if up == 1:
+        return _word("nibling", gender, half_prefix + _greats(down - 2))
+    if down == 1:
+        return _word("pibling", gender, half_prefix + _greats(up - 2))
+    degree = min(up, down) - 1
+    removed = abs(up - down)
+    label = half_prefix + (_COUSIN_DEGREES[degree - 1] if degree <= len(_COUSIN_DEGREES) else _ordinal(degree))
+    label += " cousin"
+    if removed:
+        label += " " + _REMOVED.get(removed, f"{removed} times removed")
+    return label
+
+
+def _is_half(left_parents: set | None, right_parents: set | None) -> bool:
+    """Whether two children of the same ancestor, with these parents, share only one of them."""
+    if left_parents is None or right_parents is None:
+        return False
+    return bool(left_parents & right_parents) and bool(left_parents - right_parents) and bool(right_parents - left_parents)
+
+
+def _spouse_of_relative_label(up: int, down: int, relative_label: str, gender: str | None) -> str:
+    if (up, down) == (0, 0):
+        return _word("spouse", gender)
+    if (up, down) == (1, 0):
+        return _word("parent", gender, "step")
+    if (up, down) == (0, 1):
+        return _word("child", gender, suffix="-in-law")
+    if (up, down) == (1, 1):
+        return _word("sibling", gender, suffix="-in-law")
+    return f"{relative_label}'s {_word('spouse', gender)}"
+
+
+def _relative_of_spouse_label(up: int, down: int, gender: str | None, half: bool) -> str:
+    if (up, down) == (1, 0):
+        return _word("parent", gender, suffix="-in-law")
+    if (up, down) == (0, 1):
+        return _word("child", gender, "step")
+    if (up, down) == (1, 1):
+        return _word("sibling", gender, suffix="-in-law")
+    return f"spouse's {kinship_label(up, down, gender, half)}"
+
+
+def kinship_table(graph: nx.DiGraph, root: Hashable) -> Iterator[tuple[Hashable, str, int]]:
+    """Yield ``(person, kinship label, generation offset)`` for everyone related to *root*, nearest first.
+
+    One breadth-first walk over active parent, child and spouse relationships
+    labels blood relatives with :func:`kinship_label`, then the spouses of
+    blood relatives ("son-in-law", "stepmother", "first cousin's wife") and
+    the blood relatives of *root*'s spouses ("father-in-law", "stepson").
+    Blood relatives walk up through parents and then down through children
+    only, so every person is labelled from a nearest common ancestor.  Each
+    person is yielded once, with the first label found; generation offsets
+    are negative above *root* and positive below, as generation levels are.
+    """
+    labelled = {root}
+    yield root, "self", 0
+    parent_sets: dict[Hashable, set] = {}
+    # Spouses of blood relatives (spouse, up, down, relative's label), labelled once the blood relatives are done
+    in_law: deque = deque()
+
+    def gender(person):
+        return graph.nodes[person].get("gender")
+
+    def walk(start, label_relative, expanded, spouses=None):
+        """Walk up and then down from *start*, yielding each newly reached relative labelled by *label_relative*.
+
+        Queue entries are (person, generations up, generations down, child of
+        the common ancestor on each side, label if this entry labelled them).
+        *expanded* holds the (person, walking up) states not to walk again,
+        and the spouses of labelled relatives are added to *spouses*.
+        """
+        queue = deque([(start, 0, 0, None, None, "self")])
+        expanded.add((start, True))
+        while queue:
+            node, up, down, left, right, label = queue.popleft()
+            # One pass over the relationships of the person: -1 is a parent, 1 a child and 0 a spouse
+            hops = list(tree_traversal.typed_neighbors(graph, node, tree_traversal.GENERATION_STEPS, True))
+            parent_sets.setdefault(node, {neighbor for neighbor, step in hops if step == -1})
+            if label is not None and spouses is not None:
+                spouses.extend((neighbor, up, down, label) for neighbor, step in hops if step == 0)
+            for neighbor, step in hops:
+                if step == -1 and down == 0:
+                    state = (neighbor, up + 1, 0, node, None)
+                elif step == 1:
+                    state = (neighbor, up, down + 1, left, neighbor if down == 0 else right)
+                else:
+                    continue
+                key = (neighbor, state[2] == 0)
+                if key in expanded:
+                    continue
+                expanded.add(key)
+                if neighbor in labelled:
+                    queue.append((*state, None))
+                    continue
+                labelled.add(neighbor)
+                entry = label_relative(*state)
+                queue.append((*state, entry[1]))
+                yield entry
+
+    def is_half(left, right):
+        for child in (left, right):
+            if child is not None and child not in parent_sets:
+                parent_sets[child] = set(tree_traversal.parents(graph, child, True))
+        return _is_half(parent_sets.get(left), parent_sets.get(right))
+
+    def blood_relative(relative, up, down, left, right):
+        return relative, kinship_label(up, down, gender(relative), is_half(left, right)), down - up
+
+    def relative_of_spouse(relative, up, down, left, right):
+        return relative, _relative_of_spouse_label(up, down, gender(relative), is_half(left, right)), down - up
+
+    blood_expanded: set = set()
+    yield from walk(root, blood_relative, blood_expanded, in_law)
+    root_spouses = []
+    while in_law:
+        spouse, up, down, relative_label = in_law.popleft()
+        if (up, down) == (0, 0):
+            root_spouses.append(spouse)
+        if spouse not in labelled:
+            labelled.add(spouse)
+            yield spouse, _spouse_of_relative_label(up, down, relative_label, gender(spouse)), down - up
+    # Everyone reached from a state the blood walk expanded is labelled already
+    for spouse in dict.fromkeys(root_spouses):
+        yield from walk(spouse, relative_of_spouse, set(blood_expanded))
+
+
+def nearest_common_ancestors(
+    graph: nx.DiGraph, a: Hashable, b: Hashable
+) -> tuple[list[Hashable], list[Hashable]]:
+    """The common ancestors of *a* and *b* with the fewest generations between them, and a path through one.
+
+    Persons count as their own ancestors, so if *b* descends from *a* the
+    result is ``[a]``.  The path runs from *a* up to the first common ancestor
+    listed and down to *b*.  Both lists are empty when *a* and *b* are not
+    related by blood.
+    """
+    depths = ({a: 0}, {b: 0})
+    via: tuple[dict[Hashable, Any], dict[Hashable, Any]] = ({a: None}, {b: None})
+    frontiers = [[a], [b]]
+    levels = [0, 0]
+    meetings = {a: (0, 0)} if a == b else {}
+    best = 0 if meetings else None
+    while True:
+        # A common ancestor found later is first reached by a side below its current level
+        open_sides = [side for side in (0, 1) if frontiers[side]]
+        if not open_sides:
+            break
+        side = min(open_sides, key=lambda s: (levels[s], len(frontiers[s])))
+        if best is not None and min(levels[s] for s in open_sides) + 1 > best:
+            break
+        levels[side] += 1
+        next_frontier = []
+        for node in frontiers[side]:
+            for parent in tree_traversal.parents(graph, node, active_only=True):
+                if parent in depths[side]:
+                    continue
+                depths[side][parent] = levels[side]
+                via[side][parent] = node
+                next_frontier.append(parent)
+                if parent in depths[1 - side]:
+                    meeting = (depths[0][parent], depths[1][parent])
+                    meetings[parent] = meeting
+                    if best is None or sum(meeting) < best:
+                        best = sum(meeting)
+        frontiers[side] = next_frontier
+    if not meetings:
+        return [], []
+    first = min(meetings, key=lambda node: sum(meetings[node]))
+    nearest = [first] + [node for node, meeting in meetings.items() if meeting == meetings[first] and node != first]
+    up = [first]
+    while via[0][up[-1]] is not None:
+        up.append(via[0][up[-1]])
+    down = [first]
+    while via[1][down[-1]] is not None:
+        down.append(via[1][down[-1]])
+    return nearest, up[::-1] + down[1:]
+
+
+def relationship_between(graph: nx.DiGraph, a: Hashable, b: Hashable) -> dict[str, Any]:
+    """What *b* is to *a*: the kinship label, generations below the nearest common ancestors, and a witness path.
+
+    Persons who are not related by blood are labelled as spouses when they are
+    married, and ``None`` otherwise.
+    """
+    common, path = nearest_common_ancestors(graph, a, b)
+    gender = graph.nodes[b].get("gender")
+    if not common:
+        if b in tree_traversal.spouses(graph, a, active_only=True):
+            return {"relationship": _word("spouse", gender), "generations": None, "common_ancestors": [], "path": [a, b]}
+        return {"relationship": None, "generations": None, "common_ancestors": [], "path": []}
+    up = path.index(common[0])
+    down = len(path) - 1 - up
+    half = False
+    if up and down:
+        # Half relatives descend from different children of the ancestor, who share just one parent
+        left = set(tree_traversal.parents(graph, path[up - 1], active_only=True))
+        right = set(tree_traversal.parents(graph, path[up + 1], active_only=True))
+        half = _is_half(left, right)
+    return {
+        "relationship": kinship_label(up, down, gender, half),
+        "generations": [up, down],
+        "common_ancestors": common,
+        "path": path,
+    }
@@ -0,0 +1,304 @@
+"""Versioned binary snapshot format for family-tree graphs.
+
+A snapshot is a short header followed by length-prefixed sections::
+
+    b"FTSNAP" | u16 version | (u32 length | payload) * 8
+
+Sections, in order: header JSON (graph attributes and counts), the string
+table of node ids, per-node attribute dicts, edge sources and targets as
+little-endian uint32 indexes into the string table, per-edge attribute
+dicts, and the details of each person with the uint32 byte offsets of each
+person's entry.  JSON sections decode in C and the topology is plain integer
+arrays, which makes loading an order of magnitude faster than
+``nx.read_gml``.  Snapshots are written and read one section at a time
+(:func:`iter_dumps`, :func:`read_snapshot`), so only the section being
+encoded or decoded is held in memory alongside the graph.
+
+Node attribute dicts hold only the :data:`SUMMARY_FIELDS` that lists, search
+and the graph view use; the other attributes of a person, such as notes and
+pictures, are their details.  :func:`loads_topology` leaves the details
+unparsed until each person is first used (see :class:`Details`).  Version 1
+snapshots, which keep every attribute in the node dicts, still load.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+import sys
+from array import array
+from typing import Any, BinaryIO, Iterator
+
+import networkx as nx
+
+
+MAGIC = b"FTSNAP"
+VERSION = 2
+# Number of sections of each readable version
+_SECTIONS = {1: 6, 2: 8}
+SNAPSHOT_EXTENSION = ".ftsnap"
+
+_PREAMBLE = struct.Struct("<6sH")
+_LENGTH = struct.Struct("<I")
+
+# Person attributes kept in the node section: names, dates, the profile picture and the generation level
+SUMMARY_FIELDS = frozenset(
+    ("firstname", "lastname", "alias", "gender", "birthdate", "deathdate", "birthplace", "isAlive", "profilepic", "level")
+)
+_NO_DETAILS = b"{}"
+
+
+def format_for_path(path: str | None) -> str:
+    """Return ``"snapshot"`` for ``.ftsnap`` paths and ``"gml"`` otherwise."""
+    if path and path.lower().endswith(SNAPSHOT_EXTENSION):
+        return "snapshot"
+    return "gml"
+
+
+def is_snapshot(data: bytes) -> bool:
+    return data[: len(MAGIC)] == MAGIC
+
+
+def _json_bytes(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _index_bytes(values: list[int]) -> bytes:
+    column = array("I", values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+def _index_column(data: bytes) -> array:
+    column = array("I")
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+class Details:
+    """Details of the persons of a snapshot, kept as the JSON stored for each until first used.
+
+    Only persons with details are held.  :meth:`pop` parses and forgets the
+    details of a person; :meth:`raw` returns the stored JSON, which
+    :func:`dumps` copies as is for persons that were not used since loading.
+    """
+
+    def __init__(self, payload: bytes, bounds: array, ids: list[Any]) -> None:
+        self._payload = payload
+        self._bounds = bounds
+        # Each entry is followed by a separator, so an entry without details spans three bytes
+        self._positions = {
+            node: position for position, node in enumerate(ids) if bounds[position + 1] - bounds[position] > len(_NO_DETAILS) + 1
+        }
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, node: object) -> bool:
+        return node in self._positions
+
+    def __iter__(self):
+        return iter(list(self._positions))
+
+    def raw(self, node: Any) -> bytes:
+        position = self._positions[node]
+        return self._payload[self._bounds[position]:self._bounds[position + 1] - 1]
+
+    def pop(self, node: Any) -> dict[str, Any]:
+        """The details of *node*, parsed, or an empty dict if there are none; they are no longer held."""
+        if node not in self._positions:
+            return {}
+        details = json.loads(self.raw(node))
+        del self._positions[node]
+        return details
+
+
+def _sections(graph: nx.DiGraph, details: Details | None) -> Iterator[bytes]:
+    """The sections of the snapshot of *graph*, each built only once the previous one was consumed."""
+    ids = list(graph.nodes)
+    header = {
+        "graph": dict(graph.graph),
+        "directed": graph.is_directed(),
+        "nodes": len(ids),
+        "edges": graph.number_of_edges(),
+    }
+    yield _json_bytes(header)
+    yield _json_bytes(ids)
+    yield _json_bytes([{key: value for key, value in attrs.items() if key in SUMMARY_FIELDS} for _, attrs in graph.nodes(data=True)])
+    index = {node: position for position, node in enumerate(ids)}
+    yield _index_bytes([index[source] for source, _ in graph.edges()])
+    yield _index_bytes([index[target] for _, target in graph.edges()])
+    yield _json_bytes([data for _, _, data in graph.edges(data=True)])
+    del index
+    entries: list[bytes] = []
+    for node, attrs in graph.nodes(data=True):
+        extra = {key: value for key, value in attrs.items() if key not in SUMMARY_FIELDS}
+        if details is not None and node in details:
+            entries.append(_json_bytes({**json.loads(details.raw(node)), **extra}) if extra else details.raw(node))
+        else:
+            entries.append(_json_bytes(extra) if extra else _NO_DETAILS)
+    # The details are an array of entries; bounds holds the offset where each entry starts and the next would
+    bounds = [1]
+    for entry in entries:
+        bounds.append(bounds[-1] + len(entry) + 1)
+    payload = b"[" + b",".join(entries) + b"]"
+    del entries
+    yield payload
+    del payload
+    yield _index_bytes(bounds)
+
+
+def iter_dumps(graph: nx.DiGraph, details: Details | None = None) -> Iterator[bytes]:
+    """Serialize *graph* to snapshot bytes, yielding the preamble and each section in turn.
+
+    Only one section is held at a time, so writing a snapshot never needs the
+    whole payload in memory.  *details* holds the unparsed details of persons
+    of a graph loaded with :func:`loads_topology`, which are written without
+    parsing them.
+    """
+    yield _PREAMBLE.pack(MAGIC, VERSION)
+    for section in _sections(graph, details):
+        yield _LENGTH.pack(len(section))
+        yield section
+
+
+def dumps(graph: nx.DiGraph, details: Details | None = None) -> bytes:
+    """Serialize *graph* to snapshot bytes (see :func:`iter_dumps`)."""
+    return b"".join(iter_dumps(graph, details))
+
+
+def _check_preamble(preamble: bytes) -> int:
+    """The version of a snapshot starting with *preamble*."""
+    if len(preamble) < _PREAMBLE.size or not is_snapshot(preamble):
+        raise ValueError("Not a family tree snapshot")
+    _, version = _PREAMBLE.unpack_from(preamble, 0)
+    if version not in _SECTIONS:
+        raise ValueError(f"Unsupported snapshot version {version} (expected {VERSION})")
+    return version
+
+
+def _split_sections(data: bytes) -> tuple[int, Iterator[bytes]]:
+    version = _check_preamble(data)
+
+    def sections() -> Iterator[bytes]:
+        view = memoryview(data)
+        offset = _PREAMBLE.size
+        for _ in range(_SECTIONS[version]):
+            if offset + _LENGTH.size > len(data):
+                raise ValueError("Truncated family tree snapshot")
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size + length
+            if offset > len(data):
+                raise ValueError("Truncated family tree snapshot")
+            yield bytes(view[offset - length:offset])
+
+    return version, sections()
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) == size or not data:
+        return data
+    parts = [data]
+    received = len(data)
+    while received < size:
+        part = stream.read(size - received)
+        if not part:
+            break
+        parts.append(part)
+        received += len(part)
+    return b"".join(parts)
+
+
+def _read_sections(stream: BinaryIO) -> tuple[int, Iterator[bytes]]:
+    """Like :func:`_split_sections`, but each section is read from *stream* only when it is needed."""
+    version = _check_preamble(_read_exact(stream, _PREAMBLE.size))
+
+    def sections() -> Iterator[bytes]:
+        for _ in range(_SECTIONS[version]):
+            prefix = _read_exact(stream, _LENGTH.size)
+            if len(prefix) < _LENGTH.size:
+                raise ValueError("Truncated family tree snapshot")
+            (length,) = _LENGTH.unpack(prefix)
+            section = _read_exact(stream, length)
+            if len(section) < length:
+                raise ValueError("Truncated family tree snapshot")
+            yield section
+
+    return version, sections()
+
+
+def _parse(version: int, sections: Iterator[bytes], lazy: bool) -> tuple[nx.DiGraph, Details | None]:
+    """Build the graph from the *sections* of a snapshot, decoding each as soon as it is read."""
+    header = json.loads(next(sections))
+    ids = json.loads(next(sections))
+    node_attrs = json.loads(next(sections))
+    sources = _index_column(next(sections))
+    targets = _index_column(next(sections))
+    edge_attrs = json.loads(next(sections))
+    if len(node_attrs) != len(ids) or not len(sources) == len(targets) == len(edge_attrs):
+        raise ValueError("Corrupt family tree snapshot: section sizes do not match")
+
+    graph = nx.DiGraph() if header.get("directed", True) else nx.Graph()
+    graph.graph.update(header.get("graph", {}))
+    graph.add_nodes_from(zip(ids, node_attrs))
+    graph.add_edges_from(
+        (ids[source], ids[target], attrs)
+        for source, target, attrs in zip(sources, targets, edge_attrs)
+    )
+    del node_attrs, sources, targets, edge_attrs
+    details = None
+    if version >= 2:
+        payload = next(sections)
+        bounds = _index_column(next(sections))
+        if len(bounds) != len(ids) + 1 or bounds[-1] != len(payload):
+            raise ValueError("Corrupt family tree snapshot: section sizes do not match")
+        if lazy:
+            details = Details(payload, bounds, ids)
+        else:
+            for node, extra in zip(ids, json.loads(payload)):
+                if extra:
+                    graph.nodes[node].update(extra)
+    return graph, details
+
+
+def loads(data: bytes) -> nx.DiGraph:
+    """Rebuild a graph from snapshot bytes."""
+    return _parse(*_split_sections(data), lazy=False)[0]
+
+
+def loads_topology(data: bytes) -> tuple[nx.DiGraph, Details | None]:
+    """Rebuild a graph with only the summary fields of each person, and the unparsed :class:`Details` of each.
+
+    Version 1 snapshots have no separate details and are loaded in full, with ``None`` for the details.
+    """
+    return _parse(*_split_sections(data), lazy=True)
+
+
+def write_snapshot(graph: nx.DiGraph, target: str | BinaryIO, details: Details | None = None) -> None:
+    """Write *graph* to a path or binary file object, one section at a time."""
+    if isinstance(target, str):
+        with open(target, "wb") as handle:
+            write_snapshot(graph, handle, details)
+        return
+    for piece in iter_dumps(graph, details):
+        target.write(piece)
+
+
+def read_snapshot(source: str | BinaryIO) -> nx.DiGraph:
+    """Read a graph from a path or binary file object, one section at a time."""
+    if isinstance(source, str):
+        with open(source, "rb") as handle:
+            return read_snapshot(handle)
+    return _parse(*_read_sections(source), lazy=False)[0]
+
+
+def read_snapshot_topology(source: str | BinaryIO) -> tuple[nx.DiGraph, Details | None]:
+    """Like :func:`read_snapshot`, but see :func:`loads_topology`."""
+    if isinstance(source, str):
+        with open(source, "rb") as handle:
+            return read_snapshot_topology(handle)
+    return _parse(*_read_sections(source), lazy=True)
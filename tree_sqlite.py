@@ -0,0 +1,275 @@
+"""SQLite storage for family trees.
+
+Persons and relationships are stored one row per entity, so a mutation only
+touches the rows it affects.  As the ``backend='sqlite'`` of ``FamilyTree``
+that is all the store does: the tree is loaded whole and queried in memory.
+Used on its own, the store answers the queries that would otherwise need the
+whole networkx graph (subgraphs within N hops, ancestors, descendants and
+name search) as SQL, using recursive CTEs, and only the rows they return are
+materialised, so a tree that is too large to load can still be queried.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from typing import Any, Iterable
+
+import networkx as nx
+
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS persons (
+    id TEXT PRIMARY KEY,
+    firstname TEXT NOT NULL DEFAULT '',
+    lastname TEXT NOT NULL DEFAULT '',
+    attrs TEXT NOT NULL
+);
+DROP INDEX IF EXISTS persons_name;
+CREATE TABLE IF NOT EXISTS relationships (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT '',
+    is_active INTEGER NOT NULL DEFAULT 1,
+    attrs TEXT NOT NULL,
+    PRIMARY KEY (source, target)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS relationships_target ON relationships (target, source);
+CREATE INDEX IF NOT EXISTS relationships_type ON relationships (type, source);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Persons reachable within ?2 hops of ?1, following relationships in either direction
+_WITHIN_DEGREE = """
+WITH RECURSIVE reach(id, depth) AS (
+    SELECT ?1, 0
+    UNION
+    SELECT r.target, reach.depth + 1 FROM reach JOIN relationships r ON r.source = reach.id WHERE reach.depth < ?2
+    UNION
+    SELECT r.source, reach.depth + 1 FROM reach JOIN relationships r ON r.target = reach.id WHERE reach.depth < ?2
+)
+SELECT id, MIN(depth) FROM reach GROUP BY id
+"""
+
+# Active isChildOf edges walked upwards (ancestors) or downwards (descendants) from ?1, at most ?2 generations.
+# UNION only drops repeated (id, depth) rows, so ?2 must be given even without a limit for a cycle to end the walk.
+_ANCESTORS = """
+WITH RECURSIVE line(id, depth) AS (
+    SELECT ?1, 0
+    UNION
+    SELECT r.target, line.depth + 1 FROM line JOIN relationships r ON r.source = line.id
+    WHERE r.type = 'isChildOf' AND r.is_active AND line.depth < ?2
+)
+SELECT id, MIN(depth) FROM line WHERE id != ?1 GROUP BY id
+"""
+
+_DESCENDANTS = """
+WITH RECURSIVE line(id, depth) AS (
+    SELECT ?1, 0
+    UNION
+    SELECT r.source, line.depth + 1 FROM line JOIN relationships r ON r.target = line.id
+    WHERE r.type = 'isChildOf' AND r.is_active AND line.depth < ?2
+)
+SELECT id, MIN(depth) FROM line WHERE id != ?1 GROUP BY id
+"""
+
+
+def _dumps(attrs: dict[str, Any]) -> str:
+    return json.dumps(attrs, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _is_active(attrs: dict[str, Any]) -> int:
+    return 0 if attrs.get("is_active", True) in (False, 0) else 1
+
+
+def _casefold(value: Any) -> str | None:
+    return None if value is None else str(value).casefold()
+
+
+class SQLiteTreeStore:
+    """Row-per-entity tree storage in a SQLite database file.
+
+    Writes are made inside an implicit transaction and become durable on
+    :meth:`commit`; :meth:`rollback` discards them.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # SQLite folds case for ASCII only, names are matched and sorted like str.casefold() does in FamilyTree
+        self._conn.create_function("casefold", 1, _casefold, deterministic=True)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self) -> None:
+        with self._lock:
+            self._conn.rollback()
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def put_person(self, person_id: str, attrs: dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO persons (id, firstname, lastname, attrs) VALUES (?, ?, ?, ?)",
+                (
+                    person_id,
+                    str(attrs.get("firstname") or ""),
+                    str(attrs.get("lastname") or ""),
+                    _dumps(attrs),
+                ),
+            )
+
+    def delete_person(self, person_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM persons WHERE id = ?", (person_id,))
+            self._conn.execute(
+                "DELETE FROM relationships WHERE source = ? OR target = ?",
+                (person_id, person_id),
+            )
+
+    def put_relationship(self, source: str, target: str, attrs: dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO relationships (source, target, type, is_active, attrs) VALUES (?, ?, ?, ?, ?)",
+                (source, target, str(attrs.get("type") or ""), _is_active(attrs), _dumps(attrs)),
+            )
+
+    def delete_relationship(self, source: str, target: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM relationships WHERE source = ? AND target = ?",
+                (source, target),
+            )
+
+    def put_graph_attrs(self, attrs: dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('graph', ?)",
+                (_dumps(attrs),),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM persons")
+            self._conn.execute("DELETE FROM relationships")
+            self._conn.execute("DELETE FROM meta")
+
+    def replace_graph(self, graph: nx.DiGraph) -> None:
+        """Rewrite every row from *graph* (used for full checkpoints and imports)."""
+        with self._lock:
+            self.clear()
+            self.put_graph_attrs(dict(graph.graph))
+            for person_id, attrs in graph.nodes(data=True):
+                self.put_person(person_id, attrs)
+            for source, target, attrs in graph.edges(data=True):
+                self.put_relationship(source, target, attrs)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def person_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0]
+
+    def get_person(self, person_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute("SELECT attrs FROM persons WHERE id = ?", (person_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_graph(self) -> nx.DiGraph:
+        """Materialise the whole tree as a networkx graph."""
+        with self._lock:
+            graph = nx.DiGraph()
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'graph'").fetchone()
+            if row:
+                graph.graph.update(json.loads(row[0]))
+            graph.add_nodes_from(
+                (person_id, json.loads(attrs))
+                for person_id, attrs in self._conn.execute("SELECT id, attrs FROM persons")
+            )
+            # Rows return a new string per relationship end; use the person's own key so each id is stored once
+            keys = {node: node for node in graph}
+            graph.add_edges_from(
+                (keys.get(source, source), keys.get(target, target), json.loads(attrs))
+                for source, target, attrs in self._conn.execute("SELECT source, target, attrs FROM relationships")
+            )
+        return graph
+
+    def _subgraph(self, person_ids: Iterable[str]) -> nx.DiGraph:
+        """Build the induced subgraph of *person_ids* from the stored rows."""
+        selected = json.dumps(list(person_ids))
+        graph = nx.DiGraph()
+        with self._lock:
+            graph.add_nodes_from(
+                (person_id, json.loads(attrs))
+                for person_id, attrs in self._conn.execute(
+                    "SELECT p.id, p.attrs FROM json_each(?) s JOIN persons p ON p.id = s.value",
+                    (selected,),
+                )
+            )
+            graph.add_edges_from(
+                (source, target, json.loads(attrs))
+                for source, target, attrs in self._conn.execute(
+                    "SELECT r.source, r.target, r.attrs FROM json_each(?1) s "
+                    "JOIN relationships r ON r.source = s.value "
+                    "WHERE r.target IN (SELECT value FROM json_each(?1))",
+                    (selected,),
+                )
+            )
+        return graph
+
+    def within_degree(self, person_id: str, degree: int) -> dict[str, int]:
+        """Map every person within *degree* hops of *person_id* to its distance."""
+        with self._lock:
+            return dict(self._conn.execute(_WITHIN_DEGREE, (person_id, degree)).fetchall())
+
+    def subgraph_degrees(self, person_id: str, degree: int = 1) -> nx.DiGraph:
+        """Equivalent of ``FamilyTree.get_subgraph_degrees`` computed in SQL."""
+        return self._subgraph(self.within_degree(person_id, degree))
+
+    def _lineage(self, query: str, person_id: str, max_depth: int | None) -> dict[str, int]:
+        with self._lock:
+            # No line without a cycle is longer than the number of persons, so that bounds a walk around one.
+            # The largest rowid is at least that number and, unlike COUNT(*), is read without a scan.
+            if max_depth is None:
+                max_depth = self._conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM persons").fetchone()[0]
+            return dict(self._conn.execute(query, (person_id, max_depth)).fetchall())
+
+    def ancestors(self, person_id: str, max_depth: int | None = None) -> dict[str, int]:
+        """Map every ancestor of *person_id* to its generation distance (parents are 1)."""
+        return self._lineage(_ANCESTORS, person_id, max_depth)
+
+    def descendants(self, person_id: str, max_depth: int | None = None) -> dict[str, int]:
+        """Map every descendant of *person_id* to its generation distance (children are 1)."""
+        return self._lineage(_DESCENDANTS, person_id, max_depth)
+
+    def search(self, query: str, limit: int | None = None) -> list[str]:
+        """Return ids of persons whose full name contains *query* (case-insensitive), like ``FamilyTree.search_persons``."""
+        sql = (
+            "SELECT id FROM persons WHERE instr(casefold(trim(firstname || ' ' || lastname)), ?) > 0 "
+            "ORDER BY casefold(lastname), casefold(firstname), id"
+        )
+        params: tuple[Any, ...] = (query.strip().casefold(),)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, params)]
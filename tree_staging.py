@@ -0,0 +1,209 @@
+"""Copy-on-write staging of tree changes for validation.
+
+``StagedGraph`` layers pending persons and relationships over a live
+networkx graph without copying it.  It implements the read-only part of the
+``nx.DiGraph`` interface that the validators use (membership, ``nodes``,
+``has_edge``, ``graph[u][v]``, ``edges``, ``in_edges``/``out_edges``), so
+``validate_relationship`` and ``validate_person_relationships`` can check a
+proposed change against the tree as it would be after the change.  Staging
+costs O(changes); :meth:`StagedGraph.commit` applies the staged changes to a
+``FamilyTree`` in one transaction.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+from typing import Any, Iterator
+
+import networkx as nx
+
+
+class _NodeView(Mapping):
+    def __init__(self, staged: "StagedGraph") -> None:
+        self._staged = staged
+
+    def __getitem__(self, node: str) -> dict[str, Any]:
+        if node in self._staged._nodes:
+            return self._staged._nodes[node]
+        return self._staged.base.nodes[node]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._staged.base.nodes
+        for node in self._staged._nodes:
+            if node not in self._staged.base:
+                yield node
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, node: object) -> bool:
+        return node in self._staged._nodes or node in self._staged.base
+
+    def __call__(self, data: bool = False):
+        if data:
+            return ((node, self[node]) for node in self)
+        return iter(self)
+
+
+class _AdjacencyView(Mapping):
+    """Successors of one node with their edge attributes."""
+
+    def __init__(self, staged: "StagedGraph", node: str) -> None:
+        self._staged = staged
+        self._node = node
+
+    def _base(self) -> Mapping:
+        base = self._staged.base
+        return base.adj[self._node] if self._node in base else {}
+
+    def __getitem__(self, target: str) -> dict[str, Any]:
+        key = (self._node, target)
+        if key in self._staged._edges:
+            return self._staged._edges[key]
+        return self._base()[target]
+
+    def __iter__(self) -> Iterator[str]:
+        base = self._base()
+        yield from base
+        for target in self._staged._successors.get(self._node, ()):
+            if target not in base:
+                yield target
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class StagedGraph:
+    """Pending persons and relationships layered over *base* without copying it."""
+
+    def __init__(self, base: nx.DiGraph) -> None:
+        self.base = base
+        self._nodes: dict[str, dict[str, Any]] = {}
+        self._node_changes: dict[str, dict[str, Any]] = {}
+        self._edges: dict[tuple[str, str], dict[str, Any]] = {}
+        self._successors: dict[str, list[str]] = {}
+        self._predecessors: dict[str, list[str]] = {}
+
+    # ------------------------------------------------------------------
+    # Staging
+    # ------------------------------------------------------------------
+
+    def add_node(self, node: str, **attrs: Any) -> None:
+        if node not in self._nodes:
+            self._nodes[node] = dict(self.base.nodes[node]) if node in self.base else {}
+            self._node_changes[node] = {}
+        self._nodes[node].update(attrs)
+        self._node_changes[node].update(attrs)
+
+    def add_edge(self, source: str, target: str, **attrs: Any) -> None:
+        for node in (source, target):
+            if node not in self:
+                self.add_node(node)
+        key = (source, target)
+        if key not in self._edges:
+            current = dict(self.base[source][target]) if self.base.has_edge(source, target) else {}
+            self._successors.setdefault(source, []).append(target)
+            self._predecessors.setdefault(target, []).append(source)
+            self._edges[key] = current
+        self._edges[key].update(attrs)
+
+    @property
+    def staged_nodes(self) -> dict[str, dict[str, Any]]:
+        """Attributes set on each staged person (not including unchanged ones)."""
+        return self._node_changes
+
+    @property
+    def staged_edges(self) -> dict[tuple[str, str], dict[str, Any]]:
+        return self._edges
+
+    def commit(self, tree) -> None:
+        """Add the staged persons and relationships to *tree* atomically.
+
+        The tree's public mutation methods are used so that the usual defaults
+        and schema handling apply; validation warnings are assumed to have been
+        accepted while staging.
+        """
+        autosave = tree.autosave
+        tree.autosave = False
+        try:
+            with tree.transaction():
+                for node, attrs in self._node_changes.items():
+                    if node not in tree.graph:
+                        tree.add_person(id=node, override_warnings=True, **attrs)
+                    elif attrs:
+                        tree.update_person(node, override_warnings=True, **attrs)
+                for (source, target), attrs in self._edges.items():
+                    attrs = dict(attrs)
+                    tree.add_relationship(
+                        source,
+                        target,
+                        type=attrs.pop("type"),
+                        start_date=attrs.pop("start_date", None),
+                        override_warnings=True,
+                        **attrs,
+                    )
+        finally:
+            tree.autosave = autosave
+        if autosave:
+            tree.save()
+
+    # ------------------------------------------------------------------
+    # Read-only DiGraph interface
+    # ------------------------------------------------------------------
+
+    @property
+    def nodes(self) -> _NodeView:
+        return _NodeView(self)
+
+    def __contains__(self, node: object) -> bool:
+        return node in self._nodes or node in self.base
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.nodes)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __getitem__(self, node: str) -> _AdjacencyView:
+        if node not in self:
+            raise KeyError(node)
+        return _AdjacencyView(self, node)
+
+    @property
+    def adj(self) -> "StagedGraph":
+        return self
+
+    def has_node(self, node: str) -> bool:
+        return node in self
+
+    def has_edge(self, source: str, target: str) -> bool:
+        return (source, target) in self._edges or self.base.has_edge(source, target)
+
+    def is_directed(self) -> bool:
+        return True
+
+    def successors(self, node: str) -> Iterator[str]:
+        return iter(self[node])
+
+    def predecessors(self, node: str) -> Iterator[str]:
+        if node in self.base:
+            yield from self.base.pred[node]
+        for source in self._predecessors.get(node, ()):
+            if not self.base.has_edge(source, node):
+                yield source
+
+    def out_edges(self, node: str, data: bool = False):
+        for target in self.successors(node):
+            yield (node, target, self[node][target]) if data else (node, target)
+
+    def in_edges(self, node: str, data: bool = False):
+        for source in self.predecessors(node):
+            yield (source, node, self[source][node]) if data else (source, node)
+
+    def edges(self, data: bool = False):
+        for source, target in self.base.edges():
+            attrs = self._edges.get((source, target), self.base[source][target])
+            yield (source, target, attrs) if data else (source, target)
+        for (source, target), attrs in self._edges.items():
+            if not self.base.has_edge(source, target):
+                yield (source, target, attrs) if data else (source, target)
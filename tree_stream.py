@@ -0,0 +1,182 @@
+"""Streaming (de)serialization of family-tree graphs for blob transfers.
+
+Graphs are serialized to an iterator of byte chunks and parsed from any
+binary stream, so a blob can be uploaded or downloaded without staging the
+whole payload in a temporary file.  GML is produced and parsed line by
+line; snapshots one section at a time (see ``tree_snapshot.iter_dumps``),
+so the largest section, not the whole payload, bounds the memory used
+besides the graph itself.  The stored bytes may optionally be
+compressed with gzip or zstd; the encoding is recognised from the magic
+bytes when reading, so plain, gzip and zstd blobs can be loaded alike.
+zstd support requires the optional ``zstandard`` package.
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import zlib
+from typing import BinaryIO, Iterable, Iterator
+
+import networkx as nx
+
+import tree_snapshot
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+
+ENCODINGS = ("gzip", "zstd")
+CHUNK_SIZE = 4 * 1024 * 1024
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def _require_zstd() -> None:
+    if zstandard is None:
+        raise ValueError("zstd content encoding requires the 'zstandard' package")
+
+
+def check_encoding(encoding: str | None) -> None:
+    if encoding is not None and encoding not in ENCODINGS:
+        raise ValueError(f"Invalid content encoding '{encoding}', valid encodings are: {', '.join(ENCODINGS)}")
+    if encoding == "zstd":
+        _require_zstd()
+
+
+def _batched(pieces: Iterable[bytes], size: int) -> Iterator[bytes]:
+    """Join small pieces into chunks of roughly *size* bytes."""
+    buffer: list[bytes] = []
+    buffered = 0
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _serialized_pieces(
+    graph: nx.DiGraph, storage_format: str, details: tree_snapshot.Details | None = None
+) -> Iterator[bytes]:
+    if storage_format == "snapshot":
+        # One section at a time; sections larger than a chunk are split
+        for piece in tree_snapshot.iter_dumps(graph, details):
+            if len(piece) <= CHUNK_SIZE:
+                yield piece
+                continue
+            view = memoryview(piece)
+            for offset in range(0, len(piece), CHUNK_SIZE):
+                yield bytes(view[offset:offset + CHUNK_SIZE])
+    else:
+        # Same output as nx.write_gml, one line at a time
+        for line in nx.generate_gml(graph):
+            yield (line + "\n").encode("ascii")
+
+
+def _compressed(pieces: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    if encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        compressor = zstandard.ZstdCompressor().compressobj()
+    for piece in pieces:
+        yield compressor.compress(piece)
+    yield compressor.flush()
+
+
+def iter_encoded(
+    graph: nx.DiGraph,
+    storage_format: str = "gml",
+    encoding: str | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    details: tree_snapshot.Details | None = None,
+) -> Iterator[bytes]:
+    """Serialize *graph* lazily, yielding (optionally compressed) chunks.
+
+    *details* are the unparsed person details of a graph read with
+    :func:`read_topology`; only snapshots can store them as they are.
+    """
+    check_encoding(encoding)
+    if details and storage_format != "snapshot":
+        raise ValueError(f"Unloaded person details cannot be written as {storage_format}")
+    pieces = _serialized_pieces(graph, storage_format, details)
+    if encoding is not None:
+        pieces = _compressed(pieces, encoding)
+    return _batched(pieces, chunk_size)
+
+
+class ChunkReader(io.RawIOBase):
+    """Read-only binary stream over an iterator of byte chunks."""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            try:
+                self._pending = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def open_decoded(source: BinaryIO | Iterable[bytes]) -> BinaryIO:
+    """Return a buffered stream of the decompressed bytes of *source*.
+
+    *source* is a binary file object or an iterable of byte chunks.
+    """
+    if not hasattr(source, "read"):
+        source = ChunkReader(source)
+    stream = source if isinstance(source, io.BufferedReader) else io.BufferedReader(source, CHUNK_SIZE)
+    head = stream.peek(len(_ZSTD_MAGIC))
+    if head.startswith(_GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if head.startswith(_ZSTD_MAGIC):
+        _require_zstd()
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream), CHUNK_SIZE)
+    return stream
+
+
+def _open_graph(source: BinaryIO | Iterable[bytes], storage_format: str | None) -> tuple[BinaryIO, str]:
+    stream = open_decoded(source)
+    if storage_format is None:
+        storage_format = "snapshot" if tree_snapshot.is_snapshot(stream.peek(len(tree_snapshot.MAGIC))) else "gml"
+    return stream, storage_format
+
+
+def read_graph(source: BinaryIO | Iterable[bytes], storage_format: str | None = None) -> nx.DiGraph:
+    """Parse a graph from a (possibly compressed) stream or chunk iterator.
+
+    Without *storage_format* the format is detected from the snapshot magic.
+    """
+    stream, storage_format = _open_graph(source, storage_format)
+    if storage_format == "snapshot":
+        return tree_snapshot.read_snapshot(stream)
+    return nx.read_gml(stream)
+
+
+def read_topology(
+    source: BinaryIO | Iterable[bytes], storage_format: str | None = None
+) -> tuple[nx.DiGraph, tree_snapshot.Details | None]:
+    """Like :func:`read_graph`, but leave person details unparsed (see ``tree_snapshot.loads_topology``).
+
+    GML has no separate details, so it is parsed in full, with ``None`` for the details.
+    """
+    stream, storage_format = _open_graph(source, storage_format)
+    if storage_format == "snapshot":
+        return tree_snapshot.read_snapshot_topology(stream)
+    return nx.read_gml(stream), None
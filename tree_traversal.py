@@ -0,0 +1,469 @@
+"""Iterative traversals over family-tree graphs.
+
+Every walk here keeps its frontier in an explicit queue or stack instead of
+the Python call stack, so deep trees and long chains are limited only by
+memory, never by the recursion limit.  Hops are filtered by relationship
+type through a *steps* mapping, which also gives the generation offset of
+each hop::
+
+    {"isChildOf": (-1, 1), "isSpouseOf": (0, 0)}
+
+The first value is used when following an edge forwards (source to target,
+e.g. child to parent) and the second when following it backwards; ``None``
+skips that direction.  Relationship types not in the mapping are ignored.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+from collections import deque
+from itertools import count, islice
+from typing import Any, Callable, Collection, Hashable, Iterable, Iterator, Mapping, NamedTuple
+
+import networkx as nx
+
+
+# Parents are one generation above (-1) and children one below (+1); spouses share a generation
+GENERATION_STEPS: dict[str, tuple[int | None, int | None]] = {
+    "isChildOf": (-1, 1),
+    "isSpouseOf": (0, 0),
+}
+PARENT_STEPS: dict[str, tuple[int | None, int | None]] = {"isChildOf": (1, None)}
+CHILD_STEPS: dict[str, tuple[int | None, int | None]] = {"isChildOf": (None, 1)}
+SPOUSE_STEPS: dict[str, tuple[int | None, int | None]] = {"isSpouseOf": (0, 0)}
+
+Steps = Mapping[str, tuple]
+
+
+def is_active(data: Mapping[str, Any]) -> bool:
+    return data.get("is_active", True) not in (False, 0)
+
+
+def typed_neighbors(
+    graph: nx.DiGraph, node: Hashable, steps: Steps, active_only: bool = False
+) -> Iterator[tuple[Hashable, int]]:
+    """Yield ``(neighbor, offset)`` for every hop from *node* allowed by *steps*.
+
+    Successors come first, then predecessors, each in adjacency order.
+    """
+    for neighbor, data in graph.adj[node].items():
+        step = steps.get(data.get("type"))
+        if step is not None and step[0] is not None and (not active_only or is_active(data)):
+            yield neighbor, step[0]
+    for neighbor, data in graph.pred[node].items():
+        step = steps.get(data.get("type"))
+        if step is not None and step[1] is not None and (not active_only or is_active(data)):
+            yield neighbor, step[1]
+
+
+def neighbors_of(graph: nx.DiGraph, adjacency: Any = None) -> Callable[[Hashable, Steps, bool], Iterable[tuple[Hashable, int]]]:
+    """``typed_neighbors`` bound to *graph*, or to an index of it such as ``tree_indexes.TypedAdjacency``.
+
+    An index answers from per-type adjacency lists instead of filtering every
+    relationship of a person, but only knows ``isChildOf`` and ``isSpouseOf``.
+    """
+    if adjacency is not None:
+        return adjacency.typed_neighbors
+    return lambda node, steps, active_only: typed_neighbors(graph, node, steps, active_only)
+
+
+def undirected_neighbors(
+    graph: nx.DiGraph, node: Hashable, types: Collection[str] | None = None, active_only: bool = False
+) -> Iterator[Hashable]:
+    """Neighbors of *node* whichever way the relationship is stored, each once.
+
+    Reads the successor and predecessor adjacencies the graph keeps anyway, so
+    it needs no undirected copy.  *types* limits the relationship types
+    followed (all by default).
+    """
+    seen = set()
+    for adjacency in (graph.adj[node], graph.pred[node]):
+        for neighbor, data in adjacency.items():
+            if neighbor in seen or (types is not None and data.get("type") not in types):
+                continue
+            if not active_only or is_active(data):
+                seen.add(neighbor)
+                yield neighbor
+
+
+def within_hops(
+    graph: nx.DiGraph,
+    start: Hashable,
+    hops: int | None = None,
+    types: Collection[str] | None = None,
+    active_only: bool = False,
+) -> dict[Hashable, int]:
+    """Everyone within *hops* relationships of *start* either way, with their distance, nearest first.
+
+    The same persons as ``tree_csr.CSRSnapshot.within_hops``, found on the live
+    graph: only the persons returned and their relationships are visited.
+    """
+    distances = {start: 0}
+    frontier = [start]
+    hop = 0
+    while frontier and (hops is None or hop < hops):
+        hop += 1
+        next_frontier = []
+        for node in frontier:
+            for neighbor in undirected_neighbors(graph, node, types, active_only):
+                if neighbor not in distances:
+                    distances[neighbor] = hop
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+    return distances
+
+
+# Kinds of relatives, in the order a node budget takes them: blood relatives, their spouses, then in-laws
+BLOOD, SPOUSE, IN_LAW = 0, 1, 2
+
+
+class Neighborhood(NamedTuple):
+    """Result of :func:`nearest_relatives`."""
+
+    distances: dict   # Each person taken, in the order taken, with the hops of the path it was taken through
+    frontier: set     # Persons taken with relatives within reach that the budget left out
+    truncated: bool   # Whether the node budget left out anyone within reach
+
+
+# States of the search of nearest_relatives: blood relatives reached going up only, or up and then down, and anyone else.
+# Each state reaches relatives at least as close as those of the states after it.
+_ASCENDING, _DESCENDING, _OTHER = 0, 1, 2
+
+
+def _typed_undirected(graph: nx.DiGraph, node: Hashable, active_only: bool) -> Iterator[tuple[Hashable, Any, bool]]:
+    """Neighbors of *node* either way, with the type of each relationship and whether it is stored from *node*."""
+    for adjacency, outgoing in ((graph.adj[node], True), (graph.pred[node], False)):
+        for neighbor, data in adjacency.items():
+            if not active_only or is_active(data):
+                yield neighbor, data.get("type"), outgoing
+
+
+def _relative_kind(state: int, rel_type: Any, outgoing: bool) -> tuple[int, int]:
+    """Kind and search state of a relative reached from one in *state* through a relationship of *rel_type*.
+
+    Blood relatives are those reached by going up to parents and then down
+    to children; going up again after going down, say from a child to its
+    other parent, leaves the blood line.
+    """
+    if state != _OTHER and rel_type == "isChildOf":
+        if not outgoing:
+            return BLOOD, _DESCENDING
+        if state == _ASCENDING:
+            return BLOOD, _ASCENDING
+    elif state != _OTHER and rel_type == "isSpouseOf":
+        return SPOUSE, _OTHER
+    return IN_LAW, _OTHER
+
+
+def nearest_relatives(
+    graph: nx.DiGraph,
+    start: Hashable,
+    hops: int | None = None,
+    max_nodes: int | None = None,
+    active_only: bool = False,
+) -> Neighborhood:
+    """Up to *max_nodes* persons within *hops* relationships of *start* either way, closest kin first.
+
+    Blood relatives, reached from *start* up through parents and then down
+    through children, are taken first, then their spouses, then everyone
+    else, and each kind nearest first.  Persons are taken from a priority
+    queue on (kind, hops), so the search stops as soon as the budget is full
+    and never visits the rest of the tree.  A person is taken as the closest
+    kind of any path within *hops*; one reached again through fewer hops, in
+    a state of the search that is not further along, is searched from
+    again, so the persons within reach are always those of
+    :func:`within_hops`.
+    """
+    distances: dict[Hashable, int] = {}
+    expanded: dict[Hashable, list[float]] = {}  # Fewest hops each person was searched from at, in each state
+    order = count()
+    queue = [(BLOOD, 0, next(order), start, _ASCENDING)]
+    truncated = False
+
+    def searched(node: Hashable, state: int, hop: int) -> bool:
+        """Whether *node* was searched from in *state*, or a closer one, through at most *hop* hops."""
+        return node in expanded and min(expanded[node][:state + 1]) <= hop
+
+    while queue:
+        kind, hop, _, node, state = heapq.heappop(queue)
+        if node not in distances:
+            if max_nodes is not None and len(distances) >= max_nodes:
+                truncated = True
+                break
+            distances[node] = hop
+        if searched(node, state, hop):
+            continue
+        expanded.setdefault(node, [math.inf] * 3)[state] = hop
+        if hops is not None and hop >= hops:
+            continue
+        for neighbor, rel_type, outgoing in _typed_undirected(graph, node, active_only):
+            relative_kind, relative_state = _relative_kind(state, rel_type, outgoing)
+            if not searched(neighbor, relative_state, hop + 1):
+                heapq.heappush(queue, (relative_kind, hop + 1, next(order), neighbor, relative_state))
+    frontier = set()
+    if truncated:
+        for node, searched_hops in expanded.items():
+            if (hops is None or min(searched_hops) < hops) and any(
+                neighbor not in distances for neighbor, _, _ in _typed_undirected(graph, node, active_only)
+            ):
+                frontier.add(node)
+    return Neighborhood(distances, frontier, truncated)
+
+
+def subgraph_view(graph: nx.DiGraph, nodes: Iterable[Hashable], **attrs: Any) -> nx.DiGraph:
+    """Read-only view of the persons *nodes* of *graph* and the relationships among them.
+
+    Nothing is copied: the view filters the live adjacency of *graph*, and
+    its persons and relationships are the attribute dicts of the graph, so
+    whoever changes them must ``copy()`` the view first.  The view gets graph
+    attributes *attrs* of its own instead of sharing those of *graph*.
+    """
+    view = graph.subgraph(nodes)
+    view.graph = dict(attrs)
+    return view
+
+
+def parents(graph: nx.DiGraph, node: Hashable, active_only: bool = False) -> list[Hashable]:
+    return [neighbor for neighbor, _ in typed_neighbors(graph, node, PARENT_STEPS, active_only)]
+
+
+def children(graph: nx.DiGraph, node: Hashable, active_only: bool = False) -> list[Hashable]:
+    return [neighbor for neighbor, _ in typed_neighbors(graph, node, CHILD_STEPS, active_only)]
+
+
+def spouses(graph: nx.DiGraph, node: Hashable, active_only: bool = False) -> list[Hashable]:
+    """Spouses of *node* whichever way the relationship is stored, without duplicates."""
+    return list(dict.fromkeys(neighbor for neighbor, _ in typed_neighbors(graph, node, SPOUSE_STEPS, active_only)))
+
+
+def generation_offsets(
+    graph: nx.DiGraph,
+    start: Hashable,
+    steps: Steps = GENERATION_STEPS,
+    active_only: bool = False,
+    max_hops: int | None = None,
+    adjacency: Any = None,
+) -> dict[Hashable, int]:
+    """Breadth-first walk from *start*, mapping each reached person to its summed offset.
+
+    With the default steps this is the generation of every person connected to
+    *start* through parent, child and spouse relationships, relative to *start*.
+    An *adjacency* index of the graph (see :func:`neighbors_of`) is read
+    instead of the graph when given.
+    """
+    neighbors = neighbors_of(graph, adjacency)
+    offsets = {start: 0}
+    queue = deque([(start, 0)])
+    while queue:
+        node, hops = queue.popleft()
+        if max_hops is not None and hops >= max_hops:
+            continue
+        offset = offsets[node]
+        for neighbor, step in neighbors(node, steps, active_only):
+            if neighbor not in offsets:
+                offsets[neighbor] = offset + step
+                queue.append((neighbor, hops + 1))
+    return offsets
+
+
+def smaller_side(
+    graph: nx.DiGraph, a: Hashable, b: Hashable, steps: Steps = GENERATION_STEPS, adjacency: Any = None
+) -> tuple[int, set[Hashable]] | None:
+    """Split *a* and *b* apart by ignoring the hops between them and return the smaller part.
+
+    Returns ``(0, component of a)`` or ``(1, component of b)``, whichever is
+    smaller, or ``None`` if *a* and *b* are still connected.  Both sides are
+    explored in lockstep, so the cost is bounded by the smaller side.
+    """
+    neighbors = neighbors_of(graph, adjacency)
+    seen = ({a}, {b})
+    queues = (deque([a]), deque([b]))
+    while True:
+        for side in (0, 1):
+            if not queues[side]:
+                return side, seen[side]
+            node = queues[side].popleft()
+            for neighbor, _ in neighbors(node, steps, False):
+                if {node, neighbor} == {a, b}:
+                    continue
+                if neighbor in seen[1 - side]:
+                    return None
+                if neighbor not in seen[side]:
+                    seen[side].add(neighbor)
+                    queues[side].append(neighbor)
+
+
+def preorder(start: Any, expand: Callable[[Any], Iterable[Any]]) -> Iterator[Any]:
+    """Depth-first pre-order walk from *start* with an explicit stack of iterators.
+
+    ``expand(item)`` returns the items to descend into.  It is only called once
+    the caller has processed *item*, and the returned iterable is consumed
+    lazily, one item per descent.  This is the order of the equivalent
+    recursive walk, including any conditions that depend on what earlier
+    subtrees have done.  *expand* is responsible for not returning items that
+    were already visited.
+    """
+    yield start
+    stack = [iter(expand(start))]
+    while stack:
+        for item in stack[-1]:
+            yield item
+            stack.append(iter(expand(item)))
+            break
+        else:
+            stack.pop()
+
+
+def lineage_depths(graph: nx.DiGraph, active_only: bool = False) -> tuple[dict[Hashable, int], dict[Hashable, int]]:
+    """Generations above and below every person, in one topological pass over ``isChildOf``.
+
+    Returns ``(ancestor_depth, descendant_depth)``: the length in generations
+    of each person's longest line of ancestors and of descendants (0 when
+    there are none).  Each person and relationship is visited a constant
+    number of times, however much the pedigree collapses.  Persons on a cycle
+    of ``isChildOf`` relationships, which validation normally prevents, are
+    placed after the acyclic part and only count the parents and children
+    already computed.
+    """
+    parent_lists: dict[Hashable, list[Hashable]] = {node: [] for node in graph}
+    child_lists: dict[Hashable, list[Hashable]] = {node: [] for node in graph}
+    for child, parent, data in graph.edges(data=True):
+        if data.get("type") == "isChildOf" and (not active_only or is_active(data)):
+            parent_lists[child].append(parent)
+            child_lists[parent].append(child)
+
+    # Kahn's algorithm: a person is ordered once all their parents are
+    pending = {node: len(node_parents) for node, node_parents in parent_lists.items()}
+    order = [node for node, count in pending.items() if count == 0]
+    for node in order:
+        for child in child_lists[node]:
+            pending[child] -= 1
+            if pending[child] == 0:
+                order.append(child)
+    if len(order) < len(parent_lists):
+        ordered = set(order)
+        order.extend(node for node in parent_lists if node not in ordered)
+
+    ancestor_depth: dict[Hashable, int] = {}
+    for node in order:
+        ancestor_depth[node] = 1 + max(
+            (ancestor_depth[parent] for parent in parent_lists[node] if parent in ancestor_depth), default=-1
+        )
+    descendant_depth: dict[Hashable, int] = {}
+    for node in reversed(order):
+        descendant_depth[node] = 1 + max(
+            (descendant_depth[child] for child in child_lists[node] if child in descendant_depth), default=-1
+        )
+    return ancestor_depth, descendant_depth
+
+
+class PathSearch(NamedTuple):
+    """Result of :func:`shortest_paths_between`."""
+
+    nodes: set            # Persons on the shortest paths found, empty if none was found
+    distance: int | None  # Length of the shortest paths in relationships
+    paths: int            # Number of shortest paths whose persons are in *nodes*
+    truncated: bool       # Whether the node budget or the path cap cut the search short
+
+
+def shortest_paths_between(
+    graph: nx.DiGraph,
+    a: Hashable,
+    b: Hashable,
+    types: Collection[str] | None = None,
+    active_only: bool = False,
+    max_paths: int | None = None,
+    max_nodes: int | None = None,
+) -> PathSearch:
+    """Persons on the shortest paths between *a* and *b*, ignoring the direction of relationships.
+
+    A breadth-first search runs from both ends, always growing the smaller
+    frontier by a whole generation of hops, and stops as soon as no shorter
+    path can remain.  The persons on the shortest paths are then collected by
+    walking back from where the searches met, so they are never enumerated
+    path by path unless *max_paths* asks for fewer paths than there are.
+    *max_nodes* caps the persons visited by the search, checked as each one
+    is reached, so a wide generation never overshoots it; when it runs out
+    the paths met so far (possibly not all of the shortest) are returned as
+    truncated.
+    """
+    if a == b:
+        return PathSearch({a}, 0, 1, False)
+    depths = ({a: 0}, {b: 0})
+    frontiers = [[a], [b]]
+    levels = [0, 0]
+    best = None
+    truncated = False
+    visited = 2
+    while frontiers[0] and frontiers[1] and (best is None or levels[0] + levels[1] < best):
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        levels[side] += 1
+        next_frontier = []
+        for node in frontiers[side]:
+            for neighbor in undirected_neighbors(graph, node, types, active_only):
+                if neighbor in depths[side]:
+                    continue
+                if max_nodes is not None and visited >= max_nodes:
+                    truncated = True
+                    break
+                depths[side][neighbor] = levels[side]
+                next_frontier.append(neighbor)
+                visited += 1
+                if neighbor in depths[1 - side]:
+                    length = levels[side] + depths[1 - side][neighbor]
+                    best = length if best is None else min(best, length)
+            if truncated:
+                break
+        frontiers[side] = next_frontier
+        if truncated:
+            break
+    if best is None:
+        return PathSearch(set(), None, 0, truncated)
+
+    # Every shortest path crosses the deepest layer of side a where the searches met with both depths known
+    meetings = [node for node, depth in depths[0].items() if depths[1].get(node) == best - depth]
+    crossing = max(depths[0][node] for node in meetings)
+    meeting = [node for node in meetings if depths[0][node] == crossing]
+
+    def back(side: int, node: Hashable) -> list[Hashable]:
+        """Neighbors one hop closer to the start of *side* along a shortest path."""
+        depth = depths[side][node]
+        return [n for n in undirected_neighbors(graph, node, types, active_only) if depths[side].get(n) == depth - 1]
+
+    counts = ({}, {})
+    for side in (0, 1):
+        # Number of shortest paths from the start of the side to each person on them, walking back from the meeting
+        order = []
+        stack = list(meeting)
+        seen = set(meeting)
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            for previous in back(side, node):
+                if previous not in seen:
+                    seen.add(previous)
+                    stack.append(previous)
+        order.sort(key=lambda node: depths[side][node])
+        for node in order:
+            counts[side][node] = sum(counts[side][previous] for previous in back(side, node)) or 1
+    paths = sum(counts[0][node] * counts[1][node] for node in meeting)
+    if max_paths is None or paths <= max_paths:
+        return PathSearch(set(counts[0]) | set(counts[1]), best, paths, truncated)
+
+    def halves(side: int, node: Hashable) -> Iterator[list[Hashable]]:
+        """Shortest paths from *node* back to the start of *side*, one at a time."""
+        for path in preorder([node], lambda path: ([*path, n] for n in back(side, path[-1]))):
+            if depths[side][path[-1]] == 0:
+                yield path
+
+    def enumerate_paths() -> Iterator[list[Hashable]]:
+        for node in meeting:
+            for up in halves(0, node):
+                for down in halves(1, node):
+                    yield up[::-1] + down[1:]
+
+    nodes = set()
+    for path in islice(enumerate_paths(), max_paths):
+        nodes.update(path)
+    return PathSearch(nodes, best, max_paths, True)
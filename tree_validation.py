@@ -6,9 +6,11 @@ import calendar
 import re
 from dataclasses import dataclass
 from datetime import date
-from typing import Any, Iterable, Literal
+from itertools import chain
+from typing import TYPE_CHECKING, Any, Iterable, Literal
 
-import networkx as nx
+if TYPE_CHECKING:
+    from tree_indexes import AncestryIndex, TypedAdjacency
 
 
 Severity = Literal["error", "warning"]
@@ -211,6 +213,32 @@ def _event_lifetime_issues(
     return issues
 
 
+def _active_parents(graph, person: str) -> list[str]:
+    return [
+        parent
+        for _, parent, data in graph.out_edges(person, data=True)
+        if data.get("type") == "isChildOf" and data.get("is_active", True)
+    ]
+
+
+def _is_ancestor(graph, ancestor: str, person: str, adjacency: TypedAdjacency | None = None) -> bool:
+    """Whether *ancestor* is reached from *person* through active isChildOf relationships.
+
+    The parents are read from *adjacency*, an index of *graph*, when given.
+    """
+    seen = {person}
+    stack = [person]
+    while stack:
+        node = stack.pop()
+        for parent in adjacency.parents(node, active_only=True) if adjacency is not None else _active_parents(graph, node):
+            if parent == ancestor:
+                return True
+            if parent not in seen:
+                seen.add(parent)
+                stack.append(parent)
+    return False
+
+
 def validate_relationship(
     graph,
     source: str,
@@ -221,6 +249,9 @@ def validate_relationship(
     end_date: Any = None,
     overrides: dict[str, dict[str, Any]] | None = None,
     check_structure: bool = True,
+    ancestry: AncestryIndex | None = None,
+    adjacency: TypedAdjacency | None = None,
+    symmetric: bool = False,
 ) -> list[ValidationIssue]:
     issues: list[ValidationIssue] = []
     person_ids = (source, target)
@@ -263,25 +294,36 @@ def validate_relationship(
                     ),
                 )
             )
-        if relationship_type == "isChildOf" and source != target:
-            ancestry = nx.DiGraph()
-            ancestry.add_nodes_from(graph.nodes)
-            ancestry.add_edges_from(
-                (child, parent)
-                for child, parent, data in graph.edges(data=True)
-                if data.get("type") == "isChildOf" and data.get("is_active", True)
+        elif (
+            symmetric
+            and graph.has_edge(target, source)
+            and graph[target][source].get("type") == relationship_type
+        ):
+            # Symmetric relationships are stored once, the reverse is the same relationship
+            issues.append(
+                ValidationIssue(
+                    code="duplicate_relationship",
+                    severity="error",
+                    person_ids=person_ids,
+                    message="This relationship already exists.",
+                )
             )
-            if source in ancestry and target in ancestry:
-                creates_cycle = nx.has_path(ancestry, target, source)
-                if creates_cycle:
-                    issues.append(
-                        ValidationIssue(
-                            code="parent_child_cycle",
-                            severity="error",
-                            person_ids=person_ids,
-                            message="This parent/child relationship would create an ancestry cycle.",
-                        )
+        if relationship_type == "isChildOf" and source != target:
+            # The tree's maintained ancestry index of *graph* usually answers without any walk;
+            # otherwise only the ancestors of the new parent are searched, from its adjacency index if given
+            if ancestry is not None:
+                creates_cycle = ancestry.is_ancestor(source, target)
+            else:
+                creates_cycle = _is_ancestor(graph, source, target, adjacency)
+            if creates_cycle:
+                issues.append(
+                    ValidationIssue(
+                        code="parent_child_cycle",
+                        severity="error",
+                        person_ids=person_ids,
+                        message="This parent/child relationship would create an ancestry cycle.",
                     )
+                )
 
     start, start_issues = _parse_date(
         start_date,
@@ -378,23 +420,20 @@ def validate_person_relationships(
     graph,
     person_id: str,
     prospective_person: dict[str, Any],
+    adjacency: TypedAdjacency | None = None,
 ) -> list[ValidationIssue]:
+    """Check *prospective_person*, the new attributes of *person_id*, against each of their relationships.
+
+    The relationships are read from *adjacency*, an index of *graph*, when
+    given; it holds the parent, child and spouse relationships.
+    """
     overrides = {person_id: prospective_person}
     issues = validate_person_dates(prospective_person, person_id)
-    for source, target, data in graph.in_edges(person_id, data=True):
-        issues.extend(
-            validate_relationship(
-                graph,
-                source,
-                target,
-                data.get("type", ""),
-                start_date=data.get("start_date"),
-                end_date=data.get("end_date"),
-                overrides=overrides,
-                check_structure=False,
-            )
-        )
-    for source, target, data in graph.out_edges(person_id, data=True):
+    if adjacency is not None:
+        relationships = adjacency.relationships(person_id)
+    else:
+        relationships = chain(graph.in_edges(person_id, data=True), graph.out_edges(person_id, data=True))
+    for source, target, data in relationships:
         issues.extend(
             validate_relationship(
                 graph,